@@ -0,0 +1,197 @@
+"""
+JWT authentication with cached user resolution.
+
+``JWTAuthentication`` loads the ``User`` row on every request. The tokens
+already prove who the caller is; what can change underneath them is whether
+the account may still act (``is_active``), its password and its staff
+flags. ``CachedJWTAuthentication`` keeps resolved users in a bounded
+in-process TTL cache and still checks ``is_active`` and the token's
+revocation claim on every hit.
+
+Each cached user is tagged with the user's generation, a token kept in the
+shared cache (``CACHE_ALIAS``) and replaced by the signal handlers in
+``accounts.signals`` whenever a user is saved or deleted. A hit is only
+served while its generation is current, so a change made through any worker
+reaches all of them. A local-memory cache cannot share generations, so with
+one the user cache stays off unless ``ALLOW_PROCESS_LOCAL`` says a single
+process serves every request. ``TTL`` bounds how long writes that bypass
+signals, such as ``QuerySet.update()``, can serve a stale user.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from postflow.caches import is_process_local
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Seconds a resolved user is trusted without reading the database.
+    'TTL': 60,
+    'MAX_ENTRIES': 10000,
+    # Holds the user generations; must be shared by every worker process.
+    'CACHE_ALIAS': 'default',
+    'ALLOW_PROCESS_LOCAL': False,
+}
+
+
+def user_cache_setting(name):
+    return getattr(settings, 'ACCOUNTS_USER_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def user_cache_enabled():
+    return user_cache_setting('ENABLED') and (
+        user_cache_setting('ALLOW_PROCESS_LOCAL') or not is_process_local(user_cache_setting('CACHE_ALIAS'))
+    )
+
+
+def generation_key(user_id):
+    return f'accounts:user-generation:{user_id}'
+
+
+def user_generation(user_id):
+    """
+    The user's current generation, started if the shared cache has none.
+    """
+    cache = caches[user_cache_setting('CACHE_ALIAS')]
+    key = generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+async def auser_generation(user_id):
+    cache = caches[user_cache_setting('CACHE_ALIAS')]
+    key = generation_key(user_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, uuid.uuid4().hex, None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def new_user_generation(user_id):
+    """
+    Invalidate the user's cached copies in every process.
+    """
+    caches[user_cache_setting('CACHE_ALIAS')].set(generation_key(user_id), uuid.uuid4().hex, None)
+
+
+class UserCache:
+    """
+    Thread-safe LRU of users by id with a per-entry expiry and generation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id, generation):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires, cached_generation = entry
+            if expires < time.monotonic() or cached_generation != generation:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Each request gets its own copy, so views that modify request.user
+        # never touch the cached instance.
+        return copy.copy(user)
+
+    def set(self, user, generation):
+        expires = time.monotonic() + user_cache_setting('TTL')
+        with self._lock:
+            self._entries[user.pk] = (copy.copy(user), expires, generation)
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > user_cache_setting('MAX_ENTRIES'):
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that reads users from ``user_cache``, checking
+    cached users the same way as loaded ones.
+    """
+
+    def check_user(self, user, validated_token):
+        # As JWTAuthentication.get_user does once the user is loaded.
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if jwt_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            jwt_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code='password_changed'
+            )
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is None or not user_cache_enabled():
+            return super().get_user(validated_token)
+        # Read before the user: a change saved meanwhile outdates the entry.
+        generation = user_generation(user_id)
+        user = user_cache.get(user_id, generation)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user, generation)
+        else:
+            self.check_user(user, validated_token)
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        ``authenticate`` for async views, loading uncached users with the
+        async ORM.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        enabled = user_cache_enabled()
+        generation = await auser_generation(user_id) if enabled else None
+        user = user_cache.get(user_id, generation) if enabled else None
+        if user is None:
+            try:
+                user = await self.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            self.check_user(user, validated_token)
+            if enabled:
+                user_cache.set(user, generation)
+        else:
+            self.check_user(user, validated_token)
+        return user
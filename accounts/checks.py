@@ -0,0 +1,23 @@
+from django.core.checks import Tags, Warning, register
+
+from postflow.caches import is_process_local
+
+from .authentication import user_cache_setting
+
+
+@register(Tags.caches)
+def check_user_cache(app_configs, **kwargs):
+    if not user_cache_setting('ENABLED') or user_cache_setting('ALLOW_PROCESS_LOCAL'):
+        return []
+    alias = user_cache_setting('CACHE_ALIAS')
+    if not is_process_local(alias):
+        return []
+    return [Warning(
+        f"The JWT user cache is off: cache '{alias}' is local to each process, "
+        f'so a user changed through one worker would stay cached in the others.',
+        hint=(
+            'Set CACHE_URL to a Redis or Memcached server, or set '
+            "ACCOUNTS_USER_CACHE['ALLOW_PROCESS_LOCAL'] when a single process serves every request."
+        ),
+        id='accounts.W001',
+    )]
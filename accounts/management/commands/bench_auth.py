@@ -0,0 +1,101 @@
+import base64
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.authentication import CachedJWTAuthentication, new_user_generation, user_cache, user_generation
+from accounts.views import UserProfileView
+
+PASSWORD = 'bench-auth-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare authenticated requests per second on the profile endpoint with '
+        'uncached JWT, cached JWT and Basic authentication, on a temporary user '
+        '(rolled back afterwards), and check that cached users are evicted, '
+        'also by changes made in other processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--basic-requests', type=int, default=20,
+            help='Basic authentication hashes the password per request; keep this small'
+        )
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory(HTTP_HOST='localhost')
+        # One process serves every request here, so a local cache is fine.
+        with override_settings(ACCOUNTS_USER_CACHE={
+            **getattr(settings, 'ACCOUNTS_USER_CACHE', {}), 'ENABLED': True, 'ALLOW_PROCESS_LOCAL': True,
+        }), transaction.atomic():
+            user = User.objects.create_user(username='bench-auth-user', password=PASSWORD)
+            bearer = f'Bearer {AccessToken.for_user(user)}'
+            basic = 'Basic ' + base64.b64encode(f'{user.username}:{PASSWORD}'.encode()).decode()
+            user_cache.clear()
+            for label, authentication, header, count in (
+                ('JWT', JWTAuthentication, bearer, options['requests']),
+                ('cached JWT', CachedJWTAuthentication, bearer, options['requests']),
+                ('Basic', BasicAuthentication, basic, options['basic_requests']),
+            ):
+                view = UserProfileView.as_view(authentication_classes=[authentication])
+                self.measure(label, view, factory.get('/', HTTP_AUTHORIZATION=header), count)
+            self.check_eviction(user, factory, bearer)
+            self.check_other_processes(user, factory, bearer)
+            transaction.set_rollback(True)
+        user_cache.clear()
+
+    def measure(self, label, view, request, count):
+        view(request)
+        started = time.perf_counter()
+        for _ in range(count):
+            response = view(request)
+            if response.status_code != 200:
+                raise CommandError(f'{label}: unexpected status {response.status_code}')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:<12} {count / elapsed:10.0f} requests/s')
+
+    def check_eviction(self, user, factory, bearer):
+        view = UserProfileView.as_view(authentication_classes=[CachedJWTAuthentication])
+
+        def get():
+            return view(factory.get('/', HTTP_AUTHORIZATION=bearer))
+
+        for change in (
+            lambda: setattr(user, 'is_staff', True),
+            lambda: user.set_password('bench-auth-changed'),
+        ):
+            get()
+            change()
+            user.save()
+            if user_cache.get(user.pk, user_generation(user.pk)) is not None:
+                raise CommandError('Cached user survived a staff or password change')
+        get()
+        user.is_active = False
+        user.save()
+        if get().status_code != 401:
+            raise CommandError('Deactivated user still authenticated from the cache')
+        self.stdout.write(self.style.SUCCESS(
+            'Cached users evicted on staff, password and active changes'
+        ))
+
+    def check_other_processes(self, user, factory, bearer):
+        view = UserProfileView.as_view(authentication_classes=[CachedJWTAuthentication])
+        user.is_active = True
+        user.save()
+        view(factory.get('/', HTTP_AUTHORIZATION=bearer))
+        # Another worker deactivates the user: this process only sees the
+        # row and the new generation.
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        new_user_generation(user.pk)
+        if view(factory.get('/', HTTP_AUTHORIZATION=bearer)).status_code != 401:
+            raise CommandError("Cached user survived another process's deactivation")
+        self.stdout.write(self.style.SUCCESS('Cached users evicted by changes made in other processes'))
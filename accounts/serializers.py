@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth.password_validation import validate_password
@@ -51,7 +52,11 @@ class UserSerializer(serializers.ModelSerializer):
         return f"{obj.first_name} {obj.last_name}"
     
     def get_post_count(self, obj):
-        return obj.blog_posts.count()
+        # Maintained counter; see blog.models.AuthorStats.
+        try:
+            return obj.author_stats.post_count
+        except ObjectDoesNotExist:
+            return 0
 
 
 class UserBriefSerializer(serializers.ModelSerializer):
@@ -60,6 +65,8 @@ class UserBriefSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'full_name')
+        # Columns read by get_full_name; see blog.projection.
+        projection_fields = ('first_name', 'last_name')
     
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}"
\ No newline at end of file
@@ -0,0 +1,15 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import new_user_generation, user_cache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    # Any saved change may matter to authentication or permissions:
+    # is_active, password, is_staff and is_superuser among others. The new
+    # generation reaches the copies other processes cached.
+    user_cache.evict(instance.pk)
+    new_user_generation(instance.pk)
@@ -1,3 +1,59 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import new_user_generation, user_cache
+
+PROFILE_URL = '/api/auth/profile/'
+
+
+@override_settings(ACCOUNTS_USER_CACHE={'ENABLED': True, 'ALLOW_PROCESS_LOCAL': True})
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user('alice', password='secret-password')
+        self.client = APIClient()
+
+    def profile_status(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.client.get(PROFILE_URL).status_code
+
+    def test_cached_users_are_read_without_queries(self):
+        token = AccessToken.for_user(self.user)
+        self.profile_status(token)
+        # Only the profile's own author stats.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.profile_status(token), 200)
+
+    def test_changes_in_other_processes_reach_cached_users(self):
+        token = AccessToken.for_user(self.user)
+        self.assertEqual(self.profile_status(token), 200)
+        # Another worker's save: the row changes and so does the generation,
+        # but this process's copy is not evicted.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        new_user_generation(self.user.pk)
+        self.assertEqual(self.profile_status(token), 401)
+
+    def test_cached_users_are_checked_against_revoked_tokens(self):
+        # simplejwt rebinds its settings on SIMPLE_JWT changes, which the
+        # modules that imported them never see.
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            old_token = AccessToken.for_user(self.user)
+            self.user.set_password('changed-password')
+            self.user.save()
+            self.assertEqual(self.profile_status(AccessToken.for_user(self.user)), 200)
+            # The user is cached now, by a token issued after the change.
+            self.assertEqual(self.profile_status(old_token), 401)
+
+    def test_process_local_cache_is_not_used_for_users(self):
+        token = AccessToken.for_user(self.user)
+        with override_settings(ACCOUNTS_USER_CACHE={'ENABLED': True}):
+            self.profile_status(token)
+            with self.assertNumQueries(2):
+                self.assertEqual(self.profile_status(token), 200)
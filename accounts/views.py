@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.models import User
+from postflow.instrumentation import InstrumentedViewMixin
 from .serializers import RegisterSerializer, UserSerializer
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -26,10 +27,10 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         }
         return data
 
-class CustomTokenObtainPairView(TokenObtainPairView):
+class CustomTokenObtainPairView(InstrumentedViewMixin, TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
-class RegisterView(generics.CreateAPIView):
+class RegisterView(InstrumentedViewMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = [permissions.AllowAny]
     serializer_class = RegisterSerializer
@@ -48,7 +49,7 @@ class RegisterView(generics.CreateAPIView):
             headers=headers
         )
 
-class UserProfileView(generics.RetrieveUpdateAPIView):
+class UserProfileView(InstrumentedViewMixin, generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -1,25 +1,23 @@
 from django.contrib import admin
-from .models import BlogPost, Category, Tag
+from .models import AuthorStats, BlogPost, Category, Tag
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'post_count', 'created_at')
+    list_display = ('name', 'post_count', 'published_post_count', 'total_views', 'created_at')
     search_fields = ('name', 'description')
     list_filter = ('created_at',)
-    
-    def post_count(self, obj):
-        return obj.blog_posts.count()
-    post_count.short_description = 'Number of Posts'
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ('name', 'post_count', 'created_at')
+    list_display = ('name', 'post_count', 'published_post_count', 'total_views', 'created_at')
     search_fields = ('name',)
     list_filter = ('created_at',)
-    
-    def post_count(self, obj):
-        return obj.blog_posts.count()
-    post_count.short_description = 'Number of Posts'
+
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'post_count', 'published_post_count', 'total_views')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
 
 @admin.register(BlogPost)
 class BlogPostAdmin(admin.ModelAdmin):
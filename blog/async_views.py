@@ -0,0 +1,249 @@
+"""
+Async versions of the hot read endpoints, for ASGI deployments.
+
+DRF viewsets are synchronous, so under an ASGI server every request holds a
+worker thread for its whole duration. The viewsets here subclass the regular
+ones and add ``a<action>`` coroutines for post list and retrieve,
+``recent``, ``featured``, ``trending``, the category/tag ``posts`` actions
+and the change feed. Only the async feed serves ``?wait=`` long polls, which
+hold no thread while waiting. These reuse the sync viewsets' querysets,
+filters, permissions, pagination, caching and validators, and run their
+queries with the async ORM (``aiterator()``, ``aget()``, ``acount()``).
+
+``async_urls`` swaps the callbacks of the router's URL patterns, so URLs,
+names and format suffixes stay the same. A request is served asynchronously
+when it is a GET, carries no credentials or a bearer token, and asks for
+JSON. Anything else goes to the original sync view: writes, HEAD and OPTIONS,
+session or Basic authentication, the browsable API, and everything when
+``BLOG_FAST_LIST_SERIALIZATION`` is off. The ``bench_concurrency`` command
+compares both deployments under load and can check that they answer alike.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.urls import URLPattern
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from postflow.instrumentation import span
+
+from .cache import cache_response
+from .changes import afeed_page, changes_setting
+from .conditional import conditional_response
+from .filters import parse_tag_names, tag_ids_by_name
+from .models import BlogPost
+from .rows import apost_list_data, by_rank, fast_list_enabled, list_values
+from .trending import trending_post_ids
+from .views import BlogPostViewSet, CategoryViewSet, ChangeViewSet, TagViewSet
+
+
+class AsyncReadMixin:
+    """
+    Dispatch GET requests to ``a<action>`` coroutines, falling back to the
+    sync view for everything the async path does not cover.
+    """
+
+    @classmethod
+    def as_async_view(cls, sync_view):
+        actions, initkwargs = sync_view.actions, sync_view.initkwargs
+
+        async def view(request, *args, **kwargs):
+            if cls.serves_async(request, actions, initkwargs):
+                # As the view built by ViewSetMixin.as_view.
+                self = cls(**initkwargs)
+                if 'get' in actions and 'head' not in actions:
+                    actions['head'] = actions['get']
+                self.action_map = actions
+                for method, action in actions.items():
+                    setattr(self, method, getattr(self, action))
+                self.request, self.args, self.kwargs = request, args, kwargs
+                response = await self.adispatch(request, *args, **kwargs)
+                if response is not None:
+                    return response
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+        view.cls, view.initkwargs, view.actions = cls, initkwargs, actions
+        # django.views.decorators.csrf.csrf_exempt only wraps sync views in 4.2.
+        view.csrf_exempt = True
+        return view
+
+    @classmethod
+    def serves_async(cls, request, actions, initkwargs):
+        if request.method != 'GET' or not hasattr(cls, f"a{actions.get('get')}"):
+            return False
+        if not fast_list_enabled() or settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return False
+        authentication_classes = initkwargs.get('authentication_classes', cls.authentication_classes)
+        if not authentication_classes or not hasattr(authentication_classes[0], 'aauthenticate'):
+            return False
+        header = request.META.get('HTTP_AUTHORIZATION')
+        return not header or header.split(' ', 1)[0] in jwt_settings.AUTH_HEADER_TYPES
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        ``APIView.dispatch`` with async authentication and handler; returns
+        ``None`` if the negotiated renderer is not JSON.
+        """
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.format_kwarg = self.get_format_suffix(**kwargs)
+            neg = self.perform_content_negotiation(request)
+            request.accepted_renderer, request.accepted_media_type = neg
+            if not isinstance(request.accepted_renderer, JSONRenderer):
+                # The browsable API renders forms synchronously.
+                return None
+            version, scheme = self.determine_version(request, *args, **kwargs)
+            request.version, request.versioning_scheme = version, scheme
+
+            with span('auth'):
+                await self.aperform_authentication(request)
+            self.check_permissions(request)
+            self.check_throttles(request)
+
+            handler = getattr(self, f'a{self.action}')
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aperform_authentication(self, request):
+        # As Request._authenticate. serves_async only lets through bearer
+        # tokens, which the async authenticator handles, and requests without
+        # credentials, for which the others return None without any I/O.
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth = await authenticator.aauthenticate(request)
+                else:
+                    user_auth = authenticator.authenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+        request._not_authenticated()
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apost_list_response(self, posts, paginator=None):
+        paginator = paginator or self.post_pagination_class()
+        page = await paginator.apaginate_queryset(
+            list_values(posts), self.request, view=self, count_queryset=posts
+        )
+        return paginator.get_paginated_response(await apost_list_data(page))
+
+
+class AsyncCategoryViewSet(AsyncReadMixin, CategoryViewSet):
+    @conditional_response('category:{pk}')
+    @cache_response('category:{pk}')
+    async def aposts(self, request, pk=None):
+        category = await self.aget_object()
+        return await self.apost_list_response(category.blog_posts.published())
+
+
+class AsyncTagViewSet(AsyncReadMixin, TagViewSet):
+    @conditional_response('tag:{pk}')
+    @cache_response('tag:{pk}')
+    async def aposts(self, request, pk=None):
+        tag = await self.aget_object()
+        return await self.apost_list_response(tag.blog_posts.published())
+
+
+class AsyncBlogPostViewSet(AsyncReadMixin, BlogPostViewSet):
+    @conditional_response('posts')
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        tag_names = parse_tag_names(request.query_params.get('tags', ''))
+        if tag_names:
+            # filter_queryset runs synchronously; see BlogPostFilter.filter_tags.
+            request.resolved_tags = await tag_ids_by_name.aresolve(tag_names, queryset.db)
+        posts = self.filter_queryset(queryset)
+        return await self.apost_list_response(posts, paginator=self.paginator)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return self.retrieve_response(request, await self.aget_object())
+
+    @conditional_response('posts:featured')
+    @cache_response('posts:featured')
+    async def afeatured(self, request):
+        posts = BlogPost.objects.published().filter(
+            is_featured=True
+        ).order_by('-published_date')
+        return await self.apost_list_response(posts)
+
+    @conditional_response('posts:published')
+    @cache_response('posts:published')
+    async def arecent(self, request):
+        posts = BlogPost.objects.published().order_by('-published_date')
+        rows = [row async for row in list_values(posts)[:10].aiterator()]
+        return Response(await apost_list_data(rows))
+
+    @conditional_response('posts:trending')
+    @cache_response('posts:trending')
+    async def atrending(self, request):
+        post_ids = [pk async for pk in trending_post_ids(*self.trending_params(request))]
+        posts = BlogPost.objects.published().filter(pk__in=post_ids).order_by()
+        rows = [row async for row in list_values(posts).aiterator()]
+        return Response(await apost_list_data(by_rank(rows, post_ids)))
+
+
+class AsyncChangeViewSet(AsyncReadMixin, ChangeViewSet):
+    long_polling = True
+
+    async def alist(self, request):
+        cursor, limit, wait = self.feed_params(request)
+        deadline = time.monotonic() + wait
+        while True:
+            page = await afeed_page(cursor, limit, self.feed_posts())
+            remaining = deadline - time.monotonic()
+            if page['changes'] or remaining <= 0:
+                return Response(page)
+            await asyncio.sleep(min(remaining, changes_setting('POLL_INTERVAL')))
+
+
+ASYNC_VIEWSETS = {
+    CategoryViewSet: AsyncCategoryViewSet,
+    TagViewSet: AsyncTagViewSet,
+    BlogPostViewSet: AsyncBlogPostViewSet,
+    ChangeViewSet: AsyncChangeViewSet,
+}
+
+
+def async_urls(patterns):
+    """
+    ``patterns`` from a router, with async callbacks where an async viewset
+    serves the pattern's GET action.
+    """
+    urls = []
+    for pattern in patterns:
+        callback = pattern.callback
+        async_viewset = ASYNC_VIEWSETS.get(getattr(callback, 'cls', None))
+        action = getattr(callback, 'actions', {}).get('get')
+        if async_viewset is not None and hasattr(async_viewset, f'a{action}'):
+            pattern = URLPattern(
+                pattern.pattern, async_viewset.as_async_view(callback),
+                pattern.default_args, pattern.name,
+            )
+        urls.append(pattern)
+    return urls
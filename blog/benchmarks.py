@@ -0,0 +1,45 @@
+"""
+Small timing helpers shared by the ``bench_*`` management commands.
+"""
+import statistics
+import time
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Return latency statistics in milliseconds for a list of durations in seconds.
+    """
+    millis = [sample * 1000 for sample in samples]
+    return {
+        'runs': len(millis),
+        'mean_ms': statistics.fmean(millis) if millis else 0.0,
+        'p50_ms': percentile(millis, 50),
+        'p95_ms': percentile(millis, 95),
+        'p99_ms': percentile(millis, 99),
+    }
+
+
+def time_calls(func, repeat=20, warmup=2):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def format_row(label, stats):
+    return (
+        f"{label:<40} mean {stats['mean_ms']:9.2f} ms  p50 {stats['p50_ms']:9.2f} ms  "
+        f"p95 {stats['p95_ms']:9.2f} ms  p99 {stats['p99_ms']:9.2f} ms"
+    )
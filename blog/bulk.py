@@ -0,0 +1,225 @@
+"""
+Batched post writes for the ``bulk`` endpoint and the ``import_posts`` command.
+
+Every item is validated by ``BlogPostDetailSerializer`` on its own, so one bad
+item never fails the batch, but the categories and tags referenced by the
+whole batch are resolved up front with one query per model. Valid new posts
+are inserted with a single ``bulk_create`` and their tags with a single
+insert into the through table; updates use ``bulk_update``. The posts to
+update are locked and read inside the transaction, as single-post updates
+are, so no concurrent write falls between the read and ``bulk_update`` and
+an item's ``if_match`` is checked against the stored post. The bulk paths
+skip model signals, so the search index, the ``PostStats`` counters, the
+trending scores, the related-post lists, the rendered HTML, the change feed
+and the response cache are brought up to date here, once per batch.
+"""
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .cache import invalidate_tags
+from .changes import record_post_changes
+from .conditional import lock_row
+from .counters import PostState, apply_post_changes
+from .models import BlogPost, Category, Tag
+from .related import queue_related_updates
+from .rendering import queue_html_renders
+from .search import get_search_backend
+from .serializers import BlogPostDetailSerializer
+from .trending import sync_trending_scores
+
+# Upper bound on the items accepted by one bulk request.
+MAX_BATCH_SIZE = 500
+
+NOT_AN_OBJECT = {'non_field_errors': ['Expected an object.']}
+NOT_FOUND = {'id': ['Not found.']}
+NOT_PERMITTED = {'id': ['You do not have permission to edit this post.']}
+PRECONDITION_FAILED = {'if_match': ['The post has changed since it was fetched.']}
+
+
+def _coerce_pks(model, values):
+    pks = set()
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        try:
+            pks.add(model._meta.pk.to_python(value))
+        except (DjangoValidationError, TypeError, ValueError):
+            # Left for the serializer field to report.
+            pass
+    return pks
+
+
+def resolve_related(items, using=DEFAULT_DB_ALIAS):
+    """
+    Load every category and tag referenced by ``items`` in one query each,
+    in the ``resolved_objects`` form read by ``BulkPrimaryKeyRelatedField``.
+    """
+    category_ids, tag_ids = [], []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        category_ids.append(item.get('category'))
+        tags = item.get('tags')
+        if isinstance(tags, (list, tuple)):
+            tag_ids.extend(tags)
+    return {
+        Category: Category.objects.using(using).in_bulk(_coerce_pks(Category, category_ids)),
+        Tag: Tag.objects.using(using).in_bulk(_coerce_pks(Tag, tag_ids)),
+    }
+
+
+def _state(post, tag_ids):
+    # Payloads may repeat a tag; the through table holds it once.
+    return PostState(post.category_id, post.author_id, list(dict.fromkeys(tag_ids)), post.status, post.view_count)
+
+
+def write_posts(items, author, posts=None, can_change=None, etag=None, context=None, using=DEFAULT_DB_ALIAS):
+    """
+    Validate and write a batch of post payloads in one transaction.
+
+    Items with an ``id`` update that post when ``posts`` (the queryset the
+    caller may update) is given, subject to ``can_change(post)`` and, for
+    items with an ``if_match``, to it equalling ``etag(post)``; all other
+    items create posts by ``author``. Returns one result per item, in input
+    order: ``{'index', 'id', 'status'}`` on success or ``{'index', 'errors'}``.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    with transaction.atomic(using=using):
+        context = {**(context or {}), 'resolved_objects': resolve_related(items, using)}
+        targets = {}
+        if posts is not None:
+            update_ids = _coerce_pks(
+                BlogPost, [item['id'] for item in items if isinstance(item, dict) and 'id' in item],
+            )
+            if update_ids:
+                # Read from the primary, after the lock, like get_locked_object().
+                lock_row(BlogPost, using, {'pk__in': update_ids})
+                targets = posts.using(using).prefetch_related('tags').in_bulk(update_ids)
+
+        # Building a serializer's fields costs more than validating an item, so
+        # one create and one partial-update serializer validate the whole batch.
+        create_serializer = BlogPostDetailSerializer(context=context)
+        update_serializer = BlogPostDetailSerializer(partial=True, context=context)
+        creates, updates = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'errors': NOT_AN_OBJECT}
+                continue
+            instance = None
+            if posts is not None and 'id' in item:
+                pks = _coerce_pks(BlogPost, [item['id']])
+                instance = targets.get(pks.pop()) if pks else None
+                if instance is None:
+                    results[index] = {'index': index, 'errors': NOT_FOUND}
+                    continue
+                if can_change is not None and not can_change(instance):
+                    results[index] = {'index': index, 'errors': NOT_PERMITTED}
+                    continue
+                if 'if_match' in item and (etag is None or item['if_match'] != etag(instance)):
+                    results[index] = {'index': index, 'errors': PRECONDITION_FAILED}
+                    continue
+            try:
+                if instance is None:
+                    creates.append((index, None, create_serializer.run_validation(item)))
+                else:
+                    updates.append((index, instance, update_serializer.run_validation(item)))
+            except serializers.ValidationError as exc:
+                results[index] = {'index': index, 'errors': serializers.as_serializer_error(exc)}
+
+        before, after = {}, {}
+        created = _create_posts(creates, author, using)
+        for (index, _, data), post in zip(creates, created):
+            results[index] = {'index': index, 'id': post.pk, 'status': 'created'}
+            after[post.pk] = _state(post, [tag.pk for tag in data.get('tags', [])])
+
+        for index, post, _ in updates:
+            before[post.pk] = _state(post, [tag.pk for tag in post.tags.all()])
+        updated = _update_posts(updates, using)
+        for (index, _, data), post in zip(updates, updated):
+            results[index] = {'index': index, 'id': post.pk, 'status': 'updated'}
+            tag_ids = [tag.pk for tag in data['tags']] if 'tags' in data else before[post.pk].tag_ids
+            after[post.pk] = _state(post, tag_ids)
+
+        if after:
+            apply_post_changes(before, after, using)
+            record_post_changes(before, after, using)
+            sync_trending_scores(after, using)
+            queue_related_updates(after, using)
+            queue_html_renders(after, using)
+            get_search_backend(using).index_posts(list(after))
+            invalidate_tags(_cache_tags(before, after))
+    return results
+
+
+def _apply_publish_date(post):
+    # Mirrors BlogPost.save(), which the bulk paths bypass.
+    if post.status == BlogPost.Status.PUBLISHED and not post.published_date:
+        post.published_date = timezone.now()
+
+
+def _create_posts(creates, author, using):
+    posts = []
+    for _, _, data in creates:
+        post = BlogPost(author=author, **{
+            field: value for field, value in data.items() if field != 'tags'
+        })
+        _apply_publish_date(post)
+        posts.append(post)
+    posts = BlogPost.objects.using(using).bulk_create(posts)
+    _add_tags((
+        (post.pk, tag.pk)
+        for post, (_, _, data) in zip(posts, creates)
+        for tag in data.get('tags', [])
+    ), using)
+    return posts
+
+
+def _update_posts(updates, using):
+    if not updates:
+        return []
+    now = timezone.now()
+    fields = {'published_date', 'updated_at'}
+    retagged = []
+    posts = []
+    for _, post, data in updates:
+        for field, value in data.items():
+            if field == 'tags':
+                retagged.append(post.pk)
+                continue
+            setattr(post, field, value)
+            fields.add(field)
+        _apply_publish_date(post)
+        post.updated_at = now
+        posts.append(post)
+    BlogPost.objects.using(using).bulk_update(posts, sorted(fields))
+
+    if retagged:
+        BlogPost.tags.through.objects.using(using).filter(blogpost_id__in=retagged).delete()
+        _add_tags((
+            (post.pk, tag.pk)
+            for _, post, data in updates if 'tags' in data
+            for tag in data['tags']
+        ), using)
+    return posts
+
+
+def _add_tags(pairs, using=DEFAULT_DB_ALIAS):
+    through = BlogPost.tags.through
+    through.objects.using(using).bulk_create(
+        [through(blogpost_id=post_id, tag_id=tag_id) for post_id, tag_id in pairs],
+        ignore_conflicts=True,
+    )
+
+
+def _cache_tags(before, after):
+    tags = {'posts', 'posts:published', 'posts:featured', 'posts:trending'}
+    for post_id, state in [*before.items(), *after.items()]:
+        tags.add(f'post:{post_id}')
+        tags.add(f'author:{state.author_id}')
+        if state.category_id:
+            tags.add(f'category:{state.category_id}')
+        tags.update(f'tag:{tag_id}' for tag_id in state.tag_ids)
+    return tags
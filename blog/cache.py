@@ -0,0 +1,256 @@
+"""
+Response caching for anonymous-heavy read endpoints.
+
+Entries are keyed by path, query string and user class (anonymous,
+authenticated or staff). Every entry records the version of each dependency
+tag it was built from, e.g. ``post:12`` or ``category:3``; bumping a tag's
+version in ``invalidate_tags`` makes every entry that depends on it stale, so
+saving a post only evicts the responses it can appear in.
+
+Tag versions must be shared by every server process, or a write handled by
+one worker leaves the others serving what it replaced. Caching is therefore
+off on a process-local backend such as ``LocMemCache``, unless
+``ALLOW_PROCESS_LOCAL`` says a single process serves every request; see
+``postflow.caches``.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from postflow.caches import is_process_local
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    # Upper bound on staleness for data that changes without signals,
+    # such as author names.
+    'TIMEOUT': 300,
+    'KEY_PREFIX': 'blog:response',
+    # Cache on a process-local backend too; only right for one process.
+    'ALLOW_PROCESS_LOCAL': False,
+}
+
+
+def cache_setting(name):
+    return getattr(settings, 'BLOG_RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[cache_setting('CACHE_ALIAS')]
+
+
+def cache_enabled():
+    if not cache_setting('ENABLED'):
+        return False
+    return cache_setting('ALLOW_PROCESS_LOCAL') or not is_process_local(cache_setting('CACHE_ALIAS'))
+
+
+def user_class(user):
+    if not user or not user.is_authenticated:
+        return 'anonymous'
+    if user.is_staff:
+        return 'staff'
+    return 'authenticated'
+
+
+def response_key(request):
+    query = sorted(request.query_params.lists())
+    raw = f'{request.path}?{query!r}|{user_class(request.user)}'
+    return f"{cache_setting('KEY_PREFIX')}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def tag_key(tag):
+    return f"{cache_setting('KEY_PREFIX')}:tag:{tag}"
+
+
+def new_version():
+    # The creation time rides along so versions can also answer
+    # If-Modified-Since; see blog.conditional.
+    return f'{time.time():.6f}-{uuid.uuid4().hex}'
+
+
+def version_time(version):
+    try:
+        return float(version.split('-', 1)[0])
+    except (AttributeError, ValueError):
+        return None
+
+
+def tag_versions(tags):
+    """
+    Return the current version of each tag, creating versions for new tags.
+    """
+    cache = get_cache()
+    keys = {tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, new_version(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def invalidate_tags(tags):
+    """
+    Make every cached response depending on any of ``tags`` stale.
+    """
+    tags = set(tags)
+    if not tags:
+        return
+    get_cache().set_many(
+        {tag_key(tag): new_version() for tag in tags},
+        timeout=None
+    )
+
+
+class CacheStats:
+    """
+    In-process hit/miss counters per cached endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._misses = Counter()
+
+    def record(self, endpoint, hit):
+        with self._lock:
+            (self._hits if hit else self._misses)[endpoint] += 1
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = sorted(set(self._hits) | set(self._misses))
+            stats = {}
+            for endpoint in endpoints:
+                hits, misses = self._hits[endpoint], self._misses[endpoint]
+                stats[endpoint] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': round(hits / (hits + misses), 4),
+                }
+            return stats
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+
+cache_stats = CacheStats()
+
+
+def payload_items(data):
+    if isinstance(data, dict):
+        data = data.get('results', [])
+    return data if isinstance(data, list) else []
+
+
+def post_payload_tags(data):
+    """
+    Tags for every post, author, category and tag embedded in a post listing.
+    """
+    tags = set()
+    for post in payload_items(data):
+        tags.add(f"post:{post['id']}")
+        if post.get('author'):
+            tags.add(f"author:{post['author']['id']}")
+        if post.get('category'):
+            tags.add(f"category:{post['category']['id']}")
+        for tag in post.get('tags') or []:
+            tags.add(f"tag:{tag['id']}")
+    return tags
+
+
+def label_payload_tags(prefix):
+    def collect(data):
+        return {f"{prefix}:{item['id']}" for item in payload_items(data)}
+    return collect
+
+
+def cache_response(*tags, collect=post_payload_tags):
+    """
+    Cache successful GET responses of a viewset method.
+
+    ``tags`` are dependency tags that decide whether new rows could enter the
+    response; they are formatted with the URL kwargs and query parameters, and
+    tags whose placeholders are missing are skipped. ``collect`` derives tags
+    from the rendered payload so that edits to anything shown evict it.
+    Works on ``async def`` methods too.
+    """
+    def decorator(view_method):
+        endpoint = view_method.__name__
+
+        def lookup(self, request, kwargs):
+            key = response_key(request)
+            entry = get_cache().get(key)
+            if entry is not None:
+                versions, data = entry
+                if tag_versions_match(versions):
+                    cache_stats.record(f'{type(self).__name__}.{endpoint}', hit=True)
+                    return Response(data, headers={'X-Cache': 'HIT'}), None
+
+            cache_stats.record(f'{type(self).__name__}.{endpoint}', hit=False)
+            static_tags = format_tags(tags, request, kwargs)
+            # Read the static tag versions before running the view so a write
+            # that lands mid-request leaves this entry already stale.
+            return None, (key, static_tags, tag_versions(static_tags))
+
+        def store(response, key, static_tags, versions):
+            if response.status_code == 200:
+                payload_tags = set(collect(response.data)) - static_tags
+                versions.update(tag_versions(payload_tags))
+                get_cache().set(key, (versions, response.data), cache_setting('TIMEOUT'))
+            response['X-Cache'] = 'MISS'
+            return response
+
+        if iscoroutinefunction(view_method):
+            @wraps(view_method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                if request.method != 'GET' or not cache_enabled():
+                    return await view_method(self, request, *args, **kwargs)
+                hit, pending = lookup(self, request, kwargs)
+                if hit is not None:
+                    return hit
+                return store(await view_method(self, request, *args, **kwargs), *pending)
+            return async_wrapper
+
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET' or not cache_enabled():
+                return view_method(self, request, *args, **kwargs)
+            hit, pending = lookup(self, request, kwargs)
+            if hit is not None:
+                return hit
+            return store(view_method(self, request, *args, **kwargs), *pending)
+        return wrapper
+    return decorator
+
+
+def format_tags(tags, request, view_kwargs):
+    """
+    Fill dependency tag placeholders from the URL kwargs and query
+    parameters, skipping tags whose placeholders are missing.
+    """
+    params = {**request.query_params.dict(), **view_kwargs}
+    formatted = set()
+    for tag in tags:
+        try:
+            formatted.add(tag.format(**params))
+        except KeyError:
+            pass
+    return formatted
+
+
+def tag_versions_match(versions):
+    if not versions:
+        return True
+    return get_cache().get_many(versions.keys()) == versions
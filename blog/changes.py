@@ -0,0 +1,327 @@
+"""
+Change feed.
+
+Every create, update, status change and delete of a post, category or tag
+appends a ``Change`` row in the transaction of the write. The model signals
+in blog.signals write them, and the bulk paths, which skip those signals,
+write their own. A row names the object and what happened to it, not the new
+values. The feed reads each object's current state when it is served, so a
+client that applies the changes after its cursor, in order, ends up with the
+current state of every object they name. Posts the client may not see are
+served as deletes.
+
+For the same reason, a row superseded by a later row for the same object
+carries nothing the later one does not. Compaction deletes those rows, so
+the log holds one row per object ever written, deleted ones included, and
+every cursor stays valid. A client without a cursor starts from the
+beginning, which amounts to a full sync.
+
+Rows are served in ``(transaction_id, id)`` order. On SQLite, writes are
+serialized and ``transaction_id`` is 0, so that is commit order. On
+PostgreSQL, concurrent transactions can commit their rows out of id order.
+Rows there carry the id of the transaction that wrote them, and only rows of
+transactions older than every running one are served, so no row can later
+appear before a cursor already handed out.
+
+Compaction runs on a background thread after every ``COMPACT_EVERY`` rows
+this process writes, over the objects written since its last run. Run
+``compact_changes`` for a full pass.
+"""
+import threading
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+
+from .models import BlogPost, Category, Change, Tag
+
+DEFAULTS = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+    # Longest a request may wait for changes with ?wait=, in seconds. Only
+    # the async view waits; see ChangeViewSet.
+    'MAX_WAIT': 25,
+    # How often a waiting request looks for new rows.
+    'POLL_INTERVAL': 0.5,
+    # Rows this process writes between compactions; 0 leaves compaction to
+    # the compact_changes command.
+    'COMPACT_EVERY': 1000,
+}
+
+# Objects per query when compacting.
+COMPACT_BATCH_SIZE = 500
+
+POST_FIELDS = (
+    'id', 'title', 'excerpt', 'author_id', 'category_id', 'status', 'is_featured',
+    'published_date', 'created_at', 'updated_at', 'content_hash',
+)
+CATEGORY_FIELDS = ('id', 'name', 'description', 'created_at')
+TAG_FIELDS = ('id', 'name', 'created_at')
+
+
+def changes_setting(name):
+    return getattr(settings, 'BLOG_CHANGES', {}).get(name, DEFAULTS[name])
+
+
+Cursor = namedtuple('Cursor', ['transaction_id', 'id'])
+
+START = Cursor(0, 0)
+
+
+def format_cursor(cursor):
+    if cursor.transaction_id:
+        return f'{cursor.transaction_id}.{cursor.id}'
+    return str(cursor.id)
+
+
+def parse_cursor(value):
+    """
+    The ``Cursor`` written by ``format_cursor``; raises ``ValueError``.
+    """
+    if not value:
+        return START
+    transaction_id, _, pk = value.rpartition('.')
+    cursor = Cursor(int(transaction_id or 0), int(pk))
+    if min(cursor) < 0:
+        raise ValueError(value)
+    return cursor
+
+
+def record_changes(kind, object_ids, action, using=DEFAULT_DB_ALIAS):
+    """
+    Append a row per id of ``object_ids`` in the current transaction.
+    """
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    connection = connections[using]
+    transaction_id = 0
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT txid_current()')
+            transaction_id = cursor.fetchone()[0]
+    Change.objects.using(using).bulk_create([
+        Change(transaction_id=transaction_id, kind=kind, object_id=pk, action=action)
+        for pk in object_ids
+    ])
+    change_log.written(len(object_ids), using)
+
+
+def record_post_changes(before, after, using=DEFAULT_DB_ALIAS):
+    """
+    Record the posts written without model signals. ``before`` and
+    ``after`` map post ids to ``PostState``, as for ``apply_post_changes``.
+    """
+    actions = defaultdict(list)
+    for pk, state in after.items():
+        if pk not in before:
+            actions[Change.Action.CREATE].append(pk)
+        elif before[pk].status != state.status:
+            actions[Change.Action.STATUS].append(pk)
+        else:
+            actions[Change.Action.UPDATE].append(pk)
+    for action, post_ids in actions.items():
+        record_changes(Change.Kind.POST, post_ids, action, using)
+
+
+def served_queries(after, using=DEFAULT_DB_ALIAS):
+    """
+    The rows after the cursor ``after``, as two range reads of the feed
+    index: the rest of the cursor's transaction, then later transactions.
+    With an OR of both, or a row value comparison, SQLite seeks on
+    transaction_id alone and reads every row of the cursor's transaction up
+    to the cursor.
+    """
+    changes = Change.objects.using(using).order_by('transaction_id', 'id')
+    if connections[using].vendor == 'postgresql':
+        # In the same query, so the async ORM can serve it too.
+        changes = changes.filter(transaction_id__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', []))
+    return (
+        changes.filter(transaction_id=after.transaction_id, id__gt=after.id),
+        changes.filter(transaction_id__gt=after.transaction_id),
+    )
+
+
+def served_changes(after, limit, using=DEFAULT_DB_ALIAS):
+    """
+    Up to ``limit`` rows after the cursor ``after``, in order, and whether
+    more are ready.
+    """
+    same_transaction, later = served_queries(after, using)
+    rows = list(same_transaction[:limit + 1])
+    if len(rows) <= limit:
+        rows += later[:limit + 1 - len(rows)]
+    return rows[:limit], len(rows) > limit
+
+
+async def aserved_changes(after, limit, using=DEFAULT_DB_ALIAS):
+    same_transaction, later = served_queries(after, using)
+    rows = [row async for row in same_transaction[:limit + 1]]
+    if len(rows) <= limit:
+        rows += [row async for row in later[:limit + 1 - len(rows)]]
+    return rows[:limit], len(rows) > limit
+
+
+def post_state(row):
+    row['author'] = row.pop('author_id')
+    row['category'] = row.pop('category_id')
+    row['tags'] = []
+    return row
+
+
+def post_tags(states, posts):
+    return BlogPost.tags.through.objects.using(posts.db).filter(
+        blogpost_id__in=list(states),
+    ).order_by('tag_id').values_list('blogpost_id', 'tag_id')
+
+
+def post_states(posts):
+    """
+    ``{post_id: state}`` as the feed serves posts, for the posts of ``posts``.
+    """
+    states = {row['id']: post_state(row) for row in posts.order_by().values(*POST_FIELDS)}
+    for post_id, tag_id in post_tags(states, posts):
+        states[post_id]['tags'].append(tag_id)
+    return states
+
+
+async def apost_states(posts):
+    states = {row['id']: post_state(row) async for row in posts.order_by().values(*POST_FIELDS)}
+    async for post_id, tag_id in post_tags(states, posts):
+        states[post_id]['tags'].append(tag_id)
+    return states
+
+
+def label_states(queryset, fields):
+    return {row['id']: row for row in queryset.order_by().values(*fields)}
+
+
+async def alabel_states(queryset, fields):
+    return {row['id']: row async for row in queryset.order_by().values(*fields)}
+
+
+def label_queryset(kind, object_ids, using):
+    if kind == Change.Kind.CATEGORY:
+        return Category.objects.using(using).filter(pk__in=object_ids), CATEGORY_FIELDS
+    return Tag.objects.using(using).filter(pk__in=object_ids), TAG_FIELDS
+
+
+def feed_states(kind, object_ids, posts):
+    """
+    Current states of ``object_ids`` of ``kind``; posts missing from
+    ``posts``, the ones the client may see, are left out.
+    """
+    if kind == Change.Kind.POST:
+        return post_states(posts.filter(pk__in=object_ids))
+    return label_states(*label_queryset(kind, object_ids, posts.db))
+
+
+async def afeed_states(kind, object_ids, posts):
+    if kind == Change.Kind.POST:
+        return await apost_states(posts.filter(pk__in=object_ids))
+    return await alabel_states(*label_queryset(kind, object_ids, posts.db))
+
+
+def changed_ids(rows):
+    object_ids = defaultdict(set)
+    for row in rows:
+        object_ids[row.kind].add(row.object_id)
+    return {kind: list(ids) for kind, ids in object_ids.items()}
+
+
+def served_page(after, rows, more, states):
+    changes = []
+    for row in rows:
+        data = states[row.kind].get(row.object_id)
+        changes.append({
+            'type': row.kind,
+            'id': row.object_id,
+            # Gone since, or hidden from this client.
+            'action': row.action if data is not None else Change.Action.DELETE,
+            'data': data,
+        })
+    cursor = Cursor(rows[-1].transaction_id, rows[-1].id) if rows else after
+    return {'changes': changes, 'cursor': format_cursor(cursor), 'more': more}
+
+
+def feed_page(after, limit, posts):
+    """
+    ``{'changes', 'cursor', 'more'}`` for the rows after the cursor
+    ``after``. ``posts`` are the posts the client may see.
+    """
+    rows, more = served_changes(after, limit, posts.db)
+    states = {kind: feed_states(kind, ids, posts) for kind, ids in changed_ids(rows).items()}
+    return served_page(after, rows, more, states)
+
+
+async def afeed_page(after, limit, posts):
+    rows, more = await aserved_changes(after, limit, posts.db)
+    states = {kind: await afeed_states(kind, ids, posts) for kind, ids in changed_ids(rows).items()}
+    return served_page(after, rows, more, states)
+
+
+def compact_changes(since=0, using=DEFAULT_DB_ALIAS):
+    """
+    Delete the rows superseded by a later row for the same object, for the
+    objects with rows after id ``since``. Return the number of rows deleted
+    and the highest id looked at, which the next pass can start from.
+    """
+    changes = Change.objects.using(using)
+    last = changes.order_by('-id').values_list('id', flat=True).first()
+    if last is None or last <= since:
+        return 0, since
+    touched = defaultdict(set)
+    for kind, object_id in changes.filter(id__gt=since, id__lte=last).values_list('kind', 'object_id'):
+        touched[kind].add(object_id)
+    later = changes.filter(
+        kind=OuterRef('kind'), object_id=OuterRef('object_id'),
+    ).filter(
+        Q(transaction_id__gt=OuterRef('transaction_id'))
+        | Q(transaction_id=OuterRef('transaction_id'), id__gt=OuterRef('id'))
+    )
+    deleted = 0
+    for kind, object_ids in touched.items():
+        object_ids = sorted(object_ids)
+        for start in range(0, len(object_ids), COMPACT_BATCH_SIZE):
+            batch = object_ids[start:start + COMPACT_BATCH_SIZE]
+            deleted += changes.filter(kind=kind, object_id__in=batch).filter(Exists(later)).delete()[0]
+    return deleted, last
+
+
+class ChangeLog:
+    """
+    Compacts after every ``COMPACT_EVERY`` rows this process writes, once
+    they commit, on a background thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._written = 0
+        self._compacted_through = 0
+        self._compacting = False
+
+    def written(self, count, using=DEFAULT_DB_ALIAS):
+        transaction.on_commit(lambda: self._committed(count, using), using=using)
+
+    def _committed(self, count, using):
+        every = changes_setting('COMPACT_EVERY')
+        with self._lock:
+            self._written += count
+            compact = every and self._written >= every and not self._compacting
+            if compact:
+                self._written = 0
+                self._compacting = True
+        if compact:
+            threading.Thread(target=self._compact_in_background, args=(using,), daemon=True).start()
+
+    def _compact_in_background(self, using):
+        try:
+            _, self._compacted_through = compact_changes(self._compacted_through, using)
+        finally:
+            self._compacting = False
+            connections.close_all()
+
+
+change_log = ChangeLog()
@@ -0,0 +1,42 @@
+from django.core.checks import Tags, Warning, register
+
+from postflow.caches import is_process_local
+from postflow.replicas import replica_aliases, replica_setting
+
+from .cache import cache_setting
+
+
+@register(Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    if not cache_setting('ENABLED') or cache_setting('ALLOW_PROCESS_LOCAL'):
+        return []
+    alias = cache_setting('CACHE_ALIAS')
+    if not is_process_local(alias):
+        return []
+    return [Warning(
+        f"The response cache is off: cache '{alias}' is local to each process, "
+        f'so invalidations in one worker would not reach the others.',
+        hint=(
+            'Set CACHE_URL to a Redis or Memcached server, or set '
+            "BLOG_RESPONSE_CACHE['ALLOW_PROCESS_LOCAL'] when a single process serves every request."
+        ),
+        id='blog.W001',
+    )]
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_pins(app_configs, **kwargs):
+    if not replica_aliases() or replica_setting('ALLOW_PROCESS_LOCAL'):
+        return []
+    alias = replica_setting('CACHE_ALIAS')
+    if not is_process_local(alias):
+        return []
+    return [Warning(
+        f"Token clients always read from the primary: cache '{alias}' is local to "
+        f'each process, so a read-your-writes pin set by one worker would not reach the others.',
+        hint=(
+            'Set CACHE_URL to a Redis or Memcached server, or set '
+            "DATABASE_REPLICAS['ALLOW_PROCESS_LOCAL'] when a single process serves every request."
+        ),
+        id='postflow.W001',
+    )]
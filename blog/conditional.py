@@ -0,0 +1,233 @@
+"""
+Conditional requests: ``ETag``, ``Last-Modified``, ``304 Not Modified`` and
+``If-Match`` preconditions.
+
+Detail endpoints derive their ``ETag`` from the stored state of everything
+the representation shows: the object's own columns (content by its hash) and
+those of the rows it embeds. The validator therefore survives cache eviction
+and restarts, and changes with any write, including view count flushes,
+which is also why objects carry no ``Last-Modified``: no stored timestamp
+covers every column. They answer ``304`` without serializing, and ``update``
+checks ``If-Match`` and writes under a row lock, so of two clients holding
+the same ``ETag`` only the first write succeeds.
+
+List endpoints derive validators from the dependency tag versions of
+``blog.cache``: the ``ETag`` hashes the request scope with the current
+version of every tag the response depends on, and ``Last-Modified`` is the
+newest of those versions' timestamps. They remember the versions they were
+rendered from; a repeated request whose versions are all unchanged is
+answered from that record without touching the database. Like the response
+cache, they only do so while ``blog.cache.cache_enabled()``.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import (
+    cache_enabled, cache_setting, format_tags, get_cache, post_payload_tags,
+    tag_versions, tag_versions_match, version_time,
+)
+
+
+def request_scope(request, path=None):
+    """
+    What, besides its dependencies, a representation varies with: path,
+    query, rendered format and, for per-user listings, the user. With
+    ``path``, the scope of a plain JSON GET of ``path`` by the same user.
+    """
+    if path is None:
+        path, query = request.path, sorted(request.query_params.lists())
+        renderer_format = getattr(getattr(request, 'accepted_renderer', None), 'format', '')
+    else:
+        query, renderer_format = [], 'json'
+    user = request.user.pk if request.user.is_authenticated else 'anonymous'
+    return f'{path}?{query!r}|{renderer_format}|{user}'
+
+
+def validators(scope, versions):
+    """
+    Return ``(etag, last_modified)`` for a representation built from
+    ``versions``; ``last_modified`` is ``None`` if any version is untimed.
+    """
+    raw = repr((scope, sorted(versions.items())))
+    etag = f'"{hashlib.sha256(raw.encode()).hexdigest()[:40]}"'
+    times = [version_time(version) for version in versions.values()]
+    last_modified = int(max(times)) if times and None not in times else None
+    return etag, last_modified
+
+
+def row_state(obj, fields=None, exclude=()):
+    """
+    The values of ``obj``'s ``fields``, by default every column not in
+    ``exclude``, as loaded.
+    """
+    if fields is None:
+        fields = [field.attname for field in obj._meta.concrete_fields if field.name not in exclude]
+    return (obj._meta.label, *(getattr(obj, name) for name in fields))
+
+
+def state_etag(scope, state):
+    raw = repr((scope, state))
+    return f'"{hashlib.sha256(raw.encode()).hexdigest()[:40]}"'
+
+
+def lock_row(model, using, filter_kwargs):
+    """
+    Lock the row matched by ``filter_kwargs`` until the transaction ends.
+    SQLite has no row locks and takes its database write lock on the first
+    write, not on reads, so there the row is rewritten unchanged instead.
+    """
+    try:
+        rows = model._default_manager.using(using).filter(**filter_kwargs)
+    except (TypeError, ValueError, ValidationError):
+        return  # Not a valid lookup; get_object() answers 404.
+    if connections[using].features.has_select_for_update:
+        list(rows.select_for_update().values_list('pk', flat=True))
+    else:
+        pk = model._meta.pk.attname
+        rows.update(**{pk: F(pk)})
+
+
+def with_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def validators_key(request):
+    digest = hashlib.sha256(request_scope(request).encode()).hexdigest()
+    return f"{cache_setting('KEY_PREFIX')}:validators:{digest}"
+
+
+def conditional_response(*tags, collect=post_payload_tags):
+    """
+    Add validators to successful GET responses of a list method and answer
+    ``304`` when the client's copy is current. ``tags`` and ``collect`` have
+    the same meaning as for ``cache_response``, and ``async def`` methods are
+    supported the same way.
+    """
+    def decorator(view_method):
+        def not_modified(request):
+            versions = get_cache().get(validators_key(request))
+            if versions is not None and tag_versions_match(versions):
+                etag, last_modified = validators(request_scope(request), versions)
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=last_modified
+                )
+                if response is not None:
+                    return with_validators(response, etag, last_modified)
+            return None
+
+        def finish(request, response, static_tags, versions):
+            if response.status_code != 200:
+                return response
+            versions.update(tag_versions(set(collect(response.data)) - static_tags))
+            get_cache().set(validators_key(request), versions, cache_setting('TIMEOUT'))
+            etag, last_modified = validators(request_scope(request), versions)
+            # The body was built anyway, but the client may still hold it.
+            current = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            return with_validators(current or response, etag, last_modified)
+
+        if iscoroutinefunction(view_method):
+            @wraps(view_method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                if request.method != 'GET' or not cache_enabled():
+                    return await view_method(self, request, *args, **kwargs)
+                response = not_modified(request)
+                if response is not None:
+                    return response
+                static_tags = format_tags(tags, request, kwargs)
+                versions = tag_versions(static_tags)
+                response = await view_method(self, request, *args, **kwargs)
+                return finish(request, response, static_tags, versions)
+            return async_wrapper
+
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET' or not cache_enabled():
+                return view_method(self, request, *args, **kwargs)
+            response = not_modified(request)
+            if response is not None:
+                return response
+            static_tags = format_tags(tags, request, kwargs)
+            versions = tag_versions(static_tags)
+            response = view_method(self, request, *args, **kwargs)
+            return finish(request, response, static_tags, versions)
+        return wrapper
+    return decorator
+
+
+class ConditionalObjectMixin:
+    """
+    An ``ETag`` for ``retrieve``, checked before serialization, and an
+    ``If-Match`` precondition for ``update``, so clients can write
+    optimistically and get ``412`` on a lost update.
+    """
+
+    def validator_state(self, instance):
+        """
+        The stored values the representation of ``instance`` is built from.
+        """
+        raise NotImplementedError
+
+    def object_etag(self, instance, path=None):
+        """
+        The ``ETag`` of ``instance`` for this request, or, with ``path``,
+        for a plain GET of ``path`` by the same user.
+        """
+        return state_etag(request_scope(self.request, path), self.validator_state(instance))
+
+    def get_locked_object(self):
+        """
+        ``get_object()``, read after locking its row; call it in a transaction.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        model = self.get_queryset().model
+        lock_row(
+            model, router.db_for_write(model),
+            {self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        return self.get_object()
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.retrieve_response(request, self.get_object())
+
+    def retrieve_response(self, request, instance):
+        etag = self.object_etag(instance)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return with_validators(not_modified, etag)
+        serializer = self.get_serializer(instance)
+        return with_validators(Response(serializer.data), etag)
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        with transaction.atomic(using=router.db_for_write(self.get_queryset().model)):
+            # Under the lock, a concurrent write with the same ETag waits
+            # for this one and then fails the check below.
+            instance = self.get_locked_object()
+            if get_conditional_response(request, etag=self.object_etag(instance)) is not None:
+                return Response(
+                    {"error": "The resource has changed since it was fetched"},
+                    status=status.HTTP_412_PRECONDITION_FAILED
+                )
+
+            serializer = self.get_serializer(instance, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+            # As stored, with the counters and relations the write changed,
+            # so the ETag handed out matches the next read.
+            instance = self.get_object()
+        data = self.get_serializer(instance).data
+        return with_validators(Response(data), self.object_etag(instance))
@@ -0,0 +1,280 @@
+"""
+Post counters.
+
+``increment_views`` is the hottest write path in the API, so instead of a
+``save()`` per request the increments are accumulated in memory and written
+out in batches with ``F()`` updates. Batches are flushed every
+``FLUSH_INTERVAL`` seconds, whenever ``MAX_PENDING`` increments are waiting,
+and when the process exits. A failed flush keeps its batch buffered; one
+triggered by a request logs the error instead of failing the request.
+
+This module also maintains the denormalized ``PostStats`` counters on
+categories, tags and authors: the signal handlers in ``blog.signals`` apply
+each post's contribution with ``adjust_stats``, and ``recount_post_stats``
+rebuilds them from scratch.
+
+Flushed views also feed the trending scores; see ``blog.trending``.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .cache import invalidate_tags
+from .models import AuthorStats, BlogPost, Category, PostStats, Tag
+from .trending import record_trending_views
+
+logger = logging.getLogger('blog.counters')
+
+DEFAULTS = {
+    # Seconds between background flushes; 0 writes every increment through.
+    'FLUSH_INTERVAL': 5,
+    # Flush early once this many increments are buffered.
+    'MAX_PENDING': 1000,
+}
+
+
+def counter_setting(name):
+    return getattr(settings, 'BLOG_VIEW_COUNTER', {}).get(name, DEFAULTS[name])
+
+
+class ViewCountBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._total = 0
+        self._timer = None
+
+    def add(self, post_id, amount=1):
+        """
+        Buffer ``amount`` views for ``post_id`` and return how many views it
+        has gained since its ``view_count`` was last written.
+        """
+        flush_interval = counter_setting('FLUSH_INTERVAL')
+        with self._lock:
+            self._pending[post_id] += amount
+            self._total += amount
+            pending = self._pending[post_id]
+            should_flush = not flush_interval or self._total >= counter_setting('MAX_PENDING')
+            if not should_flush:
+                self._start_timer(flush_interval)
+        if should_flush:
+            try:
+                self.flush()
+            except Exception:
+                # This is the request path: keep the batch for the next flush
+                # rather than fail the view that happened to fill the buffer.
+                logger.exception('Flushing buffered views failed; they stay pending')
+                if flush_interval:
+                    with self._lock:
+                        self._start_timer(flush_interval)
+        return pending
+
+    def _start_timer(self, flush_interval):
+        # Called with the lock held.
+        if self._timer is None:
+            self._timer = threading.Timer(flush_interval, self._flush_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def pending(self, post_id):
+        with self._lock:
+            return self._pending[post_id]
+
+    def flush(self):
+        """
+        Write all buffered increments and return how many were written. On a
+        database error the increments stay buffered and the error is raised.
+        """
+        with self._lock:
+            batch, self._pending, self._total = self._pending, Counter(), 0
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not batch:
+            return 0
+
+        # One UPDATE per distinct delta keeps the statement count small; most
+        # posts in a batch share a handful of deltas.
+        post_ids_by_delta = defaultdict(list)
+        for post_id, delta in batch.items():
+            post_ids_by_delta[delta].append(post_id)
+        try:
+            with transaction.atomic():
+                for delta, post_ids in post_ids_by_delta.items():
+                    # QuerySet.update() leaves auto_now fields such as
+                    # updated_at untouched.
+                    BlogPost.objects.filter(pk__in=post_ids).update(
+                        view_count=F('view_count') + delta
+                    )
+                changed = add_views_to_stats(batch)
+                record_trending_views(batch)
+        except Exception:
+            with self._lock:
+                self._pending.update(batch)
+                self._total += sum(batch.values())
+            raise
+        # Cached responses and validators must not outlive the old counts.
+        invalidate_tags(changed)
+        return sum(batch.values())
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own connections; don't leak them.
+            connections.close_all()
+
+
+view_counter = ViewCountBuffer()
+
+
+@atexit.register
+def flush_view_counts():
+    """
+    Shutdown hook; also safe to call from a server's worker-exit hook.
+    """
+    return view_counter.flush()
+
+
+STAT_FIELDS = PostStats.STAT_FIELDS
+
+
+def post_contribution(status, view_count, sign=1):
+    """
+    What one post adds to the counters of its category, tags and author.
+    """
+    published = status == BlogPost.Status.PUBLISHED
+    return {
+        'post_count': sign,
+        'published_post_count': sign if published else 0,
+        'total_views': sign * (view_count or 0),
+    }
+
+
+def contribution_delta(old, new):
+    return {field: new[field] - old[field] for field in STAT_FIELDS}
+
+
+def adjust_stats(queryset, deltas):
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not updates:
+        return 0
+    return queryset.update(**updates)
+
+
+def adjust_author_stats(user_id, deltas, using=DEFAULT_DB_ALIAS):
+    if not any(deltas.values()):
+        return
+    stats = AuthorStats.objects.using(using)
+    if adjust_stats(stats.filter(user_id=user_id), deltas):
+        return
+    # Authors get a stats row with their first post. Decrements never create
+    # one, which also keeps a cascading user delete from resurrecting it.
+    if all(delta >= 0 for delta in deltas.values()):
+        _, created = stats.get_or_create(user_id=user_id, defaults=deltas)
+        if not created:
+            adjust_stats(stats.filter(user_id=user_id), deltas)
+
+
+def add_views_to_stats(views_by_post):
+    """
+    Roll flushed view increments up into category, tag and author totals.
+    Returns the response cache tags of the posts whose counts moved.
+    """
+    post_ids = list(views_by_post)
+    by_model = {Category: Counter(), AuthorStats: Counter(), Tag: Counter()}
+    for post_id, category_id, author_id in BlogPost.objects.filter(
+        pk__in=post_ids
+    ).values_list('pk', 'category_id', 'author_id'):
+        if category_id:
+            by_model[Category][category_id] += views_by_post[post_id]
+        by_model[AuthorStats][author_id] += views_by_post[post_id]
+    for post_id, tag_id in BlogPost.tags.through.objects.filter(
+        blogpost_id__in=post_ids
+    ).values_list('blogpost_id', 'tag_id'):
+        by_model[Tag][tag_id] += views_by_post[post_id]
+
+    for model, views in by_model.items():
+        ids_by_delta = defaultdict(list)
+        for pk, delta in views.items():
+            ids_by_delta[delta].append(pk)
+        for delta, ids in ids_by_delta.items():
+            model.objects.filter(pk__in=ids).update(total_views=F('total_views') + delta)
+
+    # Listings carry the tag of every post they show, so the posts' own tags
+    # evict them too. Bumping "posts" here would empty the whole listing
+    # cache on every flush; listings sorted by views may keep their old
+    # order until TIMEOUT.
+    return {f'post:{pk}' for pk in post_ids}
+
+
+PostState = namedtuple(
+    'PostState', ['category_id', 'author_id', 'tag_ids', 'status', 'view_count']
+)
+
+
+def apply_post_changes(before, after, using=DEFAULT_DB_ALIAS):
+    """
+    Move the counters of posts written without model signals, such as bulk
+    writes. ``before`` and ``after`` map post ids to ``PostState``; a post
+    missing from ``before`` is new.
+    """
+    deltas = {Category: defaultdict(Counter), AuthorStats: defaultdict(Counter), Tag: defaultdict(Counter)}
+    for states, sign in ((before, -1), (after, 1)):
+        for state in states.values():
+            contribution = post_contribution(state.status, state.view_count, sign)
+            targets = [(Category, state.category_id), (AuthorStats, state.author_id)]
+            targets += [(Tag, tag_id) for tag_id in state.tag_ids]
+            for model, pk in targets:
+                if pk:
+                    deltas[model][pk].update(contribution)
+
+    new_authors = [pk for pk, delta in deltas[AuthorStats].items() if delta['post_count'] > 0]
+    if new_authors:
+        AuthorStats.objects.using(using).bulk_create(
+            [AuthorStats(user_id=pk) for pk in new_authors], ignore_conflicts=True
+        )
+    for model, by_pk in deltas.items():
+        ids_by_delta = defaultdict(list)
+        for pk, delta in by_pk.items():
+            ids_by_delta[tuple(delta[field] for field in STAT_FIELDS)].append(pk)
+        for delta, ids in ids_by_delta.items():
+            adjust_stats(
+                model.objects.using(using).filter(pk__in=ids), dict(zip(STAT_FIELDS, delta))
+            )
+
+
+def recount_post_stats(using=DEFAULT_DB_ALIAS):
+    """
+    Recompute every counter from the posts table.
+    """
+    posts = BlogPost.objects.using(using).order_by()
+    published = Q(status=BlogPost.Status.PUBLISHED)
+
+    def counted(lookup):
+        group = posts.filter(**{lookup: OuterRef('pk')}).values(lookup)
+        return {
+            'post_count': group.annotate(n=Count('pk')).values('n'),
+            'published_post_count': group.annotate(n=Count('pk', filter=published)).values('n'),
+            'total_views': group.annotate(n=Sum('view_count')).values('n'),
+        }
+
+    author_ids = posts.values_list('author_id', flat=True).distinct()
+    AuthorStats.objects.using(using).bulk_create(
+        [AuthorStats(user_id=author_id) for author_id in author_ids],
+        ignore_conflicts=True,
+    )
+    for model, lookup in ((Category, 'category'), (Tag, 'tags'), (AuthorStats, 'author')):
+        subqueries = counted(lookup)
+        model.objects.using(using).update(**{
+            field: Coalesce(Subquery(subquery), Value(0))
+            for field, subquery in subqueries.items()
+        })
@@ -0,0 +1,130 @@
+"""
+Streaming post export in NDJSON and CSV.
+
+Rows are read with a chunked ``iterator()``, so only ``EXPORT_CHUNK_SIZE``
+posts and their tags (prefetched per chunk) are held at a time, and each row
+is encoded and handed to ``StreamingHttpResponse`` as soon as it is read.
+Memory use does not grow with the size of the export.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer
+
+from .models import Tag
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = (
+    'id', 'title', 'content', 'author', 'category', 'tags', 'status',
+    'is_featured', 'view_count', 'published_date', 'created_at', 'updated_at',
+)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Selects the NDJSON export; also renders error responses as one line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Selects the CSV export; also renders error responses as a header row
+    and a value row.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffer = Echo()
+        writer = csv.writer(buffer)
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        values = [
+            ' '.join(map(str, value)) if isinstance(value, list) else value
+            for value in data.values()
+        ]
+        return writer.writerow(data.keys()) + writer.writerow(values)
+
+
+class Echo:
+    """
+    File-like object whose ``write`` returns the value, so ``csv.writer``
+    can encode one row at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(queryset):
+    """
+    Restrict a post queryset to the exported columns, with tag names
+    prefetched per ``iterator()`` chunk.
+    """
+    return queryset.select_related('author', 'category').prefetch_related(None).prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.only('name'))
+    ).only(
+        'id', 'title', 'content', 'status', 'is_featured', 'view_count',
+        'published_date', 'created_at', 'updated_at',
+        'author__username', 'category__name',
+    )
+
+
+def export_rows(queryset, chunk_size=None):
+    # Timestamps formatted exactly as the API's serializers render them.
+    timestamp = serializers.DateTimeField().to_representation
+    for post in export_queryset(queryset).iterator(chunk_size=chunk_size or EXPORT_CHUNK_SIZE):
+        yield {
+            'id': post.pk,
+            'title': post.title,
+            'content': post.content,
+            'author': post.author.username,
+            'category': post.category.name if post.category else None,
+            'tags': [tag.name for tag in post.tags.all()],
+            'status': post.status,
+            'is_featured': post.is_featured,
+            'view_count': post.view_count,
+            'published_date': timestamp(post.published_date) if post.published_date else None,
+            'created_at': timestamp(post.created_at),
+            'updated_at': timestamp(post.updated_at),
+        }
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row['tags'] = ','.join(row['tags'])
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+EXPORT_FORMATS = {
+    NDJSONRenderer.format: (ndjson_lines, NDJSONRenderer.media_type),
+    CSVRenderer.format: (csv_lines, CSVRenderer.media_type),
+}
+
+
+def export_response(queryset, export_format, filename='posts'):
+    encode, media_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        encode(export_rows(queryset)), content_type=f'{media_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
@@ -1,6 +1,92 @@
+import threading
+import time
+
 import django_filters
-from .models import BlogPost
-from django.db.models import Q
+from rest_framework import filters
+from .cache import tag_key, tag_versions
+from .models import BlogPost, Tag
+from .search import get_search_backend, substring_filter
+
+
+class TagIdCache:
+    """
+    ``(id, post count)`` of tags by name, shared by the requests of a
+    process; unknown names are cached as ``None``. Entries are dropped
+    whenever the response cache version of ``tags`` moves, which every tag
+    save or delete bumps (see blog.signals), and in any case after ``TTL``
+    seconds, which bounds how long a rename is missed when the version is
+    not shared between processes. Post counts only order joins, so the
+    stored counters do, however stale.
+    """
+    MAX_ENTRIES = 10000
+    TTL = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._tags = {}
+
+    def resolve(self, names, using='default'):
+        """
+        Map each of ``names`` to its ``(id, post count)``, or ``None`` if
+        there is no such tag.
+        """
+        version, tags, missing = self._cached(names)
+        if missing:
+            tags.update(self._store(version, missing, self._query(missing, using)))
+        return tags
+
+    async def aresolve(self, names, using='default'):
+        """
+        ``resolve`` with the async ORM.
+        """
+        version, tags, missing = self._cached(names)
+        if missing:
+            rows = [row async for row in self._query(missing, using)]
+            tags.update(self._store(version, missing, rows))
+        return tags
+
+    def _query(self, names, using):
+        return Tag.objects.using(using).filter(name__in=names).values_list('name', 'pk', 'post_count')
+
+    def _cached(self, names):
+        version = tag_versions(['tags'])[tag_key('tags')]
+        now = time.monotonic()
+        with self._lock:
+            if version != self._version:
+                self._version, self._tags = version, {}
+            tags = {}
+            for name in names:
+                entry = self._tags.get(name)
+                if entry is not None and entry[1] > now:
+                    tags[name] = entry[0]
+        return version, tags, [name for name in names if name not in tags]
+
+    def _store(self, version, names, rows):
+        found = {name: (pk, posts) for name, pk, posts in rows}
+        tags = {name: found.get(name) for name in names}
+        expires = time.monotonic() + self.TTL
+        with self._lock:
+            if version == self._version:
+                if len(self._tags) + len(names) > self.MAX_ENTRIES:
+                    self._tags = {}
+                self._tags.update({name: (tag, expires) for name, tag in tags.items()})
+        return tags
+
+    def clear(self):
+        with self._lock:
+            self._version, self._tags = None, {}
+
+
+tag_ids_by_name = TagIdCache()
+
+
+def parse_tag_names(value):
+    """
+    The tag names in a ``?tags=`` value.
+    """
+    return {tag_name.strip() for tag_name in value.split(',')} - {''}
+
 
 class BlogPostFilter(django_filters.FilterSet):
     title = django_filters.CharFilter(lookup_expr='icontains')
@@ -8,23 +94,60 @@ class BlogPostFilter(django_filters.FilterSet):
     author = django_filters.CharFilter(field_name='author__username', lookup_expr='icontains')
     category = django_filters.CharFilter(field_name='category__name', lookup_expr='icontains')
     tags = django_filters.CharFilter(method='filter_tags')
+    tags_mode = django_filters.ChoiceFilter(
+        choices=(('any', 'Any'), ('all', 'All')), method='filter_tags_mode'
+    )
     published_after = django_filters.DateFilter(field_name='published_date', lookup_expr='gte')
     published_before = django_filters.DateFilter(field_name='published_date', lookup_expr='lte')
     search = django_filters.CharFilter(method='filter_search')
+    q = django_filters.CharFilter(method='filter_q')
     
     class Meta:
         model = BlogPost
         fields = ['status', 'category', 'author', 'is_featured']
     
     def filter_tags(self, queryset, name, value):
-        tag_names = value.split(',')
-        return queryset.filter(tags__name__in=tag_names).distinct()
+        tag_names = parse_tag_names(value)
+        if not tag_names:
+            return queryset
+        # Async views resolve the names beforehand with the async ORM.
+        resolved = getattr(self.request, 'resolved_tags', None)
+        if resolved is None or not tag_names <= resolved.keys():
+            resolved = tag_ids_by_name.resolve(tag_names, queryset.db)
+        tags = {resolved[tag_name] for tag_name in tag_names} - {None}
+        match_all = self.form.cleaned_data.get('tags_mode') == 'all'
+        if not tags or (match_all and len(tags) < len(tag_names)):
+            return queryset.none()
+        if match_all or len(tags) == 1:
+            # (post, tag) pairs are unique, so joining once per tag yields
+            # each post at most once and needs no DISTINCT. Rarest tag
+            # first, so the shortest posting list drives the intersection.
+            for tag_id, _ in sorted(tags, key=lambda tag: tag[1]):
+                queryset = queryset.filter(tags=tag_id)
+            return queryset
+        # Any of several tags: a semi-join on the through table rather
+        # than a join plus DISTINCT over whole post rows.
+        tagged = BlogPost.tags.through.objects.filter(tag_id__in=[tag_id for tag_id, _ in tags])
+        return queryset.filter(pk__in=tagged.values('blogpost_id'))
+    
+    def filter_tags_mode(self, queryset, name, value):
+        # Read by filter_tags.
+        return queryset
     
     def filter_search(self, queryset, name, value):
-        return queryset.filter(
-            Q(title__icontains=value) |
-            Q(content__icontains=value) |
-            Q(author__username__icontains=value) |
-            Q(category__name__icontains=value) |
-            Q(tags__name__icontains=value)
-        ).distinct()
\ No newline at end of file
+        # Substring matches, as ?search= always found; the full-text index
+        # matches words and serves ?q=.
+        return substring_filter(queryset, value)
+    
+    def filter_q(self, queryset, name, value):
+        # Ranked search; SearchRankOrderingFilter sorts by relevance unless
+        # an explicit ?ordering= is given.
+        return get_search_backend(queryset.db).search(queryset, value)
+
+
+class SearchRankOrderingFilter(filters.OrderingFilter):
+    def get_ordering(self, request, queryset, view):
+        if (not request.query_params.get(self.ordering_param)
+                and 'search_rank' in queryset.query.annotations):
+            return ['-search_rank', '-published_date']
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from blog.models import POST_METRIC_FIELDS, BlogPost, post_metrics
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored excerpt, word count and read time for existing posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        batch_size = options['batch_size']
+        posts = BlogPost.objects.using(using).only('id', 'content').order_by('pk')
+        started = time.monotonic()
+        last_pk = 0
+        processed = 0
+
+        # Walk the table by primary key so each batch is an index range scan
+        # and only one batch of post bodies is in memory at a time.
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for post in batch:
+                for field, value in post_metrics(post.content).items():
+                    setattr(post, field, value)
+            with transaction.atomic(using=using):
+                BlogPost.objects.using(using).bulk_update(batch, POST_METRIC_FIELDS)
+            processed += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'{processed} posts updated')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {processed} posts in {elapsed:.1f}s.'
+        ))
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from blog.benchmarks import format_row, summarize
+
+DEFAULT_PATHS = (
+    '/api/blog/posts/',
+    '/api/blog/posts/?page=2',
+    '/api/blog/posts/recent/',
+    '/api/blog/posts/featured/',
+    '/api/blog/categories/1/posts/',
+    '/api/blog/tags/1/posts/',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Load running deployments (e.g. gunicorn sync workers and uvicorn '
+        'serving postflow.asgi) with concurrent clients and compare their '
+        'throughput and latency. Targets are label=base-url pairs sharing a database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', metavar='label=url')
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per target')
+        parser.add_argument('--path', action='append', dest='paths', help='Repeatable; default: the hot read endpoints')
+        parser.add_argument('--token', help='Send requests with this bearer token')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument(
+            '--check', action='store_true',
+            help='First check that every target answers each path with the same status and body'
+        )
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            label, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError(f'Expected label=url, got {target!r}')
+            targets.append((label, url.rstrip('/')))
+        paths = options['paths'] or DEFAULT_PATHS
+        headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else {}
+
+        if options['check']:
+            asyncio.run(self.compare(targets, paths, headers, options['timeout']))
+        for label, url in targets:
+            elapsed, samples, errors = asyncio.run(self.load(
+                url, paths, headers, options['clients'], options['duration'], options['timeout']
+            ))
+            self.stdout.write(format_row(
+                f'{label} ({len(samples) / elapsed:,.0f} req/s, {errors} errors)', summarize(samples)
+            ))
+
+    async def compare(self, targets, paths, headers, timeout):
+        for path in paths:
+            answers = {}
+            for label, url in targets:
+                status, body = await fetch(url, path, headers, timeout)
+                # Pagination links are absolute.
+                answers[label] = (status, body.replace(url.encode(), b''))
+            if len(set(answers.values())) > 1:
+                raise CommandError(f'Targets answer {path} differently: ' + ', '.join(
+                    f'{label} {status}' for label, (status, _) in answers.items()
+                ))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(paths)} paths answered identically by {len(targets)} targets'
+        ))
+
+    async def load(self, url, paths, headers, clients, duration, timeout):
+        samples = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def client(index):
+            nonlocal errors
+            count = index
+            while time.perf_counter() < deadline:
+                path = paths[count % len(paths)]
+                count += 1
+                started = time.perf_counter()
+                try:
+                    status, _ = await fetch(url, path, headers, timeout)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    status = None
+                if status == 200:
+                    samples.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(index) for index in range(clients)))
+        return time.perf_counter() - started, samples, errors
+
+
+async def fetch(url, path, headers, timeout):
+    """
+    One HTTP/1.1 GET over a fresh connection; returns ``(status, body)``.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != 'http':
+        raise CommandError('Only http:// targets are supported')
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, parts.port or 80), timeout
+    )
+    try:
+        lines = [f'GET {parts.path}{path} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: close']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    if b'transfer-encoding: chunked' in head.lower():
+        body = dechunk(body)
+    return status, body
+
+
+def dechunk(body):
+    chunks = []
+    while body:
+        size, _, rest = body.partition(b'\r\n')
+        size = int(size.split(b';')[0], 16)
+        if not size:
+            break
+        chunks.append(rest[:size])
+        body = rest[size + 2:]
+    return b''.join(chunks)
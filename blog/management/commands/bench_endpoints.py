@@ -0,0 +1,325 @@
+import json
+import os
+import platform
+import time
+from collections import namedtuple
+from itertools import count
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from blog.benchmarks import summarize
+from blog.counters import view_counter
+from blog.models import BlogPost, Category, Tag
+from blog.query_budget import QueryRecorder
+
+PASSWORD = 'Bench-endpoints-pw1'
+CONTENT = 'Endpoint benchmark content, long enough to pass validation. ' * 2
+# Include prefixes whose routes must all have a scenario.
+COVERED_PREFIXES = ('api/auth/', 'api/blog/')
+HTTP_METHODS = ('get', 'post', 'put', 'patch', 'delete')
+# p95 changes smaller than this are noise at any tolerance.
+MIN_LATENCY_REGRESSION_MS = 1.0
+
+Scenario = namedtuple(
+    'Scenario', 'route method path status auth data setup variant share',
+    defaults=(False, None, None, '', 1.0),
+)
+
+
+def post_payload(ctx):
+    return {
+        'title': f"Endpoint benchmark post {ctx['n']}",
+        'content': CONTENT,
+        'category': ctx['category'],
+        'tags': ctx['tags'],
+        'status': 'published',
+    }
+
+
+def own_post(ctx, **fields):
+    post = BlogPost.objects.create(
+        title=f"Endpoint benchmark fixture {ctx['n']}", content=CONTENT,
+        author_id=ctx['user'], category_id=ctx['category'], **fields,
+    )
+    post.tags.set(ctx['tags'])
+    return {'victim': post.pk}
+
+
+SCENARIOS = [
+    Scenario('api-root', 'get', '/api/blog/', 200),
+    Scenario('category-list', 'get', '/api/blog/categories/', 200),
+    Scenario('category-list', 'post', '/api/blog/categories/', 201, auth=True,
+             data=lambda ctx: {'name': f"bench-endpoints-category-{ctx['n']}"}),
+    Scenario('category-detail', 'get', '/api/blog/categories/{category}/', 200),
+    Scenario('category-detail', 'put', '/api/blog/categories/{category}/', 200, auth=True,
+             data=lambda ctx: {'name': ctx['category_name'], 'description': f"Updated {ctx['n']}"}),
+    Scenario('category-detail', 'patch', '/api/blog/categories/{category}/', 200, auth=True,
+             data=lambda ctx: {'description': f"Patched {ctx['n']}"}),
+    Scenario('category-detail', 'delete', '/api/blog/categories/{victim}/', 204, auth=True,
+             setup=lambda ctx: {'victim': Category.objects.create(name=f"bench-endpoints-gone-{ctx['n']}").pk}),
+    Scenario('category-posts', 'get', '/api/blog/categories/{category}/posts/', 200),
+    Scenario('tag-list', 'get', '/api/blog/tags/', 200),
+    Scenario('tag-list', 'post', '/api/blog/tags/', 201, auth=True,
+             data=lambda ctx: {'name': f"bench-endpoints-tag-{ctx['n']}"}),
+    Scenario('tag-detail', 'get', '/api/blog/tags/{tag}/', 200),
+    Scenario('tag-detail', 'put', '/api/blog/tags/{own_tag}/', 200, auth=True,
+             data=lambda ctx: {'name': f"bench-endpoints-renamed-{ctx['n']}"}),
+    Scenario('tag-detail', 'patch', '/api/blog/tags/{own_tag}/', 200, auth=True,
+             data=lambda ctx: {'name': f"bench-endpoints-patched-{ctx['n']}"}),
+    Scenario('tag-detail', 'delete', '/api/blog/tags/{victim}/', 204, auth=True,
+             setup=lambda ctx: {'victim': Tag.objects.create(name=f"bench-endpoints-gone-{ctx['n']}").pk}),
+    Scenario('tag-posts', 'get', '/api/blog/tags/{tag}/posts/', 200),
+    Scenario('post-list', 'get', '/api/blog/posts/', 200),
+    Scenario('post-list', 'get', '/api/blog/posts/?page=5', 200, variant=' page 5'),
+    Scenario('post-list', 'get', '/api/blog/posts/?tags={tag_name}', 200, variant=' ?tags='),
+    Scenario('post-list', 'get', '/api/blog/posts/?q={word}', 200, variant=' ?q='),
+    Scenario('post-list', 'post', '/api/blog/posts/', 201, auth=True, data=post_payload),
+    Scenario('post-bulk', 'post', '/api/blog/posts/bulk/', 201, auth=True,
+             data=lambda ctx: [post_payload(ctx) for _ in range(10)]),
+    Scenario('post-by-author', 'get', '/api/blog/posts/by_author/?author={author}', 200),
+    Scenario('post-by-category', 'get', '/api/blog/posts/by_category/?category={category}', 200),
+    Scenario('post-export', 'get', '/api/blog/posts/export/?tags={tag_name}', 200, share=0.2),
+    Scenario('post-featured', 'get', '/api/blog/posts/featured/', 200),
+    Scenario('post-my-posts', 'get', '/api/blog/posts/my_posts/', 200, auth=True),
+    Scenario('post-recent', 'get', '/api/blog/posts/recent/', 200),
+    Scenario('post-trending', 'get', '/api/blog/posts/trending/', 200),
+    Scenario('post-detail', 'get', '/api/blog/posts/{post}/', 200),
+    Scenario('post-detail', 'put', '/api/blog/posts/{own_post}/', 200, auth=True, data=post_payload),
+    Scenario('post-detail', 'patch', '/api/blog/posts/{own_post}/', 200, auth=True,
+             data=lambda ctx: {'content': f"{CONTENT} Patched {ctx['n']}."}),
+    Scenario('post-detail', 'delete', '/api/blog/posts/{victim}/', 204, auth=True, setup=own_post),
+    Scenario('post-increment-views', 'post', '/api/blog/posts/{own_post}/increment_views/', 200, auth=True),
+    Scenario('post-publish', 'post', '/api/blog/posts/{victim}/publish/', 200, auth=True,
+             setup=lambda ctx: own_post(ctx, status=BlogPost.Status.DRAFT)),
+    Scenario('post-related', 'get', '/api/blog/posts/{post}/related/', 200),
+    Scenario('change-list', 'get', '/api/blog/changes/', 200),
+    Scenario('cache-stats', 'get', '/api/blog/cache-stats/', 200, auth=True),
+    Scenario('request-metrics', 'get', '/api/blog/request-metrics/', 200, auth=True),
+    Scenario('task-stats', 'get', '/api/blog/task-stats/', 200, auth=True),
+    Scenario('register', 'post', '/api/auth/register/', 201, share=0.2, data=lambda ctx: {
+        'username': f"bench-endpoints-new-{ctx['n']}", 'email': f"bench-endpoints-new-{ctx['n']}@example.com",
+        'password': PASSWORD, 'password2': PASSWORD, 'first_name': 'Bench', 'last_name': 'User',
+    }),
+    Scenario('login', 'post', '/api/auth/login/', 200, share=0.2,
+             data=lambda ctx: {'username': ctx['username'], 'password': PASSWORD}),
+    Scenario('token_refresh', 'post', '/api/auth/token/refresh/', 200,
+             data=lambda ctx: {'refresh': ctx['refresh']}),
+    Scenario('user_profile', 'get', '/api/auth/profile/', 200, auth=True),
+    Scenario('user_profile', 'put', '/api/auth/profile/', 200, auth=True,
+             data=lambda ctx: {'first_name': f"Bench{ctx['n']}", 'last_name': 'User'}),
+    Scenario('user_profile', 'patch', '/api/auth/profile/', 200, auth=True,
+             data=lambda ctx: {'first_name': f"Patched{ctx['n']}"}),
+]
+
+
+def label(scenario):
+    return f'{scenario.method.upper()} {scenario.route}{scenario.variant}'
+
+
+def routes(patterns=None, prefix=''):
+    """
+    ``(url name, method)`` of every view under ``COVERED_PREFIXES``, without
+    the format-suffix duplicates.
+    """
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        path = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from routes(pattern.url_patterns, path)
+        elif isinstance(pattern, URLPattern) and path.startswith(COVERED_PREFIXES) and 'format' not in path:
+            actions = getattr(pattern.callback, 'actions', None)
+            view_class = getattr(pattern.callback, 'view_class', getattr(pattern.callback, 'cls', None))
+            methods = actions or [method for method in HTTP_METHODS if hasattr(view_class, method)]
+            yield from ((pattern.name, method) for method in methods)
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every route in blog/urls.py and accounts/urls.py through the '
+        'test client, inside a transaction that is rolled back, and report '
+        'throughput, p50/p95/p99 latency and queries per request. Results '
+        'are compared against a baseline JSON file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', help='Run the scenarios whose label contains this')
+        parser.add_argument('--seed-posts', type=int, default=0,
+                            help='Seed this many posts with seed_blog first (rolled back too)')
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'endpoints.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results to --baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed p95 growth over the baseline, as a fraction')
+        parser.add_argument('--check', action='store_true', help='Fail if any scenario regressed')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in SCENARIOS if not options['only'] or options['only'] in label(s)]
+        if not options['only']:
+            missing = set(routes()) - {(s.route, s.method) for s in SCENARIOS}
+            if missing:
+                raise CommandError('Routes without a scenario: ' + ', '.join(
+                    f'{method.upper()} {name}' for name, method in sorted(missing)
+                ))
+
+        # Buffered views are flushed inside the transaction, so they roll back
+        # too. One process serves every request here, so a local cache is fine.
+        with override_settings(
+            BLOG_VIEW_COUNTER={'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 10 ** 9},
+            BLOG_RESPONSE_CACHE={**getattr(settings, 'BLOG_RESPONSE_CACHE', {}), 'ALLOW_PROCESS_LOCAL': True},
+            ACCOUNTS_USER_CACHE={**getattr(settings, 'ACCOUNTS_USER_CACHE', {}), 'ALLOW_PROCESS_LOCAL': True},
+        ), transaction.atomic():
+            if options['seed_posts']:
+                call_command('seed_blog', posts=options['seed_posts'], stdout=self.stdout)
+            ctx = self.fixtures()
+            dataset = {'posts': BlogPost.objects.count(), 'tags': Tag.objects.count()}
+            results = {}
+            self.stdout.write(
+                f"{'scenario':<44} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+            )
+            for scenario in scenarios:
+                results[label(scenario)] = self.run(scenario, ctx, options)
+                self.stdout.write(self.format_result(label(scenario), results[label(scenario)]))
+            view_counter.flush()
+            transaction.set_rollback(True)
+
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'dataset': dataset,
+                'repeat': options['repeat'],
+                'created': timezone.now().isoformat(timespec='seconds'),
+            },
+            'scenarios': results,
+        }
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(options['baseline']) or '.', exist_ok=True)
+            with open(options['baseline'], 'w') as baseline:
+                json.dump(report, baseline, indent=2, sort_keys=True)
+                baseline.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+        elif os.path.exists(options['baseline']):
+            self.compare(report, options)
+        elif options['check']:
+            raise CommandError(
+                f"No baseline at {options['baseline']}; record one with --save-baseline on the base branch first."
+            )
+
+    def fixtures(self):
+        """
+        A staff user with a token, objects it owns, and seeded objects to read.
+        """
+        user = User.objects.create_user(
+            username='bench-endpoints-user', email='bench-endpoints@example.com',
+            password=PASSWORD, is_staff=True,
+        )
+        category = Category.objects.create(name='bench-endpoints-fixture')
+        own_tag = Tag.objects.create(name='bench-endpoints-own-tag')
+        tags = [own_tag.pk]
+        refresh = RefreshToken.for_user(user)
+        ctx = {
+            'n': 0, 'user': user.pk, 'username': user.username, 'refresh': str(refresh),
+            'token': f'Bearer {refresh.access_token}', 'category': category.pk,
+            'category_name': category.name, 'own_tag': own_tag.pk, 'tags': tags,
+        }
+        ctx['own_post'] = own_post(ctx)['victim']
+        # Read from the busiest seeded objects, or the fixtures on an empty database.
+        post = BlogPost.objects.published().order_by('-view_count').first()
+        popular_tag = Tag.objects.annotate(posts=Count('blog_posts')).order_by('-posts').first()
+        ctx.update({
+            'post': post.pk,
+            'author': post.author_id,
+            'tag': popular_tag.pk,
+            'tag_name': popular_tag.name,
+            'word': post.title.split()[0].lower(),
+        })
+        return ctx
+
+    def run(self, scenario, ctx, options):
+        client = Client(HTTP_HOST='localhost')
+        counter = count(ctx['n'] + 1)
+        repeat = max(3, round(options['repeat'] * scenario.share))
+        samples, queries = [], 0
+        for iteration in range(options['warmup'] + repeat):
+            ctx['n'] = next(counter)
+            request_ctx = {**ctx, **(scenario.setup(ctx) if scenario.setup else {})}
+            kwargs = {'path': scenario.path.format(**request_ctx)}
+            if scenario.data is not None:
+                kwargs.update(data=json.dumps(scenario.data(request_ctx)), content_type='application/json')
+            if scenario.auth:
+                kwargs['HTTP_AUTHORIZATION'] = ctx['token']
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                started = time.perf_counter()
+                response = getattr(client, scenario.method)(**kwargs)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            if response.status_code != scenario.status:
+                body = b'' if response.streaming else response.content[:300]
+                raise CommandError(
+                    f'{label(scenario)} answered {response.status_code}, expected {scenario.status}: {body!r}'
+                )
+            if iteration >= options['warmup']:
+                samples.append(elapsed)
+                queries += len(recorder.queries)
+        ctx['n'] = next(counter)
+        stats = summarize(samples)
+        return {
+            'requests': len(samples),
+            'rps': round(len(samples) / sum(samples), 1),
+            'p50_ms': round(stats['p50_ms'], 3),
+            'p95_ms': round(stats['p95_ms'], 3),
+            'p99_ms': round(stats['p99_ms'], 3),
+            'queries': round(queries / len(samples), 2),
+        }
+
+    def format_result(self, name, result, note=''):
+        return (
+            f"{name:<44} {result['rps']:>8.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+            f"{result['p99_ms']:>8.2f} {result['queries']:>8.2f}{note}"
+        )
+
+    def compare(self, report, options):
+        with open(options['baseline']) as baseline:
+            baseline = json.load(baseline)
+        self.stdout.write(f"\nCompared with {options['baseline']} ({baseline['environment']['created']}):")
+        if baseline['environment']['dataset'] != report['environment']['dataset']:
+            self.stdout.write(self.style.WARNING(
+                f"Dataset differs from the baseline's {baseline['environment']['dataset']}; "
+                'latencies are not comparable.'
+            ))
+        regressions = []
+        for name, result in report['scenarios'].items():
+            before = baseline['scenarios'].get(name)
+            if before is None:
+                self.stdout.write(f'{name:<44} new')
+                continue
+            problems = []
+            if result['queries'] > before['queries'] + 0.5:
+                problems.append(f"queries {before['queries']:g} -> {result['queries']:g}")
+            if (result['p95_ms'] > before['p95_ms'] * (1 + options['tolerance'])
+                    and result['p95_ms'] - before['p95_ms'] > MIN_LATENCY_REGRESSION_MS):
+                problems.append(f"p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+            line = f"{name:<44} p95 {change:+7.1%}  queries {result['queries'] - before['queries']:+.2f}"
+            if problems:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f"{line}  REGRESSION: {'; '.join(problems)}"))
+            else:
+                self.stdout.write(line)
+        if regressions and options['check']:
+            raise CommandError(f'{len(regressions)} scenario(s) regressed: {", ".join(regressions)}')
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,90 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+from blog.models import BlogPost, Category, Tag
+from blog.views import BlogPostViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream the post export at two sizes on temporary data (rolled back '
+        'afterwards) and fail if peak memory grows with the number of rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs=2, default=[10000, 100000])
+        parser.add_argument('--tags-per-post', type=int, default=3)
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument(
+            '--max-growth', type=float, default=1.5,
+            help='Largest allowed ratio between the peaks of the large and small export'
+        )
+
+    def handle(self, *args, **options):
+        small, large = sorted(options['rows'])
+        view = BlogPostViewSet.as_view({'get': 'export'}, **BlogPostViewSet.export.kwargs)
+        factory = APIRequestFactory(HTTP_HOST='localhost')
+        peaks = {}
+        with transaction.atomic():
+            author = User.objects.create_user(username='bench-export-author')
+            category = Category.objects.create(name='bench-export-category')
+            tags = Tag.objects.bulk_create(
+                Tag(name=f'bench-export-tag-{index}') for index in range(20)
+            )
+            seeded = 0
+            for rows in (small, large):
+                self.seed(rows - seeded, author, category, tags, options['tags_per_post'])
+                seeded = rows
+                request = factory.get('/', {'format': options['format']})
+                peaks[rows] = self.measure(view, request, rows)
+            transaction.set_rollback(True)
+
+        growth = peaks[large] / peaks[small]
+        if growth > options['max_growth']:
+            raise CommandError(
+                f'Peak memory grew {growth:.2f}x from {small} to {large} rows '
+                f'(allowed {options["max_growth"]:.2f}x)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Peak memory growth {growth:.2f}x'))
+
+    def seed(self, count, author, category, tags, tags_per_post):
+        posts = BlogPost.objects.bulk_create(
+            BlogPost(
+                title=f'Export post {index}', content='lorem ipsum dolor sit amet ' * 40,
+                author=author, category=category, status=BlogPost.Status.PUBLISHED,
+            )
+            for index in range(count)
+        )
+        through = BlogPost.tags.through
+        through.objects.bulk_create(
+            through(blogpost_id=post.pk, tag_id=tags[(post.pk + offset) % len(tags)].pk)
+            for post in posts
+            for offset in range(tags_per_post)
+        )
+
+    def measure(self, view, request, rows):
+        # Timed and traced separately: tracemalloc slows the stream severalfold.
+        started = time.perf_counter()
+        lines, size = self.consume(view(request))
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        self.consume(view(request))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{rows:>9} rows  {lines:>9} lines  {size / 1024 / 1024:8.1f} MiB streamed  '
+            f'{rows / elapsed:8.0f} rows/s  peak {peak / 1024 / 1024:6.1f} MiB'
+        )
+        return peak
+
+    def consume(self, response):
+        lines = size = 0
+        for chunk in response.streaming_content:
+            lines += chunk.count(b'\n')
+            size += len(chunk)
+        return lines, size
@@ -0,0 +1,122 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from blog.benchmarks import format_row, time_calls
+from blog.models import BlogPost, Tag
+from postflow.instrumentation import InstrumentationMiddleware, request_metrics, span
+
+# Spans a disabled request passes through, rounded well up.
+HOOKS_PER_REQUEST = 10
+# What disabled hooks may add to a request, as a fraction of its p50.
+MAX_DISABLED_OVERHEAD = 0.01
+URL = '/api/blog/posts/'
+
+
+def instrumentation(enabled):
+    return override_settings(
+        REQUEST_INSTRUMENTATION={**getattr(settings, 'REQUEST_INSTRUMENTATION', {}), 'ENABLED': enabled},
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed posts (rolled back afterwards), check that disabled request '
+        'instrumentation adds no measurable cost and that enabled '
+        'instrumentation reports every query, and time the post list both ways.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with override_settings(
+            BLOG_RESPONSE_CACHE={'ENABLED': False},
+            BLOG_QUERY_BUDGET={'ENABLED': False},
+        ), transaction.atomic():
+            self.seed(options['posts'])
+            with instrumentation(False):
+                self.check_disabled(options['repeat'])
+            with instrumentation(True):
+                self.check_enabled(options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        author = User.objects.create_user(username='bench-instrumentation-author')
+        tags = Tag.objects.bulk_create([Tag(name=f'bench-instrumentation-{index}') for index in range(5)])
+        posts = BlogPost.objects.bulk_create([
+            BlogPost(
+                title=f'Instrumentation benchmark post {index}',
+                content='Instrumentation benchmark content. ' * 3,
+                author=author,
+                status=BlogPost.Status.PUBLISHED,
+            )
+            for index in range(count)
+        ])
+        through = BlogPost.tags.through
+        through.objects.bulk_create([
+            through(blogpost_id=post.pk, tag_id=tag.pk) for post in posts for tag in tags[:post.pk % 4]
+        ])
+
+    def get(self, client):
+        response = client.get(URL)
+        if response.status_code != 200:
+            raise CommandError(f'{URL} answered {response.status_code}')
+        return response
+
+    def check_disabled(self, repeat):
+        try:
+            InstrumentationMiddleware(lambda request: None)
+        except MiddlewareNotUsed:
+            pass
+        else:
+            raise CommandError('Disabled InstrumentationMiddleware stays in the middleware chain')
+        client = Client(HTTP_HOST='localhost')
+        if self.get(client).has_header('Server-Timing'):
+            raise CommandError('Disabled instrumentation sent a Server-Timing header')
+
+        request = time_calls(lambda: self.get(client), repeat=repeat)
+        self.stdout.write(format_row('post list, instrumentation off', request))
+        calls = 100_000
+        started = time.perf_counter()
+        for _ in range(calls):
+            with span('serialize'):
+                pass
+        hook = (time.perf_counter() - started) / calls * 1000
+        overhead = hook * HOOKS_PER_REQUEST / request['p50_ms']
+        self.stdout.write(
+            f'disabled hook: {hook * 1e6:.0f} ns, {overhead:.4%} of a request '
+            f'at {HOOKS_PER_REQUEST} hooks per request'
+        )
+        if overhead > MAX_DISABLED_OVERHEAD:
+            raise CommandError(f'Disabled instrumentation costs {overhead:.2%} of a request')
+        self.stdout.write(self.style.SUCCESS('Disabled instrumentation adds no measurable cost'))
+
+    def check_enabled(self, repeat):
+        client = Client(HTTP_HOST='localhost')
+        request_metrics.reset()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(client)
+        timing = dict(
+            metric.split(';', 1) for metric in response['Server-Timing'].split(', ')
+        )
+        expected = f'desc="{len(queries.captured_queries)} queries"'
+        if not timing.get('db', '').endswith(expected):
+            raise CommandError(f'Server-Timing db is {timing.get("db")!r}, expected {expected}')
+        missing = {'total', 'db-slowest', 'auth', 'serialize', 'size'} - set(timing)
+        if missing:
+            raise CommandError(f'Server-Timing lacks {", ".join(sorted(missing))}: {response["Server-Timing"]}')
+        self.stdout.write(f'Server-Timing: {response["Server-Timing"]}')
+
+        self.stdout.write(format_row('post list, instrumentation on', time_calls(lambda: self.get(client), repeat=repeat)))
+        metrics = request_metrics.snapshot().get('GET post-list')
+        if metrics is None or metrics['requests'] != repeat + 3:
+            raise CommandError(f'request_metrics recorded {metrics and metrics["requests"]} post list requests')
+        self.stdout.write(f"request_metrics: p50/p95/p99 {metrics['total_ms']}")
+        self.stdout.write(self.style.SUCCESS('Enabled instrumentation reports every query'))
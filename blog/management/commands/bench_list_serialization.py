@@ -0,0 +1,110 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from blog.models import BlogPost, Category, Tag
+from blog.rows import list_values, post_list_data
+from blog.serializers import BlogPostListSerializer
+
+CONTRACT_URLS = (
+    '/api/blog/posts/',
+    '/api/blog/posts/?page=2',
+    '/api/blog/posts/?page_size=100&ordering=title',
+    '/api/blog/posts/?pagination=cursor',
+    '/api/blog/posts/?q=lorem',
+    '/api/blog/posts/?tags=bench-list-tag-1,bench-list-tag-2',
+    '/api/blog/posts/?status=draft',
+    '/api/blog/posts/recent/',
+    '/api/blog/posts/featured/',
+    '/api/blog/posts/my_posts/',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that the fast list path renders byte-identical JSON to '
+        'BlogPostListSerializer, then compare their throughput, on temporary '
+        'data (rolled back afterwards).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            author = self.seed(options['posts'])
+            self.check_contract(author)
+            for label, render in (
+                ('serializer', self.render_serializer),
+                ('values()', self.render_values),
+            ):
+                self.measure(label, render, options['page_size'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        author = User.objects.create_user(
+            username='bench-list-author', first_name='Zoë', last_name='O"Brien', is_staff=True
+        )
+        categories = [
+            Category.objects.create(name=f'bench-list-category-{index}', description='Ünïcode ✓')
+            for index in range(5)
+        ]
+        tags = [Tag.objects.create(name=f'bench-list-tag-{index}') for index in range(20)]
+        posts = BlogPost.objects.bulk_create(
+            BlogPost(
+                title=f'Benchmark post {index}', content='lorem ipsum dolor sit amet ' * 20,
+                author=author,
+                category=categories[index % 5] if index % 7 else None,
+                status=BlogPost.Status.PUBLISHED if index % 3 else BlogPost.Status.DRAFT,
+                is_featured=index % 11 == 0,
+            )
+            for index in range(count)
+        )
+        through = BlogPost.tags.through
+        through.objects.bulk_create(
+            through(blogpost_id=post.pk, tag_id=tags[(post.pk * offset) % 20].pk)
+            for post in posts
+            for offset in range(post.pk % 4)
+        )
+        return author
+
+    def check_contract(self, author):
+        client = APIClient()
+        client.force_authenticate(author)
+        with override_settings(BLOG_RESPONSE_CACHE={'ENABLED': False}):
+            for url in CONTRACT_URLS:
+                bodies = []
+                for fast in (False, True):
+                    with override_settings(BLOG_FAST_LIST_SERIALIZATION=fast):
+                        response = client.get(url, HTTP_HOST='localhost')
+                    bodies.append((response.status_code, response.content))
+                if bodies[0] != bodies[1]:
+                    raise CommandError(f'Fast list output differs from the serializer for {url}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(CONTRACT_URLS)} list responses byte-identical on both paths'
+        ))
+
+    def render_serializer(self, queryset):
+        return BlogPostListSerializer(queryset.for_list(), many=True).data
+
+    def render_values(self, queryset):
+        return post_list_data(list_values(queryset))
+
+    def measure(self, label, render, page_size, repeat):
+        queryset = BlogPost.objects.order_by('pk')
+        total = queryset.count()
+        rows = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for offset in range(0, total, page_size):
+                data = render(queryset[offset:offset + page_size])
+                JSONRenderer().render(data)
+                rows += len(data)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:<12} {rows / elapsed:10.0f} rows/s')
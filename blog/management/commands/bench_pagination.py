@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.test import RequestFactory
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from blog.benchmarks import format_row, time_calls
+from blog.models import BlogPost
+from blog.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    help = 'Compare page-number and keyset pagination latency at increasing depth.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 1000, 10000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        queryset = BlogPost.objects.using(options['database']).filter(status='published')
+        factory = RequestFactory(HTTP_HOST='localhost')
+        page_size = KeysetPagination.page_size
+        total = queryset.count()
+        self.stdout.write(f'{total} published posts, page size {page_size}')
+
+        for page in options['pages']:
+            if (page - 1) * page_size >= total:
+                self.stdout.write(f'page {page}: not enough posts, skipped')
+                continue
+
+            request = Request(factory.get('/', {'page': page}))
+            stats = time_calls(
+                lambda: PageNumberPagination().paginate_queryset(queryset, request),
+                repeat=options['repeat']
+            )
+            self.stdout.write(format_row(f'page-number page {page}', stats))
+
+            # Build the cursor a keyset client would hold on this page (untimed).
+            params = {}
+            if page > 1:
+                ordered = queryset.order_by(*KeysetPagination.forward_ordering)
+                params['cursor'] = KeysetPagination.cursor_for(ordered[(page - 1) * page_size - 1])
+            request = Request(factory.get('/', params))
+            stats = time_calls(
+                lambda: KeysetPagination().paginate_queryset(queryset, request),
+                repeat=options['repeat']
+            )
+            self.stdout.write(format_row(f'keyset page {page}', stats))
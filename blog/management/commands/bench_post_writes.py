@@ -0,0 +1,88 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework import serializers
+from blog.models import Category, Tag
+from blog.query_budget import QueryRecorder
+from blog.serializers import BlogPostDetailSerializer
+
+
+class PerIdBlogPostSerializer(BlogPostDetailSerializer):
+    """
+    The previous field setup: one SELECT per tag id, tags re-fetched to render.
+    """
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
+    tags = serializers.PrimaryKeyRelatedField(
+        queryset=Tag.objects.all(), many=True, required=False
+    )
+
+    def create(self, validated_data):
+        return serializers.ModelSerializer.create(self, validated_data)
+
+    def update(self, instance, validated_data):
+        return serializers.ModelSerializer.update(self, instance, validated_data)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure post create/update throughput and queries per write as the '
+        'number of tags per post grows, on temporary data (rolled back afterwards).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', type=int, nargs='+', default=[0, 1, 10, 30, 100])
+        parser.add_argument('--posts', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            author = User.objects.create_user(username='bench-writes-author')
+            category = Category.objects.create(name='bench-writes-category')
+            tags = Tag.objects.bulk_create(
+                Tag(name=f'bench-writes-tag-{index}') for index in range(max(options['tags']))
+            )
+            for tag_count in options['tags']:
+                tag_ids = [tag.pk for tag in tags[:tag_count]]
+                for label, serializer_class in (
+                    ('per-id', PerIdBlogPostSerializer),
+                    ('bulk', BlogPostDetailSerializer),
+                ):
+                    self.measure(
+                        f'{tag_count:>4} tags {label:<7}', serializer_class,
+                        author, category, tag_ids, options['posts']
+                    )
+            transaction.set_rollback(True)
+
+    def measure(self, label, serializer_class, author, category, tag_ids, count):
+        data = {'title': 'Benchmark post', 'content': 'x' * 200, 'category': category.pk}
+        results = {}
+        queries = QueryRecorder()
+        with connection.execute_wrapper(queries):
+            started = time.perf_counter()
+            posts = []
+            for _ in range(count):
+                serializer = serializer_class(data={**data, 'tags': tag_ids})
+                serializer.is_valid(raise_exception=True)
+                posts.append(serializer.save(author=author))
+                serializer.data
+            results['create'] = (time.perf_counter() - started, len(queries.queries))
+
+        # Same tags in a different order: every id is validated and rendered
+        # again, while set() has nothing to change.
+        queries = QueryRecorder()
+        with connection.execute_wrapper(queries):
+            started = time.perf_counter()
+            for post in posts:
+                serializer = serializer_class(
+                    post, data={'tags': tag_ids[::-1], 'title': 'Updated post'}, partial=True
+                )
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+                serializer.data
+            results['update'] = (time.perf_counter() - started, len(queries.queries))
+
+        self.stdout.write(label + '  '.join(
+            f'  {operation} {count / elapsed:8.1f} posts/s {query_count / count:6.1f} queries/post'
+            for operation, (elapsed, query_count) in results.items()
+        ))
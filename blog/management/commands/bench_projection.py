@@ -0,0 +1,58 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.models import BlogPost, Category
+from blog.projection import project_queryset
+from blog.serializers import BlogPostListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare memory and throughput of full-row and projected post list '
+        'queries on a temporary dataset of large posts (rolled back afterwards).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--content-kb', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['posts'], options['content_kb'])
+            full = BlogPost.objects.select_related('author', 'category').prefetch_related('tags')
+            projected = project_queryset(BlogPost.objects.all(), BlogPostListSerializer)
+            for label, queryset in (('full rows', full), ('projected', projected)):
+                self.measure(label, queryset, options['page_size'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count, content_kb):
+        author = User.objects.create_user(username='bench-projection-author')
+        category = Category.objects.create(name='bench-projection-category')
+        body = ('lorem ipsum dolor sit amet ' * (content_kb * 1024 // 27 + 1))[:content_kb * 1024]
+        BlogPost.objects.bulk_create(
+            BlogPost(
+                title=f'Benchmark post {index}', content=body, author=author,
+                category=category, status=BlogPost.Status.PUBLISHED,
+            )
+            for index in range(count)
+        )
+
+    def measure(self, label, queryset, page_size, repeat):
+        rows = 0
+        started = time.perf_counter()
+        tracemalloc.start()
+        for _ in range(repeat):
+            for offset in range(0, queryset.count(), page_size):
+                page = queryset.order_by('pk')[offset:offset + page_size]
+                rows += len(BlogPostListSerializer(page, many=True).data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label:<12} {rows / elapsed:10.0f} rows/s  peak {peak / 1024 / 1024:8.1f} MiB'
+        )
@@ -0,0 +1,144 @@
+import itertools
+import math
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+from blog.benchmarks import format_row, summarize, time_calls
+from blog.models import BlogPost, RelatedPost, Tag
+from blog.related import load_posts, rebuild_related_posts, related_setting, update_related_posts
+from blog.similarity import RelatedIndex, tokenize
+from blog.views import BlogPostViewSet
+
+SEED_BATCH_SIZE = 2000
+WORDS_PER_POST = 80
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed published posts with Zipf-distributed text and random tags '
+        '(rolled back afterwards), check the vectorized scores against a '
+        'direct computation, and time index builds, incremental updates and '
+        'related-post lookups.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10_000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--vocabulary', type=int, default=5000)
+        parser.add_argument('--builds', type=int, default=5)
+        parser.add_argument('--updates', type=int, default=20)
+        parser.add_argument('--lookups', type=int, default=200)
+
+    def handle(self, *args, **options):
+        # Keep the saved index of the real posts out of this.
+        with override_settings(
+            BLOG_RELATED={**getattr(settings, 'BLOG_RELATED', {}), 'INDEX_PATH': None, 'UPDATE_DELAY': 0},
+            BLOG_RESPONSE_CACHE={'ENABLED': False},
+        ), transaction.atomic():
+            self.rng = random.Random(0)
+            self.seed(options['posts'], options['tags'], options['vocabulary'])
+            data = load_posts()
+            self.stdout.write(format_row(
+                f"index build, {options['posts']:,} posts",
+                time_calls(lambda: list(RelatedIndex.fit(*data).neighbors(range(len(data[0])))),
+                           repeat=options['builds'], warmup=0),
+            ))
+            started = time.perf_counter()
+            index = rebuild_related_posts()
+            self.stdout.write(f'rebuild with reads and writes: {time.perf_counter() - started:.2f}s')
+            self.check_scores(index, data)
+            self.time_updates(index, options['updates'])
+            self.time_lookups(index, options['lookups'])
+            transaction.set_rollback(True)
+
+    def seed(self, count, tag_count, vocabulary):
+        started = time.perf_counter()
+        author = User.objects.create_user(username='bench-related-author')
+        tags = Tag.objects.bulk_create([Tag(name=f'bench-related-{index}') for index in range(tag_count)])
+        words = [f'word{index}' for index in range(vocabulary)]
+        weights = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+        through = BlogPost.tags.through
+        for offset in range(0, count, SEED_BATCH_SIZE):
+            posts = BlogPost.objects.bulk_create([
+                BlogPost(
+                    title=' '.join(self.rng.choices(words, cum_weights=weights, k=5)),
+                    content=' '.join(self.rng.choices(words, cum_weights=weights, k=WORDS_PER_POST)),
+                    author=author,
+                    status=BlogPost.Status.PUBLISHED,
+                )
+                for _ in range(min(SEED_BATCH_SIZE, count - offset))
+            ])
+            through.objects.bulk_create([
+                through(blogpost_id=post.pk, tag_id=tag.pk)
+                for post in posts for tag in self.rng.sample(tags, self.rng.randint(0, 5))
+            ])
+        self.stdout.write(f'Seeded {count:,} posts in {time.perf_counter() - started:.1f}s')
+
+    def check_scores(self, index, data):
+        ids, texts, tag_lists = data
+        weights = [self.weights(text, index) for text in texts]
+        for row in self.rng.sample(range(len(ids)), 20):
+            scores = index.similarities([row])[0]
+            for other in self.rng.sample(range(len(ids)), 50):
+                if other == row:
+                    continue
+                shared = set(tag_lists[row]) & set(tag_lists[other])
+                union = set(tag_lists[row]) | set(tag_lists[other])
+                cosine = sum(value * weights[other].get(term, 0) for term, value in weights[row].items())
+                expected = (
+                    related_setting('TEXT_WEIGHT') * cosine
+                    + related_setting('TAG_WEIGHT') * (len(shared) / len(union) if union else 0)
+                )
+                if not math.isclose(scores[other], expected, rel_tol=1e-9, abs_tol=1e-12):
+                    raise CommandError(
+                        f'Score of posts {ids[row]} and {ids[other]} is {scores[other]}, expected {expected}'
+                    )
+        for post_id in self.rng.sample(ids, 20):
+            stored = list(RelatedPost.objects.filter(post_id=post_id).order_by('-score').values_list('score', flat=True))
+            best = sorted((score for score in index.similarities([index.rows[post_id]])[0] if score > 0), reverse=True)
+            best = best[:related_setting('NEIGHBORS')]
+            if len(stored) != len(best) or not all(map(math.isclose, stored, best)):
+                raise CommandError(f'Stored list of post {post_id} is not its best neighbours')
+        self.stdout.write(self.style.SUCCESS('Vectorized scores and stored lists match a direct computation'))
+
+    def weights(self, text, index):
+        """
+        Unit-length TF-IDF weights of ``text``, one term at a time.
+        """
+        weights = {
+            term: (1 + math.log(count)) * index.idf[index.columns[term]]
+            for term, count in Counter(tokenize(text)).items() if term in index.columns
+        }
+        norm = math.sqrt(sum(value * value for value in weights.values()))
+        return {term: value / norm for term, value in weights.items()} if norm else {}
+
+    def time_updates(self, index, count):
+        samples = []
+        for post in BlogPost.objects.order_by('?')[:count]:
+            post.content += ' ' + ' '.join(self.rng.sample(index.terms, 20))
+            post.save()
+            started = time.perf_counter()
+            update_related_posts([post.pk])
+            samples.append(time.perf_counter() - started)
+        self.stdout.write(format_row('incremental update, 1 post', summarize(samples)))
+
+    def time_lookups(self, index, count):
+        factory = APIRequestFactory(HTTP_HOST='localhost')
+        view = BlogPostViewSet.as_view({'get': 'related'})
+        post_ids = itertools.cycle(self.rng.sample(list(index.rows), min(count, len(index.rows))))
+
+        def lookup():
+            pk = next(post_ids)
+            response = view(factory.get(f'/api/blog/posts/{pk}/related/'), pk=pk)
+            if response.status_code != 200:
+                raise CommandError(f'related answered {response.status_code} for post {pk}')
+            response.render()
+
+        self.stdout.write(format_row('related lookup (view, uncached)', time_calls(lookup, repeat=count)))
@@ -0,0 +1,111 @@
+import io
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, TestCase
+from django.test.utils import override_settings
+from blog.benchmarks import format_row, time_calls
+from blog.models import BlogPost
+from blog.rendering import html_is_stale, render_html, stale_posts
+
+POST_MARKDOWN = """## Section {index}
+
+Some *emphasis*, **strong** text and a [link](https://example.com/{index}).
+
+1. first item
+2. second item
+
+| name | value |
+|:-----|------:|
+| row  | {index} |
+
+```python
+print({index})
+```
+
+<script>alert({index})</script> <img src="x.png" onerror="alert(1)"> [bad](javascript:alert(1))
+"""
+UNSAFE = ('<script', 'onerror', 'javascript:')
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed posts with Markdown content (rolled back afterwards), check that '
+        'rendered HTML is sanitized, served with ?format=html and re-rendered '
+        'after edits, and time rendering, retrieval and rerender_posts with '
+        'and without a process pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--sections', type=int, default=8, help='Markdown sections per post')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with override_settings(
+            BLOG_TASKS={**getattr(settings, 'BLOG_TASKS', {}), 'RUN_IN_PROCESS': True, 'IN_PROCESS_DELAY': 0},
+            BLOG_RESPONSE_CACHE={'ENABLED': False},
+        ), transaction.atomic():
+            posts = self.seed(options['posts'], options['sections'])
+            self.stdout.write(format_row(
+                'render one post', time_calls(lambda: render_html(posts[0].content), repeat=options['repeat']),
+            ))
+            self.time_rerender(options['workers'])
+            self.check_responses(posts[0], options['repeat'])
+            self.check_edit(posts[1])
+            transaction.set_rollback(True)
+
+    def seed(self, count, sections):
+        author = User.objects.create_user(username='bench-rendering-author')
+        return BlogPost.objects.bulk_create([
+            BlogPost(
+                title=f'Rendering benchmark post {index}',
+                content='\n'.join(POST_MARKDOWN.format(index=index + section) for section in range(sections)),
+                author=author,
+                status=BlogPost.Status.PUBLISHED,
+            )
+            for index in range(count)
+        ])
+
+    def time_rerender(self, workers):
+        timings = {}
+        for label, count in (('in process', 0), (f'{workers} workers', workers)):
+            started = time.perf_counter()
+            call_command('rerender_posts', all=True, workers=count, stdout=io.StringIO())
+            timings[label] = time.perf_counter() - started
+            self.stdout.write(f'rerender_posts --all, {label}: {timings[label]:.2f}s')
+        if stale_posts(BlogPost.objects.all()).exists():
+            raise CommandError('rerender_posts left posts with stale HTML')
+        self.stdout.write(f"process pool speedup: {timings['in process'] / timings[f'{workers} workers']:.1f}x")
+
+    def check_responses(self, post, repeat):
+        client = Client(HTTP_HOST='localhost')
+        url = f'/api/blog/posts/{post.pk}/'
+        html = client.get(url).json()['content_html']
+        response = client.get(f'{url}?format=html')
+        if response.status_code != 200 or not response['Content-Type'].startswith('text/html'):
+            raise CommandError(f'?format=html answered {response.status_code} {response["Content-Type"]}')
+        if response.content.decode() != html:
+            raise CommandError('?format=html differs from content_html')
+        if '<h2>' not in html or '<table>' not in html:
+            raise CommandError(f'Markdown was not rendered: {html[:200]!r}')
+        unsafe = [marker for marker in UNSAFE if marker in html]
+        if unsafe:
+            raise CommandError(f'Rendered HTML keeps {", ".join(unsafe)}')
+        self.stdout.write(format_row('retrieve, stored HTML', time_calls(lambda: client.get(url), repeat=repeat)))
+        self.stdout.write(self.style.SUCCESS('Rendered HTML is sanitized and served with ?format=html'))
+
+    def check_edit(self, post):
+        post.content += '\n\nAn *edited* paragraph.'
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            post.save()
+        post.refresh_from_db()
+        if html_is_stale(post) or '<em>edited</em>' not in post.content_html:
+            raise CommandError('Saving new content did not re-render the post')
+        self.stdout.write(self.style.SUCCESS('Edits are re-rendered after commit'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from blog.benchmarks import format_row, time_calls
+from blog.models import BlogPost
+from blog.search import IContainsSearchBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Compare search latency of the full-text index against the icontains scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=['django', 'python tutorial'])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        page_size = options['page_size']
+        backends = [
+            ('icontains', IContainsSearchBackend(connections[using])),
+            ('indexed', get_search_backend(using)),
+        ]
+        base = BlogPost.objects.using(using).select_related('author', 'category')
+        self.stdout.write(f'{base.count()} posts, {options["repeat"]} runs per case')
+
+        for query in options['queries']:
+            for label, backend in backends:
+                def run():
+                    queryset = backend.search(base, query)
+                    queryset.count()
+                    list(queryset.order_by('-search_rank')[:page_size])
+                stats = time_calls(run, repeat=options['repeat'])
+                self.stdout.write(format_row(f'{label} "{query}"', stats))
@@ -0,0 +1,94 @@
+import itertools
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from blog.benchmarks import format_row, time_calls
+from blog.filters import BlogPostFilter
+from blog.models import BlogPost, Tag
+
+SEED_BATCH_SIZE = 5000
+
+
+def joined_posts(names, match_all):
+    """
+    The tag filter as it was: joins through tag names, then DISTINCT.
+    """
+    posts = BlogPost.objects.all()
+    if match_all:
+        for name in names:
+            posts = posts.filter(tags__name=name)
+    else:
+        posts = posts.filter(tags__name__in=names)
+    return posts.distinct()
+
+
+def filtered_posts(names, match_all):
+    data = {'tags': ','.join(names), 'tags_mode': 'all' if match_all else 'any'}
+    return BlogPostFilter(data, queryset=BlogPost.objects.all()).qs
+
+
+def first_page(posts):
+    # What the list endpoint runs: a count and the first page.
+    posts.count()
+    list(posts.order_by('-published_date').values_list('pk', flat=True)[:10])
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed posts with Zipf-distributed tags (rolled back afterwards), check '
+        'that ?tags= with tags_mode=any|all matches the joined queries, and '
+        'time both for 1 to 10 tags.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--max-tags', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rng = random.Random(0)
+            names = self.seed(rng, options['posts'], options['tags'])
+            for count, match_all in itertools.product(range(1, options['max_tags'] + 1), (False, True)):
+                # Among the more common tags, so "all" still matches some posts.
+                chosen = rng.sample(names[:max(count, 20)], count)
+                expected = set(joined_posts(chosen, match_all).values_list('pk', flat=True))
+                matched = set(filtered_posts(chosen, match_all).values_list('pk', flat=True))
+                if matched != expected:
+                    raise CommandError(f'{chosen} (all={match_all}): {len(matched)} posts, expected {len(expected)}')
+                mode = 'all' if match_all else 'any'
+                for label, build in (('join + DISTINCT', joined_posts), ('tag ids', filtered_posts)):
+                    stats = time_calls(lambda: first_page(build(chosen, match_all)), repeat=options['repeat'])
+                    self.stdout.write(format_row(f'{count} tags, {mode}, {label} ({len(expected)})', stats))
+            transaction.set_rollback(True)
+
+    def seed(self, rng, count, tag_count):
+        started = time.perf_counter()
+        author = User.objects.create_user(username='bench-tag-filters-author')
+        tags = Tag.objects.bulk_create([Tag(name=f'bench-tag-{index}') for index in range(tag_count)])
+        weights = list(itertools.accumulate(1 / rank for rank in range(1, tag_count + 1)))
+        through = BlogPost.tags.through
+        links = 0
+        for offset in range(0, count, SEED_BATCH_SIZE):
+            posts = BlogPost.objects.bulk_create([
+                BlogPost(
+                    title='Tag filter benchmark post',
+                    content='Tag filter benchmark content. ' * 3,
+                    author=author,
+                    status=BlogPost.Status.PUBLISHED,
+                )
+                for _ in range(min(SEED_BATCH_SIZE, count - offset))
+            ])
+            rows = [
+                through(blogpost_id=post.pk, tag_id=tag.pk)
+                for post in posts
+                for tag in set(rng.choices(tags, cum_weights=weights, k=rng.randint(2, 8)))
+            ]
+            through.objects.bulk_create(rows)
+            links += len(rows)
+        self.stdout.write(f'Seeded {count:,} posts with {links:,} tag links in {time.perf_counter() - started:.1f}s')
+        return [tag.name for tag in tags]
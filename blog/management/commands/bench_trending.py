@@ -0,0 +1,103 @@
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from blog.benchmarks import format_row, time_calls
+from blog.models import BlogPost, Category, TrendingScore
+from blog.trending import record_trending_views, trending_post_ids, view_score
+
+SEED_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed published posts with trending scores (rolled back afterwards), '
+        'check that incremental updates match the decayed view sum, and time '
+        'top-N reads against sorting the posts table by view count.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--flush-size', type=int, default=1000, help='Posts per timed view flush')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            category_ids = self.seed(options['posts'], options['categories'])
+            self.check_incremental()
+            self.time_reads(category_ids[0], options['limit'], options['repeat'])
+            self.time_flush(options['posts'], options['flush_size'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count, categories):
+        started = time.perf_counter()
+        author = User.objects.create_user(username='bench-trending-author')
+        category_ids = [
+            Category.objects.create(name=f'bench-trending-{index}').pk for index in range(categories)
+        ]
+        now = timezone.now()
+        rng = random.Random(0)
+        for offset in range(0, count, SEED_BATCH_SIZE):
+            posts = BlogPost.objects.bulk_create([
+                BlogPost(
+                    title=f'Trending benchmark post {offset + index}',
+                    content='Trending benchmark content. ' * 3,
+                    author=author,
+                    category_id=rng.choice(category_ids),
+                    status=BlogPost.Status.PUBLISHED,
+                    published_date=now,
+                    view_count=rng.randint(1, 10_000),
+                )
+                for index in range(min(SEED_BATCH_SIZE, count - offset))
+            ])
+            TrendingScore.objects.bulk_create([
+                TrendingScore(
+                    post_id=post.pk,
+                    category_id=post.category_id,
+                    score=view_score(post.view_count, now - timedelta(seconds=rng.uniform(0, 7 * 86400))),
+                )
+                for post in posts
+            ])
+        self.stdout.write(f'Seeded {count:,} scored posts in {time.perf_counter() - started:.1f}s')
+        return category_ids
+
+    def check_incremental(self):
+        post = BlogPost.objects.published().filter(trending_score__isnull=False).first()
+        terms = [TrendingScore.objects.get(post=post).score]
+        now = timezone.now()
+        for views, at in ((3, now), (5, now + timedelta(hours=1))):
+            record_trending_views({post.pk: views}, at=at)
+            terms.append(view_score(views, at))
+        peak = max(terms)
+        expected = peak + math.log(sum(math.exp(term - peak) for term in terms))
+        score = TrendingScore.objects.get(post=post).score
+        if not math.isclose(score, expected, rel_tol=1e-9):
+            raise CommandError(f'Incremental score {score} differs from the decayed sum {expected}')
+        self.stdout.write(self.style.SUCCESS('Incremental updates match the decayed view sum'))
+
+    def time_reads(self, category_id, limit, repeat):
+        for label, func in (
+            (f'trending top {limit}', lambda: list(trending_post_ids(limit=limit))),
+            (f'trending top {limit} in a category', lambda: list(trending_post_ids(category_id, limit))),
+            (f'top {limit} by view_count (scan)', lambda: list(
+                BlogPost.objects.published().order_by('-view_count').values_list('pk', flat=True)[:limit]
+            )),
+        ):
+            self.stdout.write(format_row(label, time_calls(func, repeat=repeat)))
+
+    def time_flush(self, count, flush_size, repeat):
+        post_ids = list(TrendingScore.objects.values_list('post_id', flat=True)[:count])
+        rng = random.Random(1)
+
+        def flush():
+            batch = rng.sample(post_ids, min(flush_size, len(post_ids)))
+            record_trending_views({pk: rng.randint(1, 5) for pk in batch})
+
+        self.stdout.write(format_row(f'score update, {flush_size} posts', time_calls(flush, repeat=repeat)))
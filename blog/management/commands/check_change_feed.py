@@ -0,0 +1,299 @@
+import json
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.test import AsyncRequestFactory, Client
+from django.test.utils import override_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import RefreshToken
+from blog.async_views import AsyncChangeViewSet
+from blog.bulk import write_posts
+from blog.changes import CATEGORY_FIELDS, TAG_FIELDS, compact_changes, label_states, post_states
+from blog.models import BlogPost, Category, Change, Tag
+from blog.views import ChangeViewSet
+
+URL = '/api/blog/changes/'
+CONTENT = 'Change feed check content, long enough to pass validation. '
+
+
+def database_state(user):
+    """
+    Everything ``user`` can see, as the feed serves it, from the tables.
+    """
+    state = {
+        Change.Kind.POST: post_states(BlogPost.objects.visible_to(user or AnonymousUser())),
+        Change.Kind.CATEGORY: label_states(Category.objects.all(), CATEGORY_FIELDS),
+        Change.Kind.TAG: label_states(Tag.objects.all(), TAG_FIELDS),
+    }
+    return json.loads(json.dumps(state, cls=JSONEncoder))
+
+
+def apply_page(state, page):
+    """
+    Apply the changes of a feed page to ``state``, as a client would.
+    """
+    for change in page['changes']:
+        objects = state.setdefault(change['type'], {})
+        if change['action'] == Change.Action.DELETE:
+            objects.pop(str(change['id']), None)
+        else:
+            objects[str(change['id'])] = change['data']
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed posts, categories and tags (rolled back afterwards), note the '
+        'feed cursor, apply random creates, edits, status changes, retags, '
+        'bulk writes and deletes, then replay the feed onto a snapshot taken '
+        'at the cursor as an anonymous reader, an author and staff. Fails '
+        'unless every replay reproduces the database, before and after '
+        'compaction, unless full syncs behave, and unless only the async '
+        'feed long-polls.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--operations', type=int, default=300)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with override_settings(
+            BLOG_RESPONSE_CACHE={'ENABLED': False},
+            BLOG_QUERY_BUDGET={'ENABLED': False},
+            BLOG_CHANGES={**getattr(settings, 'BLOG_CHANGES', {}), 'COMPACT_EVERY': 0},
+        ), transaction.atomic():
+            self.rng = random.Random(options['random_seed'])
+            self.page_size = options['page_size']
+            self.seed(options['posts'])
+            viewers = {
+                'anonymous': None,
+                'author': self.authors[0],
+                'staff': User.objects.create_user(username='check-change-feed-staff', is_staff=True),
+            }
+            snapshots = {name: self.start(name, user) for name, user in viewers.items()}
+
+            half = options['operations'] // 2
+            self.mutate(half)
+            deleted, _ = compact_changes()
+            self.stdout.write(f'compaction halfway: {deleted:,} superseded rows deleted')
+            self.mutate(options['operations'] - half)
+            for name, user in viewers.items():
+                self.check_replay(name, user, *snapshots[name])
+
+            self.check_compaction()
+            for name, user in viewers.items():
+                self.check_replay(name, user, {}, '')
+            self.check_long_poll()
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        self.authors = [User.objects.create_user(username=f'check-change-feed-{index}') for index in range(4)]
+        self.categories = [Category.objects.create(name=f'check-change-feed-{index}') for index in range(5)]
+        self.tags = [Tag.objects.create(name=f'check-change-feed-{index}') for index in range(12)]
+        self.serial = 0
+        for _ in range(count):
+            self.create_post()
+
+    # Snapshots and replays ------------------------------------------------
+
+    def headers(self, user):
+        if user is None:
+            return {}
+        return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    def replay(self, user, state, cursor):
+        """
+        Apply the feed after ``cursor`` to ``state``; return the new cursor
+        and the number of requests and bytes it took.
+        """
+        client = Client(HTTP_HOST='localhost')
+        requests = size = 0
+        while True:
+            response = client.get(URL, {'since': cursor, 'limit': self.page_size}, **self.headers(user))
+            if response.status_code != 200:
+                raise CommandError(f'{URL} answered {response.status_code}: {response.content[:300]!r}')
+            requests += 1
+            size += len(response.content)
+            page = response.json()
+            apply_page(state, page)
+            cursor = page['cursor']
+            if not page['more']:
+                return cursor, requests, size
+
+    def start(self, name, user):
+        # A full sync from no cursor must give the same state as the tables.
+        state = {}
+        cursor, requests, size = self.replay(user, state, '')
+        self.compare(f'{name} full sync', state, database_state(user))
+        return database_state(user), cursor
+
+    def check_replay(self, name, user, snapshot, cursor):
+        state = json.loads(json.dumps(snapshot))
+        _, requests, size = self.replay(user, state, cursor)
+        expected = database_state(user)
+        self.compare(f'{name} replay from {cursor or "the start"}', state, expected)
+        objects = sum(len(objects) for objects in expected.values())
+        self.stdout.write(
+            f'{name:<10} replayed from {cursor or "the start":>6}: {requests} requests, '
+            f'{size / 1024:.1f} KiB, {objects:,} objects match'
+        )
+
+    def compare(self, label, state, expected):
+        for kind in Change.Kind.values:
+            got, want = state.get(kind, {}), expected.get(kind, {})
+            missing = sorted(set(want) - set(got), key=int)
+            extra = sorted(set(got) - set(want), key=int)
+            differing = sorted((pk for pk in set(got) & set(want) if got[pk] != want[pk]), key=int)
+            if missing or extra or differing:
+                raise CommandError(
+                    f'{label}: {kind} ids missing {missing[:10]}, extra {extra[:10]}, '
+                    f'differing {differing[:10]}'
+                )
+
+    # Writes -----------------------------------------------------------------
+
+    def create_post(self, **fields):
+        self.serial += 1
+        post = BlogPost.objects.create(
+            title=f'Change feed post {self.serial}',
+            content=CONTENT * 2,
+            author=self.rng.choice(self.authors),
+            category=self.rng.choice(self.categories + [None]),
+            status=self.rng.choice(BlogPost.Status.values),
+            **fields,
+        )
+        post.tags.set(self.rng.sample(self.tags, self.rng.randint(0, 4)))
+        return post
+
+    def random_post(self):
+        return BlogPost.objects.order_by('?').first() or self.create_post()
+
+    def mutate(self, count):
+        operations = [
+            self.create_post, self.edit_post, self.toggle_status, self.retag_post,
+            self.tag_posts, self.clear_tag, self.delete_post, self.bulk_write,
+            self.edit_label, self.replace_category, self.replace_tag, self.replace_author,
+        ]
+        weights = [6, 6, 5, 4, 2, 1, 3, 2, 2, 1, 1, 1]
+        for operation in self.rng.choices(operations, weights, k=count):
+            operation()
+
+    def edit_post(self):
+        post = self.random_post()
+        post.title = f'Edited post {self.rng.randrange(10 ** 6)}'
+        post.content = CONTENT * self.rng.randint(2, 5)
+        post.is_featured = self.rng.random() < 0.2
+        post.save()
+
+    def toggle_status(self):
+        post = self.random_post()
+        post.status = BlogPost.Status.DRAFT if post.is_published else BlogPost.Status.PUBLISHED
+        post.save()
+
+    def retag_post(self):
+        self.random_post().tags.set(self.rng.sample(self.tags, self.rng.randint(0, 4)))
+
+    def tag_posts(self):
+        tag = self.rng.choice(self.tags)
+        if self.rng.random() < 0.5:
+            tag.blog_posts.add(*BlogPost.objects.order_by('?')[:5])
+        else:
+            tag.blog_posts.remove(*tag.blog_posts.order_by('?')[:5])
+
+    def clear_tag(self):
+        self.rng.choice(self.tags).blog_posts.clear()
+
+    def delete_post(self):
+        self.random_post().delete()
+
+    def bulk_write(self):
+        items = [
+            {'title': f'Bulk post {self.rng.randrange(10 ** 6)}', 'content': CONTENT * 2,
+             'category': self.rng.choice(self.categories).pk, 'status': 'published'}
+            for _ in range(3)
+        ]
+        items += [
+            {'id': post.pk, 'title': f'Bulk edit {self.rng.randrange(10 ** 6)}',
+             'status': self.rng.choice(BlogPost.Status.values),
+             'tags': [tag.pk for tag in self.rng.sample(self.tags, 2)]}
+            for post in BlogPost.objects.order_by('?')[:3]
+        ]
+        results = write_posts(items, author=self.rng.choice(self.authors), posts=BlogPost.objects.all())
+        failed = [result for result in results if 'errors' in result]
+        if failed:
+            raise CommandError(f'Bulk write failed: {failed}')
+
+    def edit_label(self):
+        label = self.rng.choice(self.categories + self.tags)
+        label.name = f'{label.name.split(":")[0]}:{self.rng.randrange(10 ** 6)}'
+        label.save()
+
+    def replace_category(self):
+        # Posts lose the category through SET_NULL, without signals of their own.
+        index = self.rng.randrange(len(self.categories))
+        self.categories[index].delete()
+        self.serial += 1
+        self.categories[index] = Category.objects.create(name=f'check-change-feed-new-{self.serial}')
+
+    def replace_tag(self):
+        # The through rows go by cascade, without m2m_changed.
+        index = self.rng.randrange(len(self.tags))
+        self.tags[index].delete()
+        self.serial += 1
+        self.tags[index] = Tag.objects.create(name=f'check-change-feed-new-{self.serial}')
+
+    def replace_author(self):
+        # Their posts go by cascade. The author viewer, authors[0], stays.
+        index = self.rng.randrange(1, len(self.authors))
+        self.authors[index].delete()
+        self.serial += 1
+        self.authors[index] = User.objects.create_user(username=f'check-change-feed-new-{self.serial}')
+
+    # Compaction and long polls -----------------------------------------------
+
+    def check_compaction(self):
+        before = Change.objects.count()
+        deleted, _ = compact_changes()
+        objects = Change.objects.values('kind', 'object_id').distinct().count()
+        self.stdout.write(f'full compaction: {before:,} rows, {deleted:,} deleted, {objects:,} objects')
+        duplicated = Change.objects.values('kind', 'object_id').annotate(rows=Count('id')).filter(rows__gt=1)
+        if deleted != before - objects or duplicated.exists():
+            raise CommandError('Compaction left more than one row for some objects')
+
+    def check_long_poll(self):
+        client = Client(HTTP_HOST='localhost')
+        cursor = client.get(URL, {'since': '', 'limit': 1}).json()['cursor']
+        latest = self.replay(None, {}, cursor)[0]
+        # Waiting would hold a WSGI worker, so the sync feed never waits.
+        started = time.monotonic()
+        page = client.get(URL, {'since': latest, 'wait': 5}).json()
+        if page['changes'] or page['cursor'] != latest or time.monotonic() - started > 1:
+            raise CommandError(f'The sync feed waited for changes, or answered {page}')
+        started = time.monotonic()
+        page = async_to_sync(async_feed)({'since': latest, 'wait': 0.6})
+        elapsed = time.monotonic() - started
+        if page['changes'] or page['cursor'] != latest or not 0.6 <= elapsed < 2:
+            raise CommandError(f'An async long poll without changes answered {page} after {elapsed:.2f}s')
+        started = time.monotonic()
+        page = async_to_sync(async_feed)({'since': cursor, 'wait': 5})
+        if page != client.get(URL, {'since': cursor}).json() or time.monotonic() - started > 1:
+            raise CommandError('An async long poll with changes waiting did not answer at once, as the sync feed')
+        response = client.get(URL, {'since': 'not-a-cursor'})
+        if response.status_code != 400:
+            raise CommandError(f'A bad cursor answered {response.status_code}')
+        self.stdout.write(self.style.SUCCESS(
+            'Replays reproduce the database for every reader; only async long polls wait, and only without changes'
+        ))
+
+
+async def async_feed(params):
+    view = AsyncChangeViewSet.as_async_view(ChangeViewSet.as_view({'get': 'list'}))
+    response = await view(AsyncRequestFactory().get(URL, params))
+    return json.loads(response.render().content)
@@ -0,0 +1,178 @@
+import re
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from blog.models import BlogPost, Tag
+
+POST_TABLE = BlogPost._meta.db_table
+# SQLite's EXPLAIN QUERY PLAN details for a scan that uses no index, and
+# for sorting rows that no index delivered in order.
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+# ``index`` is the index the listing must be read through; ``sorts`` says
+# why a temporary sort is expected there.
+Endpoint = namedtuple('Endpoint', 'path user index sorts', defaults=('anonymous', None, None))
+
+TAG_SORT = "a tag's posts are read from the join table, then sorted"
+
+ENDPOINTS = [
+    Endpoint('/api/blog/posts/', index='post_status_published_idx'),
+    Endpoint('/api/blog/posts/?page=5', index='post_status_published_idx'),
+    Endpoint('/api/blog/posts/?pagination=cursor', index='post_status_published_idx'),
+    Endpoint('/api/blog/posts/?pagination=cursor&cursor={cursor}', index='post_status_published_idx'),
+    Endpoint('/api/blog/posts/?is_featured=true', index='post_featured_idx'),
+    Endpoint('/api/blog/posts/?tags={tag_name}', sorts=TAG_SORT),
+    Endpoint('/api/blog/posts/', user='author', index='post_published_idx'),
+    Endpoint('/api/blog/posts/?page=5', user='author', index='post_published_idx'),
+    Endpoint('/api/blog/posts/?pagination=cursor', user='author', index='post_published_idx'),
+    Endpoint('/api/blog/posts/', user='staff', index='post_published_idx'),
+    Endpoint('/api/blog/posts/{post}/'),
+    Endpoint('/api/blog/posts/{draft}/', user='author'),
+    Endpoint('/api/blog/posts/{post}/related/'),
+    Endpoint('/api/blog/posts/by_author/?author={author}', index='post_author_published_idx'),
+    Endpoint('/api/blog/posts/by_category/?category={category}', index='post_category_published_idx'),
+    Endpoint('/api/blog/posts/featured/', index='post_featured_idx'),
+    Endpoint('/api/blog/posts/recent/', index='post_status_published_idx'),
+    Endpoint('/api/blog/posts/trending/'),
+    Endpoint('/api/blog/posts/trending/?category={category}'),
+    Endpoint('/api/blog/posts/my_posts/', user='author', index='post_author_published_idx'),
+    Endpoint('/api/blog/categories/{category}/posts/', index='post_category_published_idx'),
+    Endpoint('/api/blog/tags/{tag}/posts/', sorts=TAG_SORT),
+]
+
+
+class PlanRecorder:
+    """
+    Execute wrapper keeping the SELECTs that read posts, with their params.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith('SELECT') and f'FROM "{POST_TABLE}"' in sql:
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def query_plan(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(endpoint, plans):
+    details = [detail for _, plan in plans for detail in plan]
+    problems = [f'full scan: {detail}' for detail in details if FULL_SCAN_RE.match(detail)]
+    if endpoint.sorts is None:
+        problems += [f'sort: {detail}' for detail in details if detail.startswith(TEMP_SORT)]
+    # The last query reads the page; the ones before it count.
+    if endpoint.index and plans and not any(
+        f' INDEX {endpoint.index} ' in f'{detail} ' for detail in plans[-1][1]
+    ):
+        problems.append(f'page not read through {endpoint.index}')
+    return problems
+
+
+def plan_fixtures():
+    """
+    The rows the ``ENDPOINTS`` paths are filled in with: the most prolific
+    author, one of their drafts, and the busiest rows.
+    """
+    author = User.objects.annotate(posts=Count('blog_posts')).order_by('-posts').first()
+    if author is None:
+        raise CommandError('No posts to check; pass --seed-posts.')
+    post = BlogPost.objects.published().order_by('-view_count').first()
+    draft = BlogPost.objects.filter(author=author, status=BlogPost.Status.DRAFT).first()
+    tag = Tag.objects.annotate(posts=Count('blog_posts')).order_by('-posts').first()
+    cursor_page = Client(HTTP_HOST='localhost').get('/api/blog/posts/?pagination=cursor').json()
+    return {
+        'users': {
+            'anonymous': None,
+            'author': author,
+            'staff': User.objects.create_user(username='check-query-plans-staff', is_staff=True),
+        },
+        'post': post.pk,
+        'draft': (draft or post).pk,
+        'author': author.pk,
+        'category': post.category_id,
+        'tag': tag.pk,
+        'tag_name': tag.name,
+        'cursor': cursor_page['next'].rsplit('cursor=', 1)[1],
+    }
+
+
+def endpoint_plans(endpoint, ctx):
+    """
+    Request ``endpoint`` and return its path with the ``(sql, plan)`` of each
+    query that read posts.
+    """
+    path = endpoint.path.format(**ctx)
+    headers = {}
+    user = ctx['users'][endpoint.user]
+    if user is not None:
+        headers['HTTP_AUTHORIZATION'] = f'Bearer {RefreshToken.for_user(user).access_token}'
+    recorder = PlanRecorder()
+    with connection.execute_wrapper(recorder):
+        response = Client(HTTP_HOST='localhost').get(path, **headers)
+    if response.status_code != 200:
+        raise CommandError(f'{path} answered {response.status_code}: {response.content[:300]!r}')
+    return path, [(sql, query_plan(sql, params)) for sql, params in recorder.queries]
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every post listing and lookup on a seeded dataset (rolled '
+        'back afterwards) and fail if SQLite plans any of their post queries '
+        'with a full table scan or a temporary sort.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-posts', type=int, default=5000,
+                            help='Seed this many posts with seed_blog first')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Query plans are only checked on SQLite.')
+        with override_settings(
+            BLOG_RESPONSE_CACHE={'ENABLED': False},
+            BLOG_QUERY_BUDGET={'ENABLED': False},
+        ), transaction.atomic():
+            if options['seed_posts']:
+                call_command('seed_blog', posts=options['seed_posts'], stdout=self.stdout)
+            # Plans as they will be once statistics are current; see seed_blog.
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            failures = self.check_endpoints(plan_fixtures(), options['verbose_plans'])
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(f'{failures} endpoint(s) scan or sort posts')
+        self.stdout.write(self.style.SUCCESS('Every post query is served by an index'))
+
+    def check_endpoints(self, ctx, verbose):
+        failures = 0
+        for endpoint in ENDPOINTS:
+            path, plans = endpoint_plans(endpoint, ctx)
+            problems = plan_problems(endpoint, plans)
+            label = f'{endpoint.user:<10} {path}'
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"{label}: {'; '.join(problems)}"))
+            else:
+                note = f' (sorts: {endpoint.sorts})' if endpoint.sorts else ''
+                self.stdout.write(f'{label}: {len(plans)} queries, ok{note}')
+            if problems or verbose:
+                for sql, plan in plans:
+                    self.stdout.write(f'    {sql}')
+                    for detail in plan:
+                        self.stdout.write(f'      {detail}')
+        return failures
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from blog.changes import compact_changes
+from blog.models import Change
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete every change feed row superseded by a later row for the same '
+        'object. Servers compact what they wrote as they go; this is a full pass.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        started = time.monotonic()
+        deleted, _ = compact_changes(using=using)
+        remaining = Change.objects.using(using).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted:,} superseded rows in {time.monotonic() - started:.1f}s; '
+            f'{remaining:,} remain.'
+        ))
@@ -0,0 +1,77 @@
+import json
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from blog.bulk import write_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Import posts from an NDJSON file (one post payload per line, as '
+        'accepted by POST /api/blog/posts/), in batches of one transaction each.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file, or - for stdin')
+        parser.add_argument('--author', required=True, help='Username the posts are created for')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.using(options['database']).get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['author']!r} does not exist")
+
+        self.author = author
+        self.database = options['database']
+        self.imported = self.failed = 0
+        self.started = time.perf_counter()
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        try:
+            batch = []
+            for line_number, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                batch.append((line_number, line))
+                if len(batch) >= options['batch_size']:
+                    self.write_batch(batch)
+                    batch = []
+            if batch:
+                self.write_batch(batch)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported} posts, {self.failed} failed, in {elapsed:.1f}s '
+            f'({self.imported / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+
+    def write_batch(self, batch):
+        items, line_numbers = [], []
+        for line_number, line in batch:
+            try:
+                items.append(json.loads(line))
+                line_numbers.append(line_number)
+            except ValueError as exc:
+                self.failed += 1
+                self.stderr.write(f'line {line_number}: invalid JSON: {exc}')
+
+        for result in write_posts(items, self.author, using=self.database):
+            if 'errors' in result:
+                self.failed += 1
+                self.stderr.write(f"line {line_numbers[result['index']]}: {json.dumps(result['errors'])}")
+            else:
+                self.imported += 1
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f'{self.imported} imported, {self.failed} failed '
+            f'({self.imported / elapsed if elapsed else 0:.0f} rows/s)'
+        )
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from blog.related import rebuild_related_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute every related-posts list and save the fitted index that '
+        'incremental updates use. Run it periodically, or keep it running with --interval.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--interval', type=float, help='Rebuild every this many seconds until stopped')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            index = rebuild_related_posts(using=options['database'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Related posts rebuilt for {len(index.post_ids):,} posts '
+                f'in {time.perf_counter() - started:.1f}s.'
+            ))
+            if not options['interval']:
+                break
+            connections.close_all()
+            time.sleep(options['interval'])
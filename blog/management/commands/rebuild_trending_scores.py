@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from blog.cache import invalidate_tags
+from blog.trending import rebuild_trending_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute trending scores from post view counts, counting each post\'s '
+        'views as of its publication. Run after changing BLOG_TRENDING["HALF_LIFE"].'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            rebuild_trending_scores(using=options['database'])
+        invalidate_tags({'posts:trending'})
+        self.stdout.write(self.style.SUCCESS('Trending scores rebuilt.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from blog.counters import recount_post_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute post counters on categories, tags and authors to repair drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            recount_post_stats(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('Post counters recounted.'))
@@ -0,0 +1,72 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from blog.cache import invalidate_tags
+from blog.models import BlogPost
+from blog.rendering import RENDERER_VERSION, render_many, stale_posts, store_html
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-render the stored HTML of posts rendered by an older renderer '
+        'version or from older content, on a pool of processes. Run it after '
+        'bumping RENDERER_VERSION, and after bulk loads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every post, not only stale ones')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Rendering processes; 0 renders in this process')
+        parser.add_argument('--batch-size', type=int, default=200, help='Posts per task handed to a worker')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['workers'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--workers must not be negative and --batch-size must be positive.')
+        using = options['database']
+        posts = BlogPost.objects.using(using).order_by('pk')
+        if not options['all']:
+            posts = stale_posts(posts)
+        posts = posts.values_list('pk', 'content_hash', 'content')
+        # Enough tasks per round to keep every worker busy.
+        chunk_size = options['batch_size'] * max(1, options['workers']) * 2
+        started = time.monotonic()
+        rendered = 0
+
+        pool = None
+        if options['workers']:
+            # Workers only render; django.setup lets spawned ones import blog.rendering.
+            pool = ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup)
+        try:
+            last_pk = 0
+            # Walk by primary key so only one chunk of post bodies is in memory.
+            while True:
+                rows = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                batches = [rows[start:start + options['batch_size']]
+                           for start in range(0, len(rows), options['batch_size'])]
+                contents = [[content for _, _, content in batch] for batch in batches]
+                results = pool.map(render_many, contents) if pool else map(render_many, contents)
+                html = [fragment for fragments in results for fragment in fragments]
+                saved = store_html(
+                    ((pk, content_hash, fragment) for (pk, content_hash, _), fragment in zip(rows, html)),
+                    using,
+                )
+                # Cached detail responses and validators embed the old HTML.
+                invalidate_tags({f'post:{pk}' for pk in saved})
+                rendered += len(saved)
+                self.stdout.write(f'{rendered:,} posts rendered')
+        finally:
+            if pool:
+                pool.shutdown()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered:,} posts with renderer version {RENDERER_VERSION} in {elapsed:.1f}s.'
+        ))
@@ -0,0 +1,41 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from blog.tasks import Worker, tasks_setting
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background tasks on a pool of threads, or of processes '
+        'with --processes, until interrupted. SIGTERM and SIGINT stop '
+        'claiming and wait for the running tasks. Run as many workers as '
+        'needed; they never run the same task at once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Tasks run at once')
+        parser.add_argument('--processes', action='store_true',
+                            help='Run tasks in processes, for CPU-bound tasks, rather than threads')
+        parser.add_argument('--burst', action='store_true', help='Exit once no task is ready')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be positive.')
+        if tasks_setting('RUN_IN_PROCESS'):
+            self.stderr.write(self.style.WARNING(
+                'BLOG_TASKS["RUN_IN_PROCESS"] is on: web processes run tasks too.'
+            ))
+        worker = Worker(options['concurrency'], options['processes'], options['database'])
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: worker.stop())
+        pool = 'processes' if options['processes'] else 'threads'
+        self.stdout.write(f"Running tasks on {options['concurrency']} {pool}.")
+        started = time.monotonic()
+        counts = worker.run(until_empty=options['burst'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Ran {counts['done']:,} tasks, {counts['failed']:,} failed attempts, "
+            f'in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,181 @@
+import itertools
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+from blog.cache import invalidate_tags
+from blog.changes import record_changes
+from blog.counters import recount_post_stats
+from blog.models import BlogPost, Category, Change, Tag
+from blog.related import rebuild_related_posts
+from blog.search import get_search_backend
+from blog.trending import rebuild_trending_scores
+
+# Passages that post bodies are assembled from; drawing every word per post
+# would dominate the run time at millions of posts.
+PASSAGES = 2000
+WORDS_PER_PASSAGE = 40
+
+
+def zipf_weights(count, exponent):
+    """
+    Cumulative weights giving rank ``r`` a share proportional to ``1 / r ** exponent``.
+    """
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate users, categories, tags and posts with bulk_create: Zipf '
+        'distributed tag, category, author and word usage, log-normal content '
+        'lengths and view counts. Counters, search and trending indexes are '
+        'rebuilt afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--tags', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=10_000)
+        parser.add_argument('--max-tags-per-post', type=int, default=6)
+        parser.add_argument('--vocabulary', type=int, default=20_000)
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of tag, category, author and word usage')
+        parser.add_argument('--median-words', type=int, default=400, help='Median post length in words')
+        parser.add_argument('--published', type=float, default=0.85, help='Fraction of posts published')
+        parser.add_argument('--days', type=int, default=365, help='Publication dates span this many days back')
+        parser.add_argument('--prefix', default='seed', help='Prefix of generated usernames, category and tag names')
+        parser.add_argument('--password', default='seed-password', help='Password of every generated user')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--related', action='store_true', help='Also rebuild related-post lists (slow)')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        counts = ('users', 'categories', 'tags', 'posts')
+        if any(options[name] < 0 for name in counts):
+            raise CommandError(f"{', '.join(counts)} must not be negative.")
+        if options['posts'] and not options['users']:
+            raise CommandError('Posts need at least one user.')
+        self.options = options
+        self.using = options['database']
+        self.rng = random.Random(options['random_seed'])
+        self.started = time.perf_counter()
+
+        with transaction.atomic(using=self.using):
+            user_ids = self.create_users()
+            category_ids = self.create_named(Category, 'category', options['categories'])
+            tag_ids = self.create_named(Tag, 'tag', options['tags'])
+            # bulk_create sends no signals; the change feed is written here.
+            record_changes(Change.Kind.CATEGORY, category_ids, Change.Action.CREATE, self.using)
+            record_changes(Change.Kind.TAG, tag_ids, Change.Action.CREATE, self.using)
+        self.log(f'{len(user_ids):,} users, {len(category_ids):,} categories, {len(tag_ids):,} tags')
+
+        passages = self.passages()
+        post_ids = []
+        for offset in range(0, options['posts'], options['batch_size']):
+            count = min(options['batch_size'], options['posts'] - offset)
+            with transaction.atomic(using=self.using):
+                post_ids += self.create_posts(count, passages, user_ids, category_ids, tag_ids)
+            self.log(f'{len(post_ids):,} posts')
+
+        with transaction.atomic(using=self.using):
+            recount_post_stats(using=self.using)
+            get_search_backend(self.using).rebuild()
+            rebuild_trending_scores(using=self.using)
+        self.log('counters, search index and trending scores rebuilt')
+        if connections[self.using].vendor in ('sqlite', 'postgresql'):
+            # A bulk load leaves the planner's statistics describing the old data.
+            with connections[self.using].cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.log('statistics updated')
+        if options['related']:
+            rebuild_related_posts(using=self.using)
+            self.log('related posts rebuilt')
+        # bulk_create sends no signals; the new rows only touch list responses.
+        invalidate_tags({'posts', 'posts:published', 'posts:featured', 'posts:trending', 'categories', 'tags'})
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.perf_counter() - self.started:.1f}s'))
+
+    def log(self, message):
+        self.stdout.write(f'[{time.perf_counter() - self.started:7.1f}s] {message}')
+
+    def next_index(self, queryset, field, prefix):
+        """
+        One past the highest ``<prefix>-<n>`` already taken, so reruns add rows.
+        """
+        taken = queryset.using(self.using).filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+        return 1 + max((int(name[len(prefix):]) for name in taken if name[len(prefix):].isdigit()), default=-1)
+
+    def create_users(self):
+        prefix = f"{self.options['prefix']}-user-"
+        start = self.next_index(User.objects, 'username', prefix)
+        password = make_password(self.options['password'])
+        users = User.objects.using(self.using).bulk_create([
+            User(
+                username=f'{prefix}{index}',
+                email=f'{prefix}{index}@example.com',
+                first_name=f'Seed{index}',
+                last_name='User',
+                password=password,
+            )
+            for index in range(start, start + self.options['users'])
+        ], batch_size=self.options['batch_size'])
+        return [user.pk for user in users]
+
+    def create_named(self, model, kind, count):
+        prefix = f"{self.options['prefix']}-{kind}-"
+        start = self.next_index(model.objects, 'name', prefix)
+        rows = model.objects.using(self.using).bulk_create(
+            [model(name=f'{prefix}{index}') for index in range(start, start + count)],
+            batch_size=self.options['batch_size'],
+        )
+        return [row.pk for row in rows]
+
+    def passages(self):
+        words = [f'word{index}' for index in range(self.options['vocabulary'])]
+        weights = zipf_weights(len(words), self.options['zipf'])
+        return [
+            ' '.join(self.rng.choices(words, cum_weights=weights, k=WORDS_PER_PASSAGE)).capitalize() + '.'
+            for _ in range(PASSAGES)
+        ]
+
+    def create_posts(self, count, passages, user_ids, category_ids, tag_ids):
+        options, rng = self.options, self.rng
+        now = timezone.now()
+        author_weights = zipf_weights(len(user_ids), options['zipf'])
+        category_weights = zipf_weights(len(category_ids), options['zipf'])
+        tag_weights = zipf_weights(len(tag_ids), options['zipf'])
+        median_passages = max(1, options['median_words'] / WORDS_PER_PASSAGE)
+
+        posts = []
+        for _ in range(count):
+            published = rng.random() < options['published']
+            length = max(2, min(250, round(rng.lognormvariate(math.log(median_passages), 0.8))))
+            start = rng.randrange(len(passages))
+            posts.append(BlogPost(
+                title=rng.choice(passages)[:rng.randint(30, 90)].rsplit(' ', 1)[0],
+                content='\n\n'.join(passages[(start + step * 7) % len(passages)] for step in range(length)),
+                author_id=rng.choices(user_ids, cum_weights=author_weights)[0],
+                category_id=rng.choices(category_ids, cum_weights=category_weights)[0] if category_ids else None,
+                status=BlogPost.Status.PUBLISHED if published else BlogPost.Status.DRAFT,
+                published_date=now - timedelta(seconds=rng.uniform(0, options['days'] * 86400)) if published else None,
+                view_count=int(rng.lognormvariate(3, 1.5)) if published else 0,
+                is_featured=published and rng.random() < 0.01,
+            ))
+        posts = BlogPost.objects.using(self.using).bulk_create(posts)
+
+        through = BlogPost.tags.through
+        links = []
+        if tag_ids:
+            for post in posts:
+                picked = rng.choices(tag_ids, cum_weights=tag_weights, k=rng.randint(0, options['max_tags_per_post']))
+                links += [through(blogpost_id=post.pk, tag_id=tag_id) for tag_id in set(picked)]
+        through.objects.using(self.using).bulk_create(links, batch_size=options['batch_size'])
+        post_ids = [post.pk for post in posts]
+        record_changes(Change.Kind.POST, post_ids, Change.Action.CREATE, self.using)
+        return post_ids
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from postflow.replicas import replica_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into every replica alias. A stand-in '
+        'for replication when testing replica routing locally.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Replicas to refresh (default: all)')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replica_aliases()
+        if not aliases:
+            raise CommandError('No replicas configured; set DATABASE_REPLICA_URLS.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias} is not SQLite; use real replication for it.')
+        primary.ensure_connection()
+        for alias in aliases:
+            replica = connections[alias]
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+            self.stdout.write(self.style.SUCCESS(f'Copied {DEFAULT_DB_ALIAS} to {alias}.'))
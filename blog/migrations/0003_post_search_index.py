@@ -0,0 +1,99 @@
+from django.db import migrations
+
+# The search index as this migration created it, frozen here rather than
+# imported from blog.search so that later changes there cannot change what
+# this migration does. Vendors missing here search with icontains and need no
+# index.
+
+INDEX_TABLES = {
+    'sqlite': 'blog_post_fts',
+    'postgresql': 'blog_post_search',
+}
+
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts USING fts5("
+        "title, content, author, category, tags, tokenize='porter unicode61')",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS blog_post_search ("
+        "post_id bigint PRIMARY KEY REFERENCES {post_table} (id) "
+        "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        "document tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS blog_post_search_document_idx "
+        "ON blog_post_search USING GIN (document)",
+    ],
+}
+
+POPULATE_SQL = {
+    'sqlite': (
+        "INSERT INTO blog_post_fts (rowid, title, content, author, category, tags) {source}"
+    ),
+    'postgresql': (
+        "INSERT INTO blog_post_search (post_id, document) "
+        "SELECT id, "
+        "setweight(to_tsvector('english', title), 'A') || "
+        "setweight(to_tsvector('english', tags), 'B') || "
+        "setweight(to_tsvector('english', category || ' ' || author), 'C') || "
+        "setweight(to_tsvector('english', content), 'D') "
+        "FROM ({source}) AS src (id, title, content, author, category, tags)"
+    ),
+}
+
+TAG_NAMES = {
+    'sqlite': "group_concat(t.name, ' ')",
+    'postgresql': "string_agg(t.name, ' ')",
+}
+
+
+def source_sql(apps, tag_names):
+    """
+    One (post id, title, content, author, category, tags) row per post.
+    """
+    post_model = apps.get_model('blog', 'BlogPost')
+    tables = {
+        'post_table': post_model._meta.db_table,
+        'tags_table': post_model.tags.through._meta.db_table,
+        'tag_table': apps.get_model('blog', 'Tag')._meta.db_table,
+        'user_table': post_model._meta.get_field('author').related_model._meta.db_table,
+        'category_table': apps.get_model('blog', 'Category')._meta.db_table,
+    }
+    return (
+        "SELECT p.id, p.title, p.content, u.username, COALESCE(c.name, ''), "
+        "COALESCE((SELECT {tag_names} FROM {tags_table} pt "
+        "JOIN {tag_table} t ON t.id = pt.tag_id "
+        "WHERE pt.blogpost_id = p.id), '') "
+        "FROM {post_table} p "
+        "JOIN {user_table} u ON u.id = p.author_id "
+        "LEFT JOIN {category_table} c ON c.id = p.category_id"
+    ).format(tag_names=tag_names, **tables)
+
+
+def install_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in INDEX_TABLES:
+        return
+    post_table = apps.get_model('blog', 'BlogPost')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        for sql in CREATE_SQL[vendor]:
+            cursor.execute(sql.format(post_table=post_table))
+        cursor.execute(POPULATE_SQL[vendor].format(source=source_sql(apps, TAG_NAMES[vendor])))
+
+
+def uninstall_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in INDEX_TABLES:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLES[vendor]}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_remove_blogpost_slug_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:41
+
+from django.db import migrations, models
+
+# blog.models.post_metrics as of this migration, frozen here so that later
+# changes to it cannot change what this migration writes.
+EXCERPT_LENGTH = 150
+WORDS_PER_MINUTE = 200
+
+
+def post_metrics(content):
+    excerpt = content[:EXCERPT_LENGTH] + '...' if len(content) > EXCERPT_LENGTH else content
+    word_count = len(content.split())
+    return {
+        'excerpt': excerpt,
+        'word_count': word_count,
+        'read_time': max(1, word_count // WORDS_PER_MINUTE),
+    }
+
+
+def backfill_post_metrics(apps, schema_editor):
+    # Large archives can skip this and run `manage.py backfill_post_metrics`.
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    db_alias = schema_editor.connection.alias
+    posts = BlogPost.objects.using(db_alias).only('id', 'content')
+    batch = []
+    for post in posts.iterator(chunk_size=1000):
+        for field, value in post_metrics(post.content).items():
+            setattr(post, field, value)
+        batch.append(post)
+        if len(batch) == 1000:
+            BlogPost.objects.using(db_alias).bulk_update(batch, ['excerpt', 'word_count', 'read_time'])
+            batch = []
+    if batch:
+        BlogPost.objects.using(db_alias).bulk_update(batch, ['excerpt', 'word_count', 'read_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=153),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='read_time',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_post_metrics, migrations.RunPython.noop),
+    ]
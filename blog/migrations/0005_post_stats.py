@@ -0,0 +1,89 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:46
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+import django.db.models.deletion
+
+
+def recount(apps, schema_editor):
+    # blog.counters.recount_post_stats as of this migration, frozen here so
+    # that later changes to it cannot change what this migration writes.
+    using = schema_editor.connection.alias
+    posts = apps.get_model('blog', 'BlogPost').objects.using(using).order_by()
+    published = Q(status='published')
+
+    def counted(lookup):
+        group = posts.filter(**{lookup: OuterRef('pk')}).values(lookup)
+        return {
+            'post_count': group.annotate(n=Count('pk')).values('n'),
+            'published_post_count': group.annotate(n=Count('pk', filter=published)).values('n'),
+            'total_views': group.annotate(n=Sum('view_count')).values('n'),
+        }
+
+    author_stats = apps.get_model('blog', 'AuthorStats')
+    author_stats.objects.using(using).bulk_create(
+        [author_stats(user_id=author_id) for author_id in posts.values_list('author_id', flat=True).distinct()],
+        ignore_conflicts=True,
+    )
+    for model_name, lookup in (('Category', 'category'), ('Tag', 'tags'), ('AuthorStats', 'author')):
+        apps.get_model('blog', model_name).objects.using(using).update(**{
+            field: Coalesce(Subquery(subquery), Value(0))
+            for field, subquery in counted(lookup).items()
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('blog', '0004_post_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('post_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('published_post_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('total_views', models.PositiveBigIntegerField(default=0, editable=False)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='author_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Author stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='total_views',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='total_views',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(recount, migrations.RunPython.noop),
+    ]
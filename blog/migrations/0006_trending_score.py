@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:20
+
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+# blog.trending.rebuild_trending_scores as of this migration, frozen here so
+# that later changes to it cannot change what this migration writes. The
+# half-life is configuration, and read as blog.trending reads it.
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+DEFAULT_HALF_LIFE = 6 * 60 * 60
+BATCH_SIZE = 1000
+
+
+def rebuild(apps, schema_editor):
+    using = schema_editor.connection.alias
+    score_model = apps.get_model('blog', 'TrendingScore')
+    half_life = getattr(settings, 'BLOG_TRENDING', {}).get('HALF_LIFE', DEFAULT_HALF_LIFE)
+    rate = math.log(2) / half_life
+    now = timezone.now()
+    # View times are not stored, so views count as arriving at publication.
+    rows = apps.get_model('blog', 'BlogPost').objects.using(using).filter(
+        status='published', view_count__gt=0
+    ).order_by().values_list('pk', 'category_id', 'view_count', 'published_date')
+    batch = []
+    for pk, category_id, view_count, published_date in rows.iterator(chunk_size=BATCH_SIZE):
+        at = published_date or now
+        batch.append(score_model(
+            post_id=pk, category_id=category_id,
+            score=math.log(view_count) + rate * (at - EPOCH).total_seconds(),
+        ))
+        if len(batch) == BATCH_SIZE:
+            score_model.objects.using(using).bulk_create(batch)
+            batch = []
+    score_model.objects.using(using).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='blog.blogpost')),
+                ('score', models.FloatField()),
+                ('category', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='blog.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='blog_trendi_score_6a6fd6_idx'), models.Index(fields=['category', '-score'], name='blog_trendi_categor_9c540f_idx')],
+            },
+        ),
+        migrations.RunPython(rebuild, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+def analyze(apps, schema_editor):
+    # Without statistics SQLite cannot tell the new indexes apart and picks
+    # by shape alone; see the check_query_plans command.
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('ANALYZE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_related_post'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='blogpost',
+            options={'ordering': ['-published_date', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='blogpost',
+            name='blog_blogpo_publish_2a7cdd_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='blogpost',
+            name='blog_blogpo_status_9c1956_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='blogpost',
+            name='blog_blogpo_author__0d5a17_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='blogpost',
+            name='blog_blogpo_categor_c7bd72_idx',
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['published_date'], name='post_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['status', 'published_date'], name='post_status_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['author', 'published_date'], name='post_author_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['category', 'status', 'published_date'], name='post_category_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('is_featured', True)), fields=['status', 'published_date'], name='post_featured_idx'),
+        ),
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:19
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    # The HTML itself is left to `manage.py rerender_posts`; until then
+    # posts render on demand.
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    db_alias = schema_editor.connection.alias
+    posts = BlogPost.objects.using(db_alias).only('id', 'content')
+    batch = []
+    for post in posts.iterator(chunk_size=1000):
+        post.content_hash = hashlib.sha256(post.content.encode()).hexdigest()
+        batch.append(post)
+        if len(batch) == 1000:
+            BlogPost.objects.using(db_alias).bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        BlogPost.objects.using(db_alias).bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='html_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='render_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:26
+
+from django.db import migrations, models
+
+
+def record_existing_objects(apps, schema_editor):
+    # So a client syncing from the start also gets what predates the feed.
+    Change = apps.get_model('blog', 'Change')
+    db_alias = schema_editor.connection.alias
+    for kind, model_name in (('category', 'Category'), ('tag', 'Tag'), ('post', 'BlogPost')):
+        model = apps.get_model('blog', model_name)
+        object_ids = model.objects.using(db_alias).order_by('pk').values_list('pk', flat=True)
+        batch = []
+        for pk in object_ids.iterator(chunk_size=1000):
+            batch.append(Change(kind=kind, object_id=pk, action='create'))
+            if len(batch) == 1000:
+                Change.objects.using(db_alias).bulk_create(batch)
+                batch = []
+        Change.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_rendered_content_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('transaction_id', models.BigIntegerField(default=0)),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('category', 'Category'), ('tag', 'Tag')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('status', 'Status change'), ('delete', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['transaction_id', 'id'], name='change_feed_idx'), models.Index(fields=['kind', 'object_id'], name='change_object_idx')],
+            },
+        ),
+        migrations.RunPython(record_existing_objects, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,40 @@
-from django.db import models
+import hashlib
+
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinLengthValidator
 
-class Category(models.Model):
+class PostStats(models.Model):
+    """
+    Denormalized post counters, maintained by the signal handlers in
+    blog.signals and repaired by the recount_post_stats command.
+    """
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    published_post_count = models.PositiveIntegerField(default=0, editable=False)
+    total_views = models.PositiveBigIntegerField(default=0, editable=False)
+    
+    class Meta:
+        abstract = True
+
+    STAT_FIELDS = ('post_count', 'published_post_count', 'total_views')
+
+    def save(self, *args, **kwargs):
+        # The counters only move through F() updates; saving an instance
+        # loaded earlier must not write its stale copies back.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STAT_FIELDS
+            ]
+        # The change feed entry written by the post_save handler commits or
+        # rolls back with the row; inside a caller's transaction, with it.
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class Category(PostStats):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -16,7 +47,7 @@ class Category(models.Model):
         return self.name
 
 
-class Tag(models.Model):
+class Tag(PostStats):
     name = models.CharField(max_length=50, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -27,6 +58,86 @@ class Tag(models.Model):
         return self.name
 
 
+class AuthorStats(PostStats):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='author_stats'
+    )
+    
+    class Meta:
+        verbose_name_plural = "Author stats"
+    
+    def __str__(self):
+        return f"Stats for {self.user_id}"
+
+
+EXCERPT_LENGTH = 150
+WORDS_PER_MINUTE = 200
+
+
+def post_metrics(content):
+    """
+    Derived values stored alongside the content: excerpt, word count, read
+    time in minutes, and the hash that rendered HTML is keyed by.
+    """
+    excerpt = content[:EXCERPT_LENGTH] + '...' if len(content) > EXCERPT_LENGTH else content
+    word_count = len(content.split())
+    return {
+        'excerpt': excerpt,
+        'word_count': word_count,
+        'read_time': max(1, word_count // WORDS_PER_MINUTE),
+        'content_hash': hashlib.sha256(content.encode()).hexdigest(),
+    }
+
+
+POST_METRIC_FIELDS = ('excerpt', 'word_count', 'read_time', 'content_hash')
+
+
+class BlogPostQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(status=BlogPost.Status.PUBLISHED)
+    
+    def visible_to(self, user):
+        """
+        Every post for staff, published posts and their own for other users,
+        published posts for anonymous ones.
+        """
+        if not user.is_authenticated:
+            return self.published()
+        if user.is_staff:
+            return self
+        return self.filter(models.Q(status=BlogPost.Status.PUBLISHED) | models.Q(author=user))
+    
+    def for_list(self):
+        """
+        Relations prefetched and columns projected for BlogPostListSerializer,
+        so listings cost a fixed number of queries whatever the page size.
+        """
+        from .projection import project_queryset
+        from .serializers import BlogPostListSerializer
+        return project_queryset(self, BlogPostListSerializer)
+    
+    def for_detail(self):
+        return self.select_related('author', 'category').prefetch_related('tags')
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.update_metrics()
+        return super().bulk_create(objs, *args, **kwargs)
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if 'content' in fields:
+            for obj in objs:
+                obj.update_metrics()
+            fields += [field for field in POST_METRIC_FIELDS if field not in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class BlogPost(models.Model):
     class Status(models.TextChoices):
         DRAFT = 'draft', 'Draft'
@@ -61,34 +172,229 @@ class BlogPost(models.Model):
     )
     view_count = models.PositiveIntegerField(default=0)
     is_featured = models.BooleanField(default=False)
+    # Derived from content in save() and the bulk paths; see post_metrics().
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH + 3, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    read_time = models.PositiveIntegerField(default=1, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # Written by blog.rendering: the HTML, the content_hash it was rendered
+    # from and the RENDERER_VERSION that rendered it.
+    content_html = models.TextField(blank=True, editable=False)
+    html_hash = models.CharField(max_length=64, blank=True, editable=False)
+    render_version = models.PositiveSmallIntegerField(default=0, editable=False)
+    
+    objects = BlogPostQuerySet.as_manager()
     
     class Meta:
-        ordering = ['-published_date', '-created_at']
+        # Ties go to the newer row; an ascending index read backwards returns
+        # rows in exactly this order, since SQLite appends the rowid to it.
+        ordering = ['-published_date', '-id']
+        # One per access path, each ending in published_date so the listing
+        # needs no sort; see the check_query_plans command and QueryPlanTests.
         indexes = [
-            models.Index(fields=['-published_date']),
-            models.Index(fields=['status']),
-            models.Index(fields=['author']),
-            models.Index(fields=['category']),
+            # Staff listings over every status.
+            models.Index(fields=['published_date'], name='post_published_idx'),
+            # Published listings, their counts and keyset pages.
+            models.Index(fields=['status', 'published_date'], name='post_status_published_idx'),
+            # An author's posts of any status (my_posts, own drafts), and by_author.
+            models.Index(fields=['author', 'published_date'], name='post_author_published_idx'),
+            models.Index(
+                fields=['category', 'status', 'published_date'], name='post_category_published_idx',
+            ),
+            # Featured posts. Status is a column rather than part of the
+            # condition, or SQLite prefers the status index above.
+            models.Index(
+                fields=['status', 'published_date'], name='post_featured_idx',
+                condition=models.Q(is_featured=True),
+            ),
         ]
     
     def __str__(self):
         return self.title
     
+    # Loaded values that the counter and cache signal handlers diff against.
+    TRACKED_FIELDS = ('category_id', 'author_id', 'status', 'view_count')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_state = instance.tracked_state()
+        return instance
+    
+    def tracked_state(self):
+        # Read through __dict__ so deferred fields are never loaded here.
+        return {
+            field: self.__dict__[field]
+            for field in self.TRACKED_FIELDS if field in self.__dict__
+        }
+    
     def save(self, *args, **kwargs):
         if self.status == self.Status.PUBLISHED and not self.published_date:
             self.published_date = timezone.now()
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.update_metrics()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(POST_METRIC_FIELDS)
+        # Counter updates in post_save handlers commit or roll back with the
+        # row; inside a caller's transaction, with it. Saving an existing
+        # post also reads its stored row, rewrites its search document,
+        # queues its related-list and HTML tasks and records a change; only a
+        # status, view, category or author change moves counters and the
+        # trending score. QueryBudgetTests pins the statements.
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+        self._saved_state = self.tracked_state()
+    
+    def update_metrics(self):
+        for field, value in post_metrics(self.content).items():
+            setattr(self, field, value)
     
     @property
     def is_published(self):
         return self.status == self.Status.PUBLISHED
+
+class TrendingScore(models.Model):
+    """
+    Time-decayed view score of a published post, maintained by blog.trending.
+    Kept apart from BlogPost so the top-N scans read a narrow table.
+    """
+    post = models.OneToOneField(
+        BlogPost,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending_score'
+    )
+    # Copied from the post so per-category lists have their own index.
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        db_index=False,
+        related_name='+'
+    )
+    score = models.FloatField()
     
-    @property
-    def excerpt(self):
-        return self.content[:150] + '...' if len(self.content) > 150 else self.content
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score']),
+            models.Index(fields=['category', '-score']),
+        ]
     
-    @property
-    def read_time(self):
-        # Assuming average reading speed of 200 words per minute
-        word_count = len(self.content.split())
-        return max(1, word_count // 200)
\ No newline at end of file
+    def __str__(self):
+        return f"Trending score for {self.post_id}"
+
+
+class RelatedPost(models.Model):
+    """
+    One entry of a post's precomputed nearest-neighbour list, written by
+    blog.related.
+    """
+    # Covered by the composite indexes below.
+    post = models.ForeignKey(
+        BlogPost,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='related_entries'
+    )
+    related = models.ForeignKey(
+        BlogPost,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='unique_related_post'),
+        ]
+        indexes = [
+            models.Index(fields=['post', '-score']),
+        ]
+    
+    def __str__(self):
+        return f"{self.related_id} related to {self.post_id}"
+
+
+class Change(models.Model):
+    """
+    One entry of the change feed, written by blog.changes in the transaction
+    of the write it records. Entries name the object, not its new values.
+    """
+    class Kind(models.TextChoices):
+        POST = 'post', 'Post'
+        CATEGORY = 'category', 'Category'
+        TAG = 'tag', 'Tag'
+    
+    class Action(models.TextChoices):
+        CREATE = 'create', 'Create'
+        UPDATE = 'update', 'Update'
+        STATUS = 'status', 'Status change'
+        DELETE = 'delete', 'Delete'
+    
+    id = models.BigAutoField(primary_key=True)
+    # The writing transaction on PostgreSQL, 0 elsewhere; entries are served
+    # in (transaction_id, id) order.
+    transaction_id = models.BigIntegerField(default=0)
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.PositiveBigIntegerField()
+    action = models.CharField(max_length=10, choices=Action.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Reading the feed.
+            models.Index(fields=['transaction_id', 'id'], name='change_feed_idx'),
+            # Finding superseded entries when compacting.
+            models.Index(fields=['kind', 'object_id'], name='change_object_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.action} {self.kind} {self.object_id}"
+
+
+class Task(models.Model):
+    """
+    Deferred work, queued by blog.tasks in the transaction that calls for it
+    and run by the first worker to claim it.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+    
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=100)
+    arguments = models.JSONField(default=list)
+    # At most one queued task per key; queuing another is a no-op.
+    dedup_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    # When the task, or its next attempt, may run.
+    run_at = models.DateTimeField(default=timezone.now)
+    # The claim holding a running task, and until when.
+    lock_id = models.CharField(max_length=32, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    
+    class Meta:
+        indexes = [
+            # Claiming, expiring leases and the depth metrics.
+            models.Index(fields=['status', 'run_at'], name='task_queue_idx'),
+            # Latency metrics and purging, over finished tasks.
+            models.Index(fields=['finished_at'], name='task_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'], condition=models.Q(status='queued'), name='task_queued_dedup_key',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.status})"
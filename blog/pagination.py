@@ -0,0 +1,281 @@
+"""
+Pagination for post listings.
+
+Page-number pagination stays the default. Passing ``?pagination=cursor``
+switches to keyset pagination over ``(published_date, id)``, which needs no
+``COUNT(*)`` and no ``OFFSET``, so page 10,000 costs the same as page 1.
+Cursor pages can only follow that order, so they reject any other
+``?ordering=`` and ranked ``?q=`` search with a 400.
+"""
+import base64
+import json
+from collections import OrderedDict
+from functools import partial
+
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination in ``BlogPost.Meta.ordering`` order: newest
+    ``published_date`` first with undated drafts last, ties broken by ``id``.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+    ordering_param = api_settings.ORDERING_PARAM
+    # ?ordering= values that already mean the keyset order.
+    keyset_orderings = ('', '-published_date')
+    # Parameters that order results by something else; ?q= ranks by relevance.
+    ordering_params = ('q',)
+
+    forward_ordering = (
+        F('published_date').desc(nulls_last=True),
+        F('id').desc(),
+    )
+    backward_ordering = (
+        F('published_date').asc(nulls_first=True),
+        F('id').asc(),
+    )
+
+    def paginate_queryset(self, queryset, request, view=None, count_queryset=None):
+        queryset, cursor = self.page_queryset(queryset, request)
+        return self.set_page(list(queryset), cursor)
+
+    async def apaginate_queryset(self, queryset, request, view=None, count_queryset=None):
+        queryset, cursor = self.page_queryset(queryset, request)
+        return self.set_page([post async for post in queryset.aiterator()], cursor)
+
+    def page_queryset(self, queryset, request):
+        """
+        Return the query for the requested page and the decoded cursor.
+        """
+        self.check_ordering(request)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            self.reverse = False
+            queryset = queryset.order_by(*self.forward_ordering)
+        else:
+            published_date, pk, self.reverse = cursor
+            if self.reverse:
+                queryset = queryset.filter(self.before(published_date, pk))
+                queryset = queryset.order_by(*self.backward_ordering)
+            else:
+                queryset = queryset.filter(self.after(published_date, pk))
+                queryset = queryset.order_by(*self.forward_ordering)
+
+        # One extra row tells us whether there is another page, without COUNT(*).
+        return queryset[:self.page_size + 1], cursor
+
+    def check_ordering(self, request):
+        # Replacing the requested order with the keyset one would return a
+        # different listing than asked for without saying so.
+        ordering = request.query_params.get(self.ordering_param, '').strip()
+        if ordering not in self.keyset_orderings:
+            raise ValidationError({self.ordering_param: [
+                f'Cursor pagination only supports ordering by -published_date, not {ordering!r}.'
+            ]})
+        for param in self.ordering_params:
+            if request.query_params.get(param):
+                raise ValidationError({param: [
+                    f'Cursor pagination cannot be combined with ?{param}=; use page numbers.'
+                ]})
+
+    def set_page(self, results, cursor):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def after(self, published_date, pk):
+        if published_date is None:
+            return Q(published_date__isnull=True, id__lt=pk)
+        return (
+            Q(published_date__lt=published_date) |
+            Q(published_date=published_date, id__lt=pk) |
+            Q(published_date__isnull=True)
+        )
+
+    def before(self, published_date, pk):
+        if published_date is None:
+            return Q(published_date__isnull=False) | Q(published_date__isnull=True, id__gt=pk)
+        return (
+            Q(published_date__gt=published_date) |
+            Q(published_date=published_date, id__gt=pk)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            published_date = data['d'] and parse_datetime(data['d'])
+            if data['d'] and published_date is None:
+                raise ValueError(data['d'])
+            return published_date or None, int(data['i']), bool(data['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def cursor_for(post, reverse=False):
+        # Pages hold model instances or, on the fast list path, values() rows.
+        if isinstance(post, dict):
+            published_date, pk = post['published_date'], post['id']
+        else:
+            published_date, pk = post.published_date, post.pk
+        data = {
+            'd': published_date.isoformat() if published_date else None,
+            'i': pk,
+            'r': reverse,
+        }
+        return base64.urlsafe_b64encode(json.dumps(data).encode('ascii')).decode('ascii')
+
+    def encode_cursor(self, post, reverse):
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.cursor_for(post, reverse)
+        )
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator that counts ``count_queryset``, when given, instead of the
+    queryset it pages through.
+    """
+
+    def __init__(self, object_list, per_page, count_queryset=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_queryset = count_queryset
+
+    @cached_property
+    def count(self):
+        if self.count_queryset is None:
+            return super().count
+        return self.count_queryset.count()
+
+
+class PostPageNumberPagination(PageNumberPagination):
+    """
+    Page-number pagination that can count a cheaper queryset than the page's.
+
+    The rows of ``blog.rows.list_values`` join the author and category for
+    their columns. Those joins never drop a row, but counting through them
+    visits every post, so views pass the unprojected queryset as
+    ``count_queryset``.
+    """
+    django_paginator_class = CountingPaginator
+
+    def paginate_queryset(self, queryset, request, view=None, count_queryset=None):
+        self.django_paginator_class = partial(CountingPaginator, count_queryset=count_queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None, count_queryset=None):
+        """
+        ``paginate_queryset`` for async views: the count and the page are
+        read with the async ORM.
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # A cached property; filled in here so the paginator never queries.
+        paginator.count = await (queryset if count_queryset is None else count_queryset).acount()
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+        self.page.object_list = [post async for post in self.page.object_list.aiterator()]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        self.request = request
+        return list(self.page)
+
+
+class PostPagination(BasePagination):
+    """
+    Page-number pagination, or keyset pagination with ``?pagination=cursor``.
+    """
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+
+    @property
+    def display_page_controls(self):
+        # The browsable API asks on every response, paginated or not.
+        return getattr(getattr(self, 'paginator', None), 'display_page_controls', False)
+
+    def get_paginator(self, request):
+        if request.query_params.get(self.mode_query_param) == self.cursor_mode:
+            return KeysetPagination()
+        return PostPageNumberPagination()
+
+    def paginate_queryset(self, queryset, request, view=None, count_queryset=None):
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view, count_queryset)
+
+    async def apaginate_queryset(self, queryset, request, view=None, count_queryset=None):
+        self.paginator = self.get_paginator(request)
+        return await self.paginator.apaginate_queryset(queryset, request, view, count_queryset)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return PageNumberPagination().get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return data['results']
@@ -0,0 +1,119 @@
+"""
+Column projection derived from serializer declarations.
+
+``project_queryset`` reads a serializer's fields and restricts the queryset
+to the columns it actually renders: ``only()`` on the base model and on every
+``select_related`` model, and projected ``Prefetch`` querysets for nested
+many-serializers. List endpoints therefore never load post bodies or the
+author's password hash.
+
+``SerializerMethodField`` values can depend on anything, so a serializer that
+declares one must list the columns it needs in ``Meta.projection_fields``;
+otherwise its model is loaded in full.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+Projection = namedtuple('Projection', ['only', 'select_related', 'prefetch'])
+
+
+def _serializer_model(serializer):
+    return getattr(getattr(serializer, 'Meta', None), 'model', None)
+
+
+def _plan(serializer, model, prefix, select_related, prefetch):
+    """
+    Return the ``only()`` paths needed for ``serializer`` over ``model``, or
+    ``None`` if they can't be determined. Relations are appended to
+    ``select_related`` and ``prefetch`` as they are found.
+    """
+    meta = getattr(serializer, 'Meta', None)
+    columns = {model._meta.pk.name}
+    columns.update(getattr(meta, 'projection_fields', ()))
+    known = True
+    related_paths = []
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField):
+            known = known and hasattr(meta, 'projection_fields')
+            continue
+        if len(field.source_attrs) != 1:
+            known = False
+            continue
+        name = field.source_attrs[0]
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations such as post_count are computed by the query; any
+            # other attribute (a property) may read arbitrary columns.
+            if hasattr(model, name):
+                known = False
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+            child_model = _serializer_model(child)
+            if model_field.is_relation and child_model is not None:
+                child_columns = _plan(child, child_model, '', [], [])
+                prefetch.append((prefix + name, child_model, child_columns))
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            child_model = _serializer_model(field)
+            if model_field.many_to_one or model_field.one_to_one:
+                columns.add(name)
+                select_related.append(prefix + name)
+                child_columns = _plan(field, child_model, f'{prefix}{name}__', select_related, prefetch)
+                if child_columns is not None:
+                    related_paths.extend(child_columns)
+                continue
+            known = False
+            continue
+
+        if model_field.many_to_many or model_field.one_to_many:
+            # Related-key lists are fetched by their own queries.
+            continue
+        if model_field.concrete:
+            columns.add(model_field.name)
+        elif not model_field.is_relation:
+            known = False
+
+    if not known:
+        return None
+    return [prefix + column for column in sorted(columns)] + related_paths
+
+
+@lru_cache(maxsize=None)
+def projection_for(serializer_class):
+    serializer = serializer_class()
+    select_related, prefetch = [], []
+    only = _plan(serializer, serializer.Meta.model, '', select_related, prefetch)
+    return Projection(
+        only=tuple(only) if only is not None else None,
+        select_related=tuple(select_related),
+        prefetch=tuple(prefetch),
+    )
+
+
+def project_queryset(queryset, serializer_class):
+    """
+    Apply ``select_related``, ``prefetch_related`` and ``only()`` derived from
+    ``serializer_class`` to ``queryset``.
+    """
+    projection = projection_for(serializer_class)
+    if projection.select_related:
+        queryset = queryset.select_related(*projection.select_related)
+    for path, model, columns in projection.prefetch:
+        related = model._default_manager.all()
+        if columns is not None:
+            related = related.only(*columns)
+        queryset = queryset.prefetch_related(Prefetch(path, queryset=related))
+    if projection.only is not None:
+        queryset = queryset.only(*projection.only)
+    return queryset
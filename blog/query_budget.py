@@ -0,0 +1,68 @@
+"""
+Per-endpoint query budgets.
+
+``@query_budget(n)`` declares how many SQL queries a view method may run,
+independent of page size. When ``BLOG_QUERY_BUDGET['ENABLED']`` is set the
+queries are counted on every database connection; going over budget is
+logged, or raised as ``QueryBudgetExceeded`` when ``STRICT`` is set, as
+``QueryBudgetTests`` in ``blog.tests`` does for every budgeted endpoint.
+Disabled budgets cost nothing beyond a settings lookup.
+"""
+import logging
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('blog.queries')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'STRICT': False,
+}
+
+
+def budget_setting(name):
+    return getattr(settings, 'BLOG_QUERY_BUDGET', {}).get(name, DEFAULTS[name])
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+def query_budget(limit):
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if not budget_setting('ENABLED'):
+                return view_method(self, request, *args, **kwargs)
+
+            recorder = QueryRecorder()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = view_method(self, request, *args, **kwargs)
+
+            if len(recorder.queries) > limit:
+                endpoint = f'{type(self).__name__}.{view_method.__name__}'
+                message = (
+                    f'{endpoint} ran {len(recorder.queries)} queries, '
+                    f'budget is {limit}:\n' + '\n'.join(recorder.queries)
+                )
+                if budget_setting('STRICT'):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
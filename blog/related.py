@@ -0,0 +1,205 @@
+"""
+Related posts.
+
+``RelatedPost`` stores, for each published post, its ``NEIGHBORS`` most
+similar published posts, so the ``related`` action is a single indexed read.
+The similarity of two posts is ``TEXT_WEIGHT`` times the cosine of their
+TF-IDF vectors over title and content, plus ``TAG_WEIGHT`` times the Jaccard
+overlap of their tag sets. ``blog.similarity.RelatedIndex`` holds both as
+SciPy sparse matrices and scores blocks of posts against all others with two
+sparse matrix products; it is imported only where an index is built or
+updated.
+
+``rebuild_related_posts`` fits the vocabulary, rewrites every list and saves
+the fitted index to ``INDEX_PATH``. Until the next rebuild, saving, tagging,
+publishing or deleting a post queues a ``related_posts_update`` background
+task (see blog.tasks). Under a lock on the saved index, the task loads it,
+re-vectorizes the posts with its vocabulary, recomputes their lists and the
+lists of the posts in their new lists and of the posts whose lists held
+them, and saves the index again, so updates from every process build on
+each other. Terms first seen after a rebuild are ignored until the next one.
+Run the rebuild periodically; ``--interval`` keeps it running.
+"""
+import fcntl
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .cache import invalidate_tags
+from .models import BlogPost, RelatedPost
+from .tasks import enqueue, task
+
+DEFAULTS = {
+    'NEIGHBORS': 10,
+    'TEXT_WEIGHT': 0.5,
+    'TAG_WEIGHT': 0.5,
+    # Terms in fewer posts than MIN_DF, or in more than MAX_DF of them,
+    # say nothing about similarity and are left out of the vocabulary.
+    'MIN_DF': 2,
+    'MAX_DF': 0.5,
+    # Where rebuilds save the fitted index; None keeps it in the memory of
+    # the process that rebuilt it, which then has to run the updates too.
+    'INDEX_PATH': None,
+    # Seconds after commit before an update runs; edits of a post in the
+    # meantime are collapsed into it.
+    'UPDATE_DELAY': 2,
+}
+
+# Rows per INSERT when writing lists.
+WRITE_BATCH_SIZE = 1000
+
+
+def related_setting(name):
+    return getattr(settings, 'BLOG_RELATED', {}).get(name, DEFAULTS[name])
+
+
+def load_posts(post_ids=None, using=DEFAULT_DB_ALIAS):
+    """
+    ``(ids, texts, tag id lists)`` of the published posts, or of those among
+    ``post_ids``.
+    """
+    posts = BlogPost.objects.using(using).published().order_by('pk')
+    through = BlogPost.tags.through.objects.using(using)
+    if post_ids is not None:
+        posts = posts.filter(pk__in=list(post_ids))
+        through = through.filter(blogpost_id__in=list(post_ids))
+    ids, texts = [], []
+    for pk, title, content in posts.values_list('pk', 'title', 'content').iterator(chunk_size=2000):
+        ids.append(pk)
+        texts.append(f'{title} {content}')
+    tags = defaultdict(list)
+    for post_id, tag_id in through.values_list('blogpost_id', 'tag_id').iterator(chunk_size=2000):
+        tags[post_id].append(tag_id)
+    return ids, texts, [tags[pk] for pk in ids]
+
+
+# The index when INDEX_PATH is None.
+_index = None
+_index_lock = threading.Lock()
+
+
+@contextmanager
+def index_lock():
+    """
+    Hold the index for a read-modify-write; other threads and processes
+    wait.
+    """
+    path = related_setting('INDEX_PATH')
+    with _index_lock:
+        if not path:
+            yield
+            return
+        with open(f'{path}.lock', 'a') as lock:
+            # Released when the file closes.
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+
+def load_index():
+    """
+    The index saved by the last rebuild and the updates since, or ``None``
+    before the first rebuild. Call under ``index_lock``.
+    """
+    path = related_setting('INDEX_PATH')
+    if not path:
+        return _index
+    from .similarity import RelatedIndex
+    try:
+        return RelatedIndex.load(path)
+    except FileNotFoundError:
+        return None
+
+
+def save_index(index):
+    global _index
+    path = related_setting('INDEX_PATH')
+    if path:
+        index.save(path)
+    else:
+        _index = index
+
+
+def store_lists(lists, using=DEFAULT_DB_ALIAS):
+    """
+    Insert ``(post_id, neighbors)`` pairs in batches.
+    """
+    entries = RelatedPost.objects.using(using)
+    batch = []
+    for post_id, neighbors in lists:
+        batch.extend(
+            RelatedPost(post_id=post_id, related_id=related_id, score=score)
+            for related_id, score in neighbors
+        )
+        if len(batch) >= WRITE_BATCH_SIZE:
+            entries.bulk_create(batch)
+            batch = []
+    entries.bulk_create(batch)
+
+
+def write_lists(lists, using=DEFAULT_DB_ALIAS):
+    """
+    Replace the stored lists of the posts in ``lists``.
+    """
+    with transaction.atomic(using=using):
+        RelatedPost.objects.using(using).filter(post_id__in=list(lists)).delete()
+        store_lists(lists.items(), using)
+    invalidate_tags({f'related:{pk}' for pk in lists})
+
+
+def rebuild_related_posts(using=DEFAULT_DB_ALIAS):
+    """
+    Fit a new index over every published post, rewrite all lists, and save
+    the index for incremental updates.
+    """
+    from .similarity import RelatedIndex
+    # Updates wait for the rebuild rather than patch the index it replaces.
+    with index_lock():
+        index = RelatedIndex.fit(*load_posts(using=using))
+        with transaction.atomic(using=using):
+            RelatedPost.objects.using(using).all().delete()
+            store_lists(index.neighbors(range(len(index.post_ids))), using)
+        save_index(index)
+    invalidate_tags({'related'})
+    return index
+
+
+def related_post_ids(post_id, limit=None):
+    limit = limit or related_setting('NEIGHBORS')
+    return RelatedPost.objects.filter(post_id=post_id).order_by('-score').values_list(
+        'related_id', flat=True
+    )[:limit]
+
+
+@task('related_posts_update')
+def update_related_posts(post_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Apply the incremental update of ``post_ids`` to the saved index, store
+    the recomputed lists, and return how many lists were stored.
+    """
+    with index_lock():
+        index = load_index()
+        # Before the first rebuild there are no lists to maintain.
+        if index is None:
+            return 0
+        holders = RelatedPost.objects.using(using).filter(related_id__in=post_ids)
+        lists = index.update(post_ids, load_posts(post_ids, using), holders.values_list('post_id', flat=True))
+        write_lists(lists, using)
+        save_index(index)
+    return len(lists)
+
+
+def queue_related_updates(post_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Queue an update of ``post_ids`` in the current transaction. A single
+    post's update is collapsed with any still queued for it.
+    """
+    post_ids = sorted(set(post_ids))
+    if post_ids:
+        dedup_key = f'related_posts_update:{post_ids[0]}' if len(post_ids) == 1 else None
+        enqueue(
+            'related_posts_update', post_ids,
+            dedup_key=dedup_key, delay=related_setting('UPDATE_DELAY'), using=using,
+        )
@@ -0,0 +1,193 @@
+"""
+Rendered post content.
+
+``render_html`` converts a post's Markdown ``content`` with Python-Markdown
+and sanitizes the result with nh3, keeping only ``ALLOWED_TAGS``,
+``ALLOWED_ATTRIBUTES`` and links with ``URL_SCHEMES``. The HTML is stored on
+the post in ``content_html``, next to the ``content_hash`` it was rendered
+from (``html_hash``) and the ``RENDERER_VERSION`` that rendered it, so each
+revision of a post is rendered once.
+
+Saving a post with new content queues a re-render as a background task (see
+blog.tasks). Requests never render: until the task lands, ``post_html``
+serves the HTML stored for an earlier revision, or ``None`` if there is
+none, and ``html_is_stale`` tells clients the HTML is pending. Renders are
+kept in the shared cache under the renderer version and content hash, so
+re-renders of the same content are reused. Bump ``RENDERER_VERSION``
+whenever the output changes, and after that or a ``bulk_create`` load run
+``rerender_posts``, which re-renders the stale posts on a process pool.
+"""
+import threading
+
+import markdown
+import nh3
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Q
+from django.utils.html import escape
+from rest_framework.renderers import BaseRenderer
+
+from .cache import cache_setting, get_cache
+from .models import BlogPost
+from .tasks import enqueue, task
+
+# Bump on any change to the extensions, the allow-lists or the library
+# versions that changes the output.
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'sane_lists']
+MARKDOWN_EXTENSION_CONFIGS = {
+    # Alignment as an attribute, since style attributes are stripped.
+    'tables': {'use_align_attribute': True},
+}
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'blockquote', 'br', 'code', 'em', 'h1', 'h2', 'h3', 'h4',
+    'h5', 'h6', 'hr', 'img', 'li', 'ol', 'p', 'pre', 'strong', 'table',
+    'tbody', 'td', 'th', 'thead', 'tr', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'abbr': {'title'},
+    'code': {'class'},
+    'img': {'src', 'alt', 'title'},
+    'ol': {'start'},
+    'td': {'align'},
+    'th': {'align'},
+}
+URL_SCHEMES = {'http', 'https', 'mailto'}
+
+DEFAULTS = {
+    # How long on-demand renders stay in the shared cache.
+    'CACHE_TIMEOUT': 24 * 60 * 60,
+}
+
+
+def rendering_setting(name):
+    return getattr(settings, 'BLOG_RENDERING', {}).get(name, DEFAULTS[name])
+
+
+_local = threading.local()
+
+
+def render_html(content):
+    """
+    Sanitized HTML for the Markdown ``content``.
+    """
+    # Markdown instances are reusable but not thread-safe.
+    converter = getattr(_local, 'converter', None)
+    if converter is None:
+        converter = _local.converter = markdown.Markdown(
+            extensions=MARKDOWN_EXTENSIONS, extension_configs=MARKDOWN_EXTENSION_CONFIGS,
+        )
+    html = converter.reset().convert(content)
+    return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, url_schemes=URL_SCHEMES)
+
+
+def render_many(contents):
+    # Runs in rerender_posts' worker processes, so it touches no database.
+    return [render_html(content) for content in contents]
+
+
+def html_key(content_hash):
+    return f"{cache_setting('KEY_PREFIX')}:html:{RENDERER_VERSION}:{content_hash}"
+
+
+def cached_html(content, content_hash):
+    """
+    The rendering of ``content`` from the shared cache, rendered and stored
+    there on a miss.
+    """
+    cache = get_cache()
+    key = html_key(content_hash)
+    html = cache.get(key)
+    if html is None:
+        html = render_html(content)
+        cache.set(key, html, rendering_setting('CACHE_TIMEOUT'))
+    return html
+
+
+def html_is_stale(post):
+    # Read through __dict__ so deferred fields are never loaded here.
+    values = post.__dict__
+    if 'content_hash' not in values:
+        return False
+    return (values.get('html_hash'), values.get('render_version')) != (values['content_hash'], RENDERER_VERSION)
+
+
+def post_html(post):
+    """
+    The stored rendered content of ``post``, which is that of an earlier
+    revision while ``html_is_stale(post)``, or ``None`` before the first
+    render lands.
+    """
+    return post.content_html if post.html_hash else None
+
+
+def stale_posts(queryset):
+    """
+    The posts of ``queryset`` whose stored HTML is missing or out of date.
+    """
+    return queryset.filter(~Q(html_hash=F('content_hash')) | ~Q(render_version=RENDERER_VERSION))
+
+
+def store_html(rendered, using=DEFAULT_DB_ALIAS):
+    """
+    Save ``(post_id, content_hash, html)`` triples and return the ids saved.
+    Posts whose content changed since it was read are skipped; their own
+    re-render is queued.
+    """
+    posts = BlogPost.objects.using(using)
+    saved = []
+    with transaction.atomic(using=using):
+        for pk, content_hash, html in rendered:
+            # update() leaves updated_at alone: rendering is not an edit.
+            if posts.filter(pk=pk, content_hash=content_hash).update(
+                content_html=html, html_hash=content_hash, render_version=RENDERER_VERSION,
+            ):
+                saved.append(pk)
+    return saved
+
+
+@task('render_posts_html')
+def render_posts_html(post_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Render and store the HTML of the posts of ``post_ids`` that are stale,
+    and return how many were stored.
+    """
+    posts = stale_posts(BlogPost.objects.using(using).filter(pk__in=post_ids)).order_by()
+    rendered = [
+        (pk, content_hash, cached_html(content, content_hash))
+        for pk, content_hash, content in posts.values_list('pk', 'content_hash', 'content')
+    ]
+    return len(store_html(rendered, using))
+
+
+def queue_html_renders(post_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Queue a re-render of ``post_ids`` in the current transaction. A single
+    post's re-render is collapsed with any still queued for it.
+    """
+    post_ids = list(post_ids)
+    if post_ids:
+        dedup_key = f'render_posts_html:{post_ids[0]}' if len(post_ids) == 1 else None
+        enqueue('render_posts_html', post_ids, dedup_key=dedup_key, using=using)
+
+
+class PostHTMLRenderer(BaseRenderer):
+    """
+    Selects a post's rendered content as the whole response body with
+    ``?format=html``; error responses render as one escaped paragraph.
+    """
+    media_type = 'text/html'
+    format = 'html'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict) and 'content_html' in data:
+            return data['content_html'] or ''
+        if isinstance(data, dict):
+            data = data.get('detail', data)
+        return f'<p>{escape(data)}</p>'
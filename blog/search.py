@@ -0,0 +1,331 @@
+"""
+Full-text search over blog posts.
+
+Each database vendor gets its own backend: SQLite uses an FTS5 virtual table,
+PostgreSQL a tsvector side table with a GIN index, and anything else falls back
+to the original chained ``icontains`` lookups. The index holds the post title,
+content, author username, category name and tag names, and is kept up to date
+by the signal handlers in ``blog.signals``. Renaming or deleting a category or
+tag, or renaming an author, reindexes their posts in a background task (see
+``blog.tasks``).
+
+Indexed backends match whole words, and on SQLite word prefixes: ``jang``
+does not find "Django" the way the ``icontains`` scan does. So the index only
+serves ranked ``?q=`` searches; ``?search=`` keeps substring matching with
+``substring_filter``.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import BlogPost, Category, Tag
+from .tasks import enqueue, task
+
+SEARCH_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_TAG_NAMES = "group_concat(t.name, ' ')"
+POSTGRES_TAG_NAMES = "string_agg(t.name, ' ')"
+
+# Number of posts re-indexed per statement when rebuilding.
+INDEX_BATCH_SIZE = 500
+
+
+def _source_sql(group_concat):
+    """
+    SELECT producing one (post id, title, content, author, category, tags) row
+    per post; shared by the incremental and full rebuild paths.
+    """
+    post_table = BlogPost._meta.db_table
+    tags_table = BlogPost.tags.through._meta.db_table
+    return (
+        f'SELECT p.id, p.title, p.content, u.username, COALESCE(c.name, \'\'), '
+        f'COALESCE((SELECT {group_concat} FROM {tags_table} pt '
+        f'JOIN {Tag._meta.db_table} t ON t.id = pt.tag_id '
+        f'WHERE pt.blogpost_id = p.id), \'\') '
+        f'FROM {post_table} p '
+        f'JOIN {BlogPost.author.field.related_model._meta.db_table} u ON u.id = p.author_id '
+        f'LEFT JOIN {Category._meta.db_table} c ON c.id = p.category_id'
+    )
+
+
+def substring_filter(queryset, value):
+    """
+    Posts with ``value`` anywhere in their title, content, author username,
+    category name or a tag name.
+    """
+    return queryset.filter(
+        Q(title__icontains=value) |
+        Q(content__icontains=value) |
+        Q(author__username__icontains=value) |
+        Q(category__name__icontains=value) |
+        Q(tags__name__icontains=value)
+    ).distinct()
+
+
+class IContainsSearchBackend:
+    """
+    Unindexed fallback that scans with ``substring_filter``.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def index_posts(self, post_ids):
+        pass
+
+    def remove_posts(self, post_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def filter(self, queryset, value):
+        return substring_filter(queryset, value)
+
+    def search(self, queryset, value):
+        return self.filter(queryset, value).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+class IndexedSearchBackend(IContainsSearchBackend):
+    """
+    Shared plumbing for backends that keep a side table keyed by post id.
+    """
+    index_table = None
+
+    def _execute(self, sql, params=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def _chunks(self, post_ids):
+        post_ids = list(post_ids)
+        for start in range(0, len(post_ids), INDEX_BATCH_SIZE):
+            yield post_ids[start:start + INDEX_BATCH_SIZE]
+
+    def _placeholders(self, values):
+        return ', '.join(['%s'] * len(values))
+
+    def remove_posts(self, post_ids):
+        for chunk in self._chunks(post_ids):
+            self._execute(
+                f'DELETE FROM {self.index_table} WHERE {self.key_column} IN '
+                f'({self._placeholders(chunk)})',
+                chunk
+            )
+
+    def index_posts(self, post_ids):
+        for chunk in self._chunks(post_ids):
+            self.remove_posts(chunk)
+            self._execute(
+                f'{self.insert_sql} WHERE {self.source_id_column} IN '
+                f'({self._placeholders(chunk)})',
+                chunk
+            )
+
+    def rebuild(self):
+        self._execute(f'DELETE FROM {self.index_table}')
+        self._execute(self.insert_sql)
+
+    def match_sql(self, value):
+        """
+        Return ``(sql, params)`` selecting the ids of posts matching ``value``.
+        """
+        raise NotImplementedError
+
+    def rank_sql(self, value):
+        """
+        Return ``(sql, params)`` computing the rank of the current post row;
+        higher is more relevant.
+        """
+        raise NotImplementedError
+
+    def filter(self, queryset, value):
+        match = self.match_sql(value)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(*match))
+
+    def search(self, queryset, value):
+        match = self.match_sql(value)
+        if match is None:
+            return queryset.none().annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            )
+        rank_sql, rank_params = self.rank_sql(value)
+        return queryset.filter(pk__in=RawSQL(*match)).annotate(
+            search_rank=RawSQL(rank_sql, rank_params, output_field=FloatField())
+        )
+
+
+class SQLiteSearchBackend(IndexedSearchBackend):
+    """
+    FTS5 backend. The virtual table uses the post id as its rowid.
+    """
+    index_table = 'blog_post_fts'
+    key_column = 'rowid'
+    source_id_column = 'p.id'
+    # bm25 column weights: title, content, author, category, tags
+    weights = (10.0, 1.0, 2.0, 3.0, 5.0)
+
+    @property
+    def insert_sql(self):
+        return (
+            f'INSERT INTO {self.index_table} '
+            f'(rowid, title, content, author, category, tags) '
+            f'{_source_sql(SQLITE_TAG_NAMES)}'
+        )
+
+    def install(self):
+        self._execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.index_table} USING fts5('
+            f'title, content, author, category, tags, '
+            f'tokenize=\'porter unicode61\')'
+        )
+        self.rebuild()
+
+    def uninstall(self):
+        self._execute(f'DROP TABLE IF EXISTS {self.index_table}')
+
+    def _fts_query(self, value):
+        tokens = SEARCH_TOKEN_RE.findall(value)
+        if not tokens:
+            return None
+        # Quote every token so user input can never be parsed as FTS syntax,
+        # and prefix-match each one to stay close to the old substring search.
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def match_sql(self, value):
+        query = self._fts_query(value)
+        if query is None:
+            return None
+        return (
+            f'SELECT rowid FROM {self.index_table} WHERE {self.index_table} MATCH %s',
+            [query]
+        )
+
+    def rank_sql(self, value):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        table, post_id = self.index_table, f'{BlogPost._meta.db_table}.id'
+        # bm25() is lower-is-better, so negate it.
+        rank = f'-bm25({table}, {weights})'
+        if self.connection.Database.sqlite_version_info < (3, 35):
+            # One MATCH per matching post, quadratic for common terms.
+            return (
+                f'SELECT {rank} FROM {table} WHERE {table} MATCH %s AND rowid = {post_id}',
+                [self._fts_query(value)]
+            )
+        # Rank every match in one pass, then look each row up by id; without
+        # MATERIALIZED SQLite flattens this back into the form above.
+        return (
+            f'WITH ranks AS MATERIALIZED (SELECT rowid AS post_id, {rank} AS rank '
+            f'FROM {table} WHERE {table} MATCH %s) '
+            f'SELECT rank FROM ranks WHERE post_id = {post_id}',
+            [self._fts_query(value)]
+        )
+
+
+class PostgresSearchBackend(IndexedSearchBackend):
+    """
+    tsvector backend. Documents live in a side table with a GIN index so
+    posts themselves stay narrow.
+    """
+    index_table = 'blog_post_search'
+    key_column = 'post_id'
+    source_id_column = 'src.id'
+    config = 'english'
+
+    @property
+    def insert_sql(self):
+        return (
+            f'INSERT INTO {self.index_table} (post_id, document) '
+            f'SELECT id, '
+            f'setweight(to_tsvector(\'{self.config}\', title), \'A\') || '
+            f'setweight(to_tsvector(\'{self.config}\', tags), \'B\') || '
+            f'setweight(to_tsvector(\'{self.config}\', category || \' \' || author), \'C\') || '
+            f'setweight(to_tsvector(\'{self.config}\', content), \'D\') '
+            f'FROM ({_source_sql(POSTGRES_TAG_NAMES)}) '
+            f'AS src (id, title, content, author, category, tags)'
+        )
+
+    def install(self):
+        post_table = BlogPost._meta.db_table
+        self._execute(
+            f'CREATE TABLE IF NOT EXISTS {self.index_table} ('
+            f'post_id bigint PRIMARY KEY REFERENCES {post_table} (id) '
+            f'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            f'document tsvector NOT NULL)'
+        )
+        self._execute(
+            f'CREATE INDEX IF NOT EXISTS {self.index_table}_document_idx '
+            f'ON {self.index_table} USING GIN (document)'
+        )
+        self.rebuild()
+
+    def uninstall(self):
+        self._execute(f'DROP TABLE IF EXISTS {self.index_table}')
+
+    def match_sql(self, value):
+        if not SEARCH_TOKEN_RE.search(value):
+            return None
+        return (
+            f'SELECT post_id FROM {self.index_table} '
+            f'WHERE document @@ websearch_to_tsquery(\'{self.config}\', %s)',
+            [value]
+        )
+
+    def rank_sql(self, value):
+        return (
+            f'SELECT ts_rank(document, websearch_to_tsquery(\'{self.config}\', %s)) '
+            f'FROM {self.index_table} '
+            f'WHERE post_id = {BlogPost._meta.db_table}.id',
+            [value]
+        )
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    connection = connections[using]
+    backend_class = SEARCH_BACKENDS.get(connection.vendor, IContainsSearchBackend)
+    return backend_class(connection)
+
+
+# Label lookups on BlogPost, by change feed kind, plus the post author.
+LABEL_LOOKUPS = {'category': 'category', 'tag': 'tags', 'author': 'author'}
+
+
+@task('index_posts')
+def index_posts(post_ids, using='default'):
+    get_search_backend(using).index_posts(post_ids)
+
+
+@task('index_label_posts')
+def index_label_posts(kind, label_id, using='default'):
+    """
+    Reindex the posts labelled with the category or tag ``label_id``, or
+    written by the user ``label_id`` for the ``author`` kind.
+    """
+    posts = BlogPost.objects.using(using).filter(**{LABEL_LOOKUPS[kind]: label_id})
+    get_search_backend(using).index_posts(list(posts.values_list('pk', flat=True)))
+
+
+def queue_label_reindex(kind, label_id, using='default'):
+    # The task reads the label's posts when it runs, so one still queued
+    # covers this rename too.
+    enqueue(
+        'index_label_posts', kind, label_id,
+        dedup_key=f'index_label_posts:{kind}:{label_id}', using=using,
+    )
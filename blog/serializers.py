@@ -1,17 +1,127 @@
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 from .models import BlogPost, Category, Tag
+from .rendering import html_is_stale, post_html
 from accounts.serializers import UserBriefSerializer
 
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    ``ManyRelatedField`` that hands the whole list to its child relation, so
+    all primary keys are resolved together.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.to_internal_values(data)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    ``PrimaryKeyRelatedField`` that, with ``many=True``, looks every id up in
+    a single ``IN`` query instead of one ``SELECT`` per id. Values and errors
+    are those of the per-id lookups: the first invalid id, in input order,
+    fails with DRF's own message.
+
+    Batch writers can resolve the ids of many items up front and pass them
+    as ``context['resolved_objects']``, a ``{model: {pk: object}}`` mapping;
+    fields then validate against it without querying.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def resolved_objects(self):
+        resolved = self.context.get('resolved_objects')
+        if resolved is None:
+            return None
+        return resolved.get(self.get_queryset().model)
+
+    def to_pk(self, data):
+        """
+        Return ``(data, pk)``: ``data`` through ``pk_field``, as errors
+        report it, and the primary key it names.
+        """
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return data, self.get_queryset().model._meta.pk.to_python(data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def to_internal_value(self, data):
+        resolved = self.resolved_objects()
+        if resolved is None:
+            return super().to_internal_value(data)
+        data, pk = self.to_pk(data)
+        if pk not in resolved:
+            self.fail('does_not_exist', pk_value=data)
+        return resolved[pk]
+
+    def to_internal_values(self, data):
+        keys = []
+        for item in data:
+            try:
+                keys.append(self.to_pk(item))
+            except serializers.ValidationError as exc:
+                # Raised in turn, after any earlier id that does not exist.
+                keys.append((exc, None))
+        objects = self.resolved_objects()
+        if objects is None:
+            pks = {pk for _, pk in keys if pk is not None}
+            objects = self.get_queryset().in_bulk(pks) if pks else {}
+        values = []
+        for data, pk in keys:
+            if isinstance(data, serializers.ValidationError):
+                raise data
+            if pk not in objects:
+                self.fail('does_not_exist', pk_value=data)
+            values.append(objects[pk])
+        return values
+
+
+def prime_prefetch_cache(instance, name, objects):
+    """
+    Store ``objects`` as the prefetched value of the many-to-many ``name``,
+    in the related model's default ordering, so rendering ``instance`` does
+    not query them again.
+    """
+    manager = getattr(instance, name)
+    ordering = manager.model._meta.ordering
+    if not all(isinstance(field, str) and field.isidentifier() for field in ordering):
+        # Descending or expression orderings: let rendering query instead.
+        return
+    queryset = manager.all()
+    # Validated ids keep any repeats in the payload; the relation does not.
+    objects = list(dict.fromkeys(objects))
+    queryset._result_cache = sorted(objects, key=attrgetter(*ordering)) if ordering else objects
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[manager.prefetch_cache_name] = queryset
+
+
 class CategorySerializer(serializers.ModelSerializer):
-    post_count = serializers.IntegerField(read_only=True)
-    
+    # published_post_count and total_views stay internal; see blog.admin.
     class Meta:
         model = Category
         fields = ('id', 'name', 'description', 'created_at', 'post_count')
 
 class TagSerializer(serializers.ModelSerializer):
-    post_count = serializers.IntegerField(read_only=True)
-    
     class Meta:
         model = Tag
         fields = ('id', 'name', 'created_at', 'post_count')
@@ -20,8 +130,6 @@ class BlogPostListSerializer(serializers.ModelSerializer):
     author = UserBriefSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    excerpt = serializers.SerializerMethodField()
-    read_time = serializers.SerializerMethodField()
     
     class Meta:
         model = BlogPost
@@ -31,32 +139,56 @@ class BlogPostListSerializer(serializers.ModelSerializer):
             'is_featured', 'read_time', 'created_at'
         )
         read_only_fields = ('published_date', 'view_count')
-    
-    def get_excerpt(self, obj):
-        return obj.excerpt
-    
-    def get_read_time(self, obj):
-        return obj.read_time
 
 class BlogPostDetailSerializer(serializers.ModelSerializer):
     author = UserBriefSerializer(read_only=True)
-    category = serializers.PrimaryKeyRelatedField(
+    category = BulkPrimaryKeyRelatedField(
         queryset=Category.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True,
         required=False
     )
+    # Stored per content revision, never rendered on a read; see blog.rendering.
+    content_html = serializers.SerializerMethodField()
+    content_html_pending = serializers.SerializerMethodField()
     
     class Meta:
         model = BlogPost
-        fields = '__all__'
+        fields = (
+            'id', 'author', 'category', 'tags', 'content_html', 'content_html_pending',
+            'title', 'content', 'published_date', 'created_at', 'updated_at', 'status',
+            'view_count', 'is_featured', 'excerpt', 'word_count', 'read_time',
+        )
         read_only_fields = (
             'author', 'view_count', 'created_at', 'updated_at'
         )
     
+    def get_content_html(self, post):
+        return post_html(post)
+    
+    def get_content_html_pending(self, post):
+        return html_is_stale(post)
+    
+    def create(self, validated_data):
+        tags = validated_data.get('tags')
+        instance = super().create(validated_data)
+        if tags is not None:
+            prime_prefetch_cache(instance, 'tags', tags)
+        return instance
+
+    def update(self, instance, validated_data):
+        tags = validated_data.get('tags')
+        instance = super().update(instance, validated_data)
+        if tags is not None:
+            prime_prefetch_cache(instance, 'tags', tags)
+        return instance
+
     def to_representation(self, instance):
+        # Load tags once for both the primary-key field and the nested
+        # representation below; a no-op when the view already prefetched them.
+        prefetch_related_objects([instance], 'tags')
         representation = super().to_representation(instance)
         representation['category'] = CategorySerializer(instance.category).data
         representation['tags'] = TagSerializer(instance.tags.all(), many=True).data
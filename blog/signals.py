@@ -0,0 +1,373 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+from django.db.models import Count, Q, Sum
+from .cache import invalidate_tags
+from .changes import record_changes
+from .counters import adjust_author_stats, adjust_stats, contribution_delta, post_contribution
+from .models import BlogPost, Category, Change, RelatedPost, Tag
+from .related import queue_related_updates
+from .rendering import html_is_stale, queue_html_renders
+from .search import get_search_backend, queue_label_reindex
+from .tasks import enqueue
+from .trending import sync_trending_scores
+
+LABEL_KINDS = {Category: Change.Kind.CATEGORY, Tag: Change.Kind.TAG}
+
+
+@receiver(post_save, sender=BlogPost)
+def index_post(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    get_search_backend(using).index_posts([instance.pk])
+
+
+@receiver(post_delete, sender=BlogPost)
+def unindex_post(sender, instance, using='default', **kwargs):
+    get_search_backend(using).remove_posts([instance.pk])
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def reindex_post_tags(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        post_ids = [instance.pk]
+    elif action == 'post_clear':
+        # pk_set is not provided for a clear; see capture_cleared_relations.
+        post_ids = getattr(instance, '_cleared_related_ids', [])
+    else:
+        post_ids = pk_set or []
+    get_search_backend(using).index_posts(post_ids)
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def capture_cleared_relations(sender, instance, action, reverse, **kwargs):
+    if action == 'pre_clear':
+        related = instance.blog_posts if reverse else instance.tags
+        instance._cleared_related_ids = list(related.values_list('pk', flat=True))
+
+
+@receiver(post_init, sender=Category)
+@receiver(post_init, sender=Tag)
+def remember_loaded_label_name(sender, instance, **kwargs):
+    # As remember_loaded_username, for category and tag renames.
+    instance._loaded_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def reindex_renamed_posts(sender, instance, created, raw=False, using='default', **kwargs):
+    # Category and tag names are part of every post document they label.
+    # A label can have thousands of posts, so they are reindexed in the
+    # background; see blog.tasks.
+    loaded, instance._loaded_name = getattr(instance, '_loaded_name', None), instance.name
+    if raw or created or loaded == instance.name:
+        return
+    queue_label_reindex(LABEL_KINDS[sender], instance.pk, using)
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Tag)
+def capture_deleted_label_posts(sender, instance, **kwargs):
+    instance._search_post_ids = list(instance.blog_posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def reindex_unlabelled_posts(sender, instance, using='default', **kwargs):
+    post_ids = getattr(instance, '_search_post_ids', [])
+    if post_ids:
+        enqueue('index_posts', post_ids, using=using)
+
+
+@receiver(post_init, sender=User)
+def remember_loaded_username(sender, instance, **kwargs):
+    # Lets a save tell a rename without reading the row back; None when the
+    # username was deferred.
+    instance._loaded_username = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=User)
+def reindex_renamed_author_posts(sender, instance, created, raw=False, using='default', **kwargs):
+    # The author's username is part of every post document they wrote.
+    loaded, instance._loaded_username = getattr(instance, '_loaded_username', None), instance.username
+    if raw or created or loaded == instance.username:
+        return
+    queue_label_reindex('author', instance.pk, using)
+    invalidate_tags({f'author:{instance.pk}'})
+
+
+# Response cache invalidation (see blog.cache). Listings that already show an
+# object are evicted through the object's own tag; the collection tags below
+# cover responses that the object may newly appear in. "posts" covers every
+# post listing, including filtered and per-user ones.
+
+@receiver(post_save, sender=BlogPost)
+def invalidate_saved_post(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    tags = {'posts', f'post:{instance.pk}', f'author:{instance.author_id}'}
+    saved_state = getattr(instance, '_saved_state', {})
+    for category_id in (instance.category_id, saved_state.get('category_id')):
+        if category_id:
+            tags.add(f'category:{category_id}')
+    if instance.status == BlogPost.Status.PUBLISHED:
+        tags.update({'posts:published', 'posts:trending'})
+        if instance.is_featured:
+            tags.add('posts:featured')
+    invalidate_tags(tags)
+
+
+@receiver(pre_delete, sender=BlogPost)
+def capture_deleted_post_tags(sender, instance, **kwargs):
+    instance._cached_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=BlogPost)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    tags = {'posts', f'post:{instance.pk}'}
+    tags.update(f'tag:{tag_id}' for tag_id in getattr(instance, '_cached_tag_ids', []))
+    if instance.category_id:
+        tags.add(f'category:{instance.category_id}')
+    invalidate_tags(tags)
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def invalidate_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_related_ids', [])
+    if reverse:
+        tags = {f'tag:{instance.pk}'} | {f'post:{pk}' for pk in pk_set or []}
+    else:
+        tags = {f'post:{instance.pk}'} | {f'tag:{pk}' for pk in pk_set or []}
+    invalidate_tags(tags | {'posts'})
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    invalidate_tags({f'category:{instance.pk}', 'categories', 'posts'})
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    invalidate_tags({f'tag:{instance.pk}', 'tags', 'posts'})
+
+
+# Denormalized PostStats counters (see blog.counters). These run inside the
+# transaction of the save, delete or m2m change that triggered them.
+
+def _stored_contribution(post, using, sign=1):
+    # view_count moves through F() updates, so the instance's copy may be
+    # stale; count what the database holds.
+    status, view_count = BlogPost.objects.using(using).filter(pk=post.pk).values_list(
+        'status', 'view_count'
+    ).get()
+    return post_contribution(status, view_count, sign)
+
+
+def _apply_post_stats(using, category_id, author_id, deltas):
+    if category_id:
+        adjust_stats(Category.objects.using(using).filter(pk=category_id), deltas)
+    adjust_author_stats(author_id, deltas, using)
+
+
+@receiver(pre_save, sender=BlogPost)
+def capture_stored_post_state(sender, instance, raw=False, using='default', **kwargs):
+    # The row as stored, rather than as loaded: buffered view flushes may
+    # have moved view_count since.
+    instance._stored_state = None
+    if raw or instance._state.adding:
+        return
+    instance._stored_state = BlogPost.objects.using(using).filter(pk=instance.pk).values(
+        *BlogPost.TRACKED_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=BlogPost)
+def count_saved_post(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    new = post_contribution(instance.status, instance.view_count)
+    if created:
+        _apply_post_stats(using, instance.category_id, instance.author_id, new)
+        return
+
+    state = getattr(instance, '_stored_state', None)
+    if state is None:
+        return
+    old = post_contribution(state['status'], state['view_count'])
+    delta = contribution_delta(old, new)
+    if (state['category_id'], state['author_id']) == (instance.category_id, instance.author_id):
+        _apply_post_stats(using, instance.category_id, instance.author_id, delta)
+    else:
+        removed = post_contribution(state['status'], state['view_count'], sign=-1)
+        _apply_post_stats(using, state['category_id'], state['author_id'], removed)
+        _apply_post_stats(using, instance.category_id, instance.author_id, new)
+
+    # Tag membership is counted by the m2m handler; only status and view
+    # changes reach the tags from here.
+    delta['post_count'] = 0
+    adjust_stats(Tag.objects.using(using).filter(blog_posts=instance), delta)
+
+
+@receiver(pre_delete, sender=BlogPost)
+def capture_deleted_post_stats(sender, instance, using='default', **kwargs):
+    instance._removed_contribution = _stored_contribution(instance, using, sign=-1)
+
+
+@receiver(post_delete, sender=BlogPost)
+def count_deleted_post(sender, instance, using='default', **kwargs):
+    removed = instance._removed_contribution
+    _apply_post_stats(using, instance.category_id, instance.author_id, removed)
+    tag_ids = getattr(instance, '_cached_tag_ids', [])
+    if tag_ids:
+        adjust_stats(Tag.objects.using(using).filter(pk__in=tag_ids), removed)
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def count_post_tags(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_related_ids', [])
+    if not pk_set:
+        return
+    sign = 1 if action == 'post_add' else -1
+
+    if not reverse:
+        contribution = _stored_contribution(instance, using, sign)
+        adjust_stats(Tag.objects.using(using).filter(pk__in=pk_set), contribution)
+        return
+
+    totals = BlogPost.objects.using(using).filter(pk__in=pk_set).aggregate(
+        post_count=Count('pk'),
+        published_post_count=Count('pk', filter=Q(status=BlogPost.Status.PUBLISHED)),
+        total_views=Sum('view_count'),
+    )
+    adjust_stats(
+        Tag.objects.using(using).filter(pk=instance.pk),
+        {field: sign * (value or 0) for field, value in totals.items()}
+    )
+
+
+# Trending scores (see blog.trending) follow the post's status and category.
+
+@receiver(post_save, sender=BlogPost)
+def sync_saved_post_trending(sender, instance, created, raw=False, using='default', **kwargs):
+    state = getattr(instance, '_stored_state', None)
+    if raw or created or state is None:
+        return
+    if (state['status'], state['category_id']) != (instance.status, instance.category_id):
+        sync_trending_scores({instance.pk: instance}, using)
+
+
+# Related-post lists (see blog.related) follow post text, tags and status,
+# updated by background tasks queued with the write.
+
+@receiver(post_save, sender=BlogPost)
+def queue_saved_post_related(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    state = getattr(instance, '_stored_state', None) or {}
+    if BlogPost.Status.PUBLISHED in (instance.status, state.get('status')):
+        queue_related_updates([instance.pk], using)
+
+
+@receiver(pre_delete, sender=BlogPost)
+def capture_related_holders(sender, instance, using='default', **kwargs):
+    # Lists holding the post lose it through the cascade and need refilling.
+    instance._related_holder_ids = list(
+        RelatedPost.objects.using(using).filter(related=instance).values_list('post_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=BlogPost)
+def queue_deleted_post_related(sender, instance, using='default', **kwargs):
+    queue_related_updates([instance.pk, *getattr(instance, '_related_holder_ids', [])], using)
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def queue_tagged_post_related(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        post_ids = [instance.pk]
+    elif action == 'post_clear':
+        post_ids = getattr(instance, '_cleared_related_ids', [])
+    else:
+        post_ids = pk_set or []
+    queue_related_updates(post_ids, using)
+
+
+@receiver(post_delete, sender=Tag)
+def queue_untagged_posts_related(sender, instance, using='default', **kwargs):
+    queue_related_updates(getattr(instance, '_search_post_ids', []), using)
+
+
+# Rendered HTML (see blog.rendering) follows the content, re-rendered by a
+# background task queued with the save.
+
+@receiver(post_save, sender=BlogPost)
+def queue_saved_post_html(sender, instance, raw=False, using='default', **kwargs):
+    if not raw and html_is_stale(instance):
+        queue_html_renders([instance.pk], using)
+
+
+# Change feed (see blog.changes). Entries are written in the transaction of
+# the write they record.
+
+@receiver(post_save, sender=BlogPost)
+def record_saved_post(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    state = getattr(instance, '_stored_state', None)
+    if created:
+        action = Change.Action.CREATE
+    elif state is not None and state['status'] != instance.status:
+        action = Change.Action.STATUS
+    else:
+        action = Change.Action.UPDATE
+    record_changes(Change.Kind.POST, [instance.pk], action, using)
+
+
+@receiver(post_delete, sender=BlogPost)
+def record_deleted_post(sender, instance, using='default', **kwargs):
+    record_changes(Change.Kind.POST, [instance.pk], Change.Action.DELETE, using)
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def record_tagged_posts(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        post_ids = [instance.pk]
+    elif action == 'post_clear':
+        post_ids = getattr(instance, '_cleared_related_ids', [])
+    else:
+        post_ids = pk_set or []
+    record_changes(Change.Kind.POST, post_ids, Change.Action.UPDATE, using)
+
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def record_saved_label(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    action = Change.Action.CREATE if created else Change.Action.UPDATE
+    record_changes(LABEL_KINDS[sender], [instance.pk], action, using)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def record_deleted_label(sender, instance, using='default', **kwargs):
+    record_changes(LABEL_KINDS[sender], [instance.pk], Change.Action.DELETE, using)
+    # Their posts lost the category or tag without a signal of their own.
+    record_changes(Change.Kind.POST, getattr(instance, '_search_post_ids', []), Change.Action.UPDATE, using)
@@ -0,0 +1,218 @@
+"""
+Similarity index for related posts (see blog.related), on NumPy and SciPy.
+
+Imported when an index is built, loaded or updated, so web processes that
+only read the stored lists never load either library.
+"""
+import os
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from .related import related_setting
+from .search import SEARCH_TOKEN_RE
+
+# Similarity scores (and dense term weights) held in memory at once while
+# finding neighbours.
+BLOCK_CELLS = 2 ** 21
+
+
+def tokenize(text):
+    return SEARCH_TOKEN_RE.findall(text.lower())
+
+
+def count_matrix(texts, columns):
+    """
+    Term counts of ``texts`` over the vocabulary ``columns`` (term to column),
+    as a CSR matrix; terms outside it are dropped.
+    """
+    indptr, indices, data = [0], [], []
+    for text in texts:
+        for term, count in Counter(tokenize(text)).items():
+            column = columns.get(term)
+            if column is not None:
+                indices.append(column)
+                data.append(count)
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr)),
+        shape=(len(texts), len(columns)),
+    )
+
+
+def tfidf(counts, idf):
+    """
+    Sublinear TF-IDF weights of ``counts``, with rows scaled to unit length.
+    """
+    weights = counts.copy()
+    weights.data = 1 + np.log(weights.data)
+    weights = weights @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sparse.csr_matrix(sparse.diags(scale) @ weights)
+
+
+def tag_matrix(tag_lists, columns):
+    indptr, indices = [0], []
+    for tag_ids in tag_lists:
+        indices.extend(columns[tag_id] for tag_id in set(tag_ids))
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.ones(len(indices)), np.array(indices, dtype=np.int32), np.array(indptr)),
+        shape=(len(tag_lists), len(columns)),
+    )
+
+
+class RelatedIndex:
+    """
+    TF-IDF and tag matrices with one row per indexed post. Rows of posts
+    that were re-vectorized or unpublished since the last rebuild are zeroed
+    rather than removed, and score 0 against everything.
+    """
+
+    def __init__(self, post_ids, terms, idf, text, tag_ids, tags):
+        self.post_ids = np.asarray(post_ids, dtype=np.int64)
+        self.terms = list(terms)
+        self.columns = {term: column for column, term in enumerate(self.terms)}
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.text = sparse.csr_matrix(text)
+        self.tag_columns = {int(tag_id): column for column, tag_id in enumerate(tag_ids)}
+        self.tags = sparse.csr_matrix(tags)
+        self.tag_sizes = np.asarray(self.tags.sum(axis=1)).ravel()
+        self.rows = {int(pk): row for row, pk in enumerate(self.post_ids)}
+
+    @classmethod
+    def fit(cls, post_ids, texts, tag_lists):
+        vocabulary = {}
+        for text in texts:
+            for term in tokenize(text):
+                vocabulary.setdefault(term, len(vocabulary))
+        counts = count_matrix(texts, vocabulary)
+        document_frequency = np.bincount(counts.indices, minlength=len(vocabulary))
+        min_df = related_setting('MIN_DF')
+        max_df = max(min_df, related_setting('MAX_DF') * len(post_ids))
+        kept = np.flatnonzero((document_frequency >= min_df) & (document_frequency <= max_df))
+        terms = list(vocabulary)
+        idf = np.log((1 + len(post_ids)) / (1 + document_frequency[kept])) + 1
+        tag_ids = sorted({tag_id for tag_ids in tag_lists for tag_id in tag_ids})
+        return cls(
+            post_ids, [terms[column] for column in kept], idf,
+            tfidf(counts[:, kept], idf),
+            tag_ids, tag_matrix(tag_lists, {tag_id: column for column, tag_id in enumerate(tag_ids)}),
+        )
+
+    def save(self, path):
+        # Written aside and renamed, so other processes never load half a file.
+        partial = f'{path}.partial'
+        with open(partial, 'wb') as file:
+            np.savez(
+                file, post_ids=self.post_ids, terms=np.array(self.terms, dtype=str), idf=self.idf,
+                text_data=self.text.data, text_indices=self.text.indices,
+                text_indptr=self.text.indptr, text_shape=np.array(self.text.shape),
+                tag_ids=np.array(sorted(self.tag_columns, key=self.tag_columns.get), dtype=np.int64),
+                tags_data=self.tags.data, tags_indices=self.tags.indices,
+                tags_indptr=self.tags.indptr, tags_shape=np.array(self.tags.shape),
+            )
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            def matrix(name):
+                return sparse.csr_matrix(
+                    (arrays[f'{name}_data'], arrays[f'{name}_indices'], arrays[f'{name}_indptr']),
+                    shape=tuple(arrays[f'{name}_shape']),
+                )
+            return cls(
+                arrays['post_ids'], arrays['terms'].tolist(), arrays['idf'], matrix('text'),
+                arrays['tag_ids'], matrix('tags'),
+            )
+
+    def similarities(self, rows):
+        """
+        Dense block of the scores of ``rows`` against every row.
+        """
+        rows = np.asarray(rows)
+        # A sparse matrix times a dense block beats a sparse product here,
+        # since most pairs share some term.
+        scores = related_setting('TEXT_WEIGHT') * (self.text @ self.text[rows].T.toarray()).T
+        # Few pairs share a tag, so Jaccard is only computed for those.
+        shared = (self.tags[rows] @ self.tags.T).tocoo()
+        shared_rows, columns, counts = shared.row, shared.col, shared.data
+        union = self.tag_sizes[rows[shared_rows]] + self.tag_sizes[columns] - counts
+        positive = counts > 0
+        scores[shared_rows[positive], columns[positive]] += (
+            related_setting('TAG_WEIGHT') * counts[positive] / union[positive]
+        )
+        scores[np.arange(len(rows)), rows] = 0
+        return scores
+
+    def neighbors(self, rows):
+        """
+        Yield ``(post_id, [(related_id, score), ...])`` for each of ``rows``,
+        best first, scoring ``BLOCK_CELLS`` pairs at a time.
+        """
+        count = min(related_setting('NEIGHBORS'), len(self.post_ids))
+        block = max(1, BLOCK_CELLS // max(1, len(self.post_ids), len(self.terms)))
+        rows = list(rows)
+        for start in range(0, len(rows), block):
+            chunk = rows[start:start + block]
+            scores = self.similarities(chunk)
+            if count < scores.shape[1]:
+                top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            else:
+                top = np.tile(np.arange(scores.shape[1]), (len(chunk), 1))
+            for index, row in enumerate(chunk):
+                columns = top[index][np.argsort(-scores[index, top[index]], kind='stable')]
+                yield int(self.post_ids[row]), [
+                    (int(self.post_ids[column]), float(scores[index, column]))
+                    for column in columns if scores[index, column] > 0
+                ]
+
+    def update(self, post_ids, posts, holders):
+        """
+        Re-vectorize ``post_ids`` from ``posts``, their ``(ids, texts, tag id
+        lists)`` as ``load_posts`` reads them, dropping the ones no longer
+        published. Return the recomputed lists as ``{post_id: neighbors}``:
+        theirs, and those of their new neighbours and of ``holders``, the
+        posts whose lists held them.
+        """
+        ids, texts, tag_lists = posts
+        for pk in post_ids:
+            row = self.rows.pop(pk, None)
+            if row is not None:
+                self.clear_row(row)
+        if ids:
+            self.append_rows(ids, texts, tag_lists)
+        lists = dict(self.neighbors(self.rows[pk] for pk in ids))
+        affected = set(holders)
+        for neighbors in lists.values():
+            affected.update(pk for pk, _ in neighbors)
+        affected = [pk for pk in affected if pk in self.rows and pk not in lists]
+        lists.update(self.neighbors(self.rows[pk] for pk in affected))
+        # Unpublished posts keep no list.
+        lists.update({pk: [] for pk in post_ids if pk not in lists})
+        return lists
+
+    def clear_row(self, row):
+        for matrix in (self.text, self.tags):
+            matrix.data[matrix.indptr[row]:matrix.indptr[row + 1]] = 0
+        self.tag_sizes[row] = 0
+
+    def append_rows(self, ids, texts, tag_lists):
+        for tag_ids in tag_lists:
+            for tag_id in tag_ids:
+                self.tag_columns.setdefault(tag_id, len(self.tag_columns))
+        # Tags created since the rebuild get new columns.
+        tags = sparse.csr_matrix(
+            (self.tags.data, self.tags.indices, self.tags.indptr),
+            shape=(self.tags.shape[0], len(self.tag_columns)),
+        )
+        new_tags = tag_matrix(tag_lists, self.tag_columns)
+        first = len(self.post_ids)
+        self.text = sparse.vstack([self.text, tfidf(count_matrix(texts, self.columns), self.idf)], format='csr')
+        self.tags = sparse.vstack([tags, new_tags], format='csr')
+        self.tag_sizes = np.concatenate([self.tag_sizes, np.asarray(new_tags.sum(axis=1)).ravel()])
+        self.post_ids = np.concatenate([self.post_ids, np.asarray(ids, dtype=np.int64)])
+        self.rows.update({pk: first + offset for offset, pk in enumerate(ids)})
@@ -0,0 +1,462 @@
+"""
+Background tasks.
+
+Slow follow-up work, such as rendering post HTML or reindexing the posts of
+a renamed category, is queued as ``Task`` rows rather than done in the
+request. There is no broker: ``enqueue`` writes the row in the transaction
+that calls for the work, so a task exists exactly when that transaction
+commits and survives restarts, and workers claim rows from the same
+database.
+
+Functions become tasks with the ``task`` decorator, under the name stored
+on the row. Define them in modules imported when the app loads, so every
+worker process knows them. A task is called with the row's JSON
+``arguments`` and the ``using`` alias of its queue, inside a transaction,
+and must be safe to run twice: a task whose worker dies mid-run is retried
+once its ``LEASE`` runs out.
+
+A task queued with a ``dedup_key`` while another with that key waits to run
+is dropped, and the waiting one does the work of both. Keys only collapse
+tasks that have not started, so work queued while a task runs is not lost.
+
+Claims take the oldest ready rows with ``SELECT ... FOR UPDATE SKIP LOCKED``
+where the database has it (PostgreSQL), so concurrent workers skip each
+other's rows instead of queuing behind them. SQLite has no row locks but
+serializes writes; there a claim is a single ``UPDATE`` of the oldest ready
+rows, which no other claim can interleave with.
+
+A failed task is retried ``RETRY_DELAY`` seconds later, doubling with each
+attempt up to ``MAX_RETRY_DELAY``, until it has had ``MAX_ATTEMPTS``; then
+it is kept as failed, with its traceback. Finished tasks are kept for
+``KEEP_FINISHED`` seconds for ``queue_stats``, the queue depth and latency
+figures served at /api/blog/task-stats/.
+
+``manage.py run_worker`` runs tasks on a pool of threads or processes. With
+``RUN_IN_PROCESS`` on, the process that queued a task also runs it, on a
+background thread after commit, which suits development and single-process
+deployments; turn it off where workers run. Server processes (see
+postflow.wsgi and postflow.asgi) also run the tasks left queued before they
+started.
+"""
+import logging
+import multiprocessing
+import operator
+import random
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+from functools import reduce
+
+import django
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, close_old_connections, connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .benchmarks import percentile
+from .models import Task
+
+logger = logging.getLogger('blog.tasks')
+
+DEFAULTS = {
+    # Run tasks on a background thread of the process that queued them,
+    # IN_PROCESS_DELAY seconds after commit (0: at commit, in the
+    # committing thread). Turn off where run_worker processes take them.
+    'RUN_IN_PROCESS': True,
+    'IN_PROCESS_DELAY': 1,
+    'MAX_ATTEMPTS': 5,
+    # Seconds before the first retry; doubles with each failed attempt.
+    'RETRY_DELAY': 10,
+    'MAX_RETRY_DELAY': 60 * 60,
+    # Seconds a claim holds a task. Workers renew the claims of running
+    # tasks; the tasks of a worker that stopped renewing are retried.
+    'LEASE': 5 * 60,
+    # How often an idle worker looks for ready tasks, in seconds.
+    'POLL_INTERVAL': 1,
+    # Seconds done tasks are kept for the latency figures. Failed tasks are
+    # kept until deleted.
+    'KEEP_FINISHED': 24 * 60 * 60,
+}
+
+# Rows per INSERT when queuing many tasks.
+ENQUEUE_BATCH_SIZE = 500
+
+# Characters of a failed attempt's traceback kept in last_error.
+MAX_ERROR_LENGTH = 10000
+
+# Most recently finished tasks the latency figures are computed over.
+LATENCY_SAMPLE_SIZE = 1000
+
+# Seconds between lease renewals, expiry checks and purges in a worker.
+MAINTENANCE_INTERVAL = 30
+
+# Task name -> (function, max_attempts or None for MAX_ATTEMPTS).
+registry = {}
+
+
+def tasks_setting(name):
+    return getattr(settings, 'BLOG_TASKS', {}).get(name, DEFAULTS[name])
+
+
+def task(name, max_attempts=None):
+    """
+    Register the decorated function as the task ``name``.
+    """
+    def register(function):
+        registry[name] = (function, max_attempts)
+        return function
+    return register
+
+
+def enqueue(name, *arguments, dedup_key=None, delay=0, using=DEFAULT_DB_ALIAS):
+    """
+    Queue the task ``name`` with ``arguments`` in the current transaction,
+    to run ``delay`` seconds after it commits at the earliest.
+    """
+    enqueue_many(name, [arguments], [dedup_key], delay, using)
+
+
+def enqueue_many(name, calls, dedup_keys=None, delay=0, using=DEFAULT_DB_ALIAS):
+    """
+    Queue the task ``name`` once per argument list of ``calls``, with the
+    matching key of ``dedup_keys``, in the current transaction.
+    """
+    if name not in registry:
+        raise ValueError(f'No task is registered as {name!r}')
+    calls = [list(arguments) for arguments in calls]
+    if not calls:
+        return
+    dedup_keys = dedup_keys or [None] * len(calls)
+    max_attempts = registry[name][1] or tasks_setting('MAX_ATTEMPTS')
+    run_at = timezone.now() + timedelta(seconds=delay)
+    # Conflicts are on the queued dedup keys only: those tasks are dropped.
+    Task.objects.using(using).bulk_create(
+        [
+            Task(name=name, arguments=arguments, dedup_key=key, max_attempts=max_attempts, run_at=run_at)
+            for arguments, key in zip(calls, dedup_keys)
+        ],
+        batch_size=ENQUEUE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    in_process_tasks.queued(using)
+
+
+def claim_tasks(limit, using=DEFAULT_DB_ALIAS):
+    """
+    Claim up to ``limit`` ready tasks, oldest first, and return them.
+    """
+    now = timezone.now()
+    lock_id = uuid.uuid4().hex
+    tasks = Task.objects.using(using)
+    ready = tasks.filter(status=Task.Status.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    claim = {
+        'status': Task.Status.RUNNING,
+        'lock_id': lock_id,
+        'locked_until': now + timedelta(seconds=tasks_setting('LEASE')),
+        'started_at': now,
+        'attempts': F('attempts') + 1,
+    }
+    if connections[using].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=using):
+            task_ids = list(ready.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            tasks.filter(pk__in=task_ids).update(**claim)
+    else:
+        tasks.filter(pk__in=ready.values('pk')[:limit]).update(**claim)
+    return list(tasks.filter(status=Task.Status.RUNNING, lock_id=lock_id).order_by('run_at', 'id'))
+
+
+def run_task(name, arguments, using=DEFAULT_DB_ALIAS):
+    """
+    Call the task ``name`` with ``arguments`` in a transaction.
+    """
+    function, _ = registry[name]
+    with transaction.atomic(using=using):
+        function(*arguments, using=using)
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before retrying a task that has failed ``attempts`` times.
+    """
+    delay = min(tasks_setting('RETRY_DELAY') * 2 ** (attempts - 1), tasks_setting('MAX_RETRY_DELAY'))
+    # Up to a quarter less, so tasks that failed together retry apart.
+    return delay * random.uniform(0.75, 1)
+
+
+def finish_task(task, error=None, using=DEFAULT_DB_ALIAS):
+    """
+    Record how the claimed ``task`` ended: done, or, given the ``error`` it
+    raised, queued for a retry or failed. Does nothing if the claim was lost.
+    """
+    if error is None:
+        complete_tasks([task], using)
+        return
+    logger.warning(
+        'Task %s %s failed on attempt %d of %d: %r',
+        task.pk, task.name, task.attempts, task.max_attempts, error,
+    )
+    _record_failure(task, ''.join(traceback.format_exception(error)), using)
+
+
+def complete_tasks(tasks, using=DEFAULT_DB_ALIAS):
+    """
+    Mark the claimed ``tasks`` done, in one statement.
+    """
+    if tasks:
+        claims = reduce(operator.or_, (Q(pk=task.pk, lock_id=task.lock_id) for task in tasks))
+        Task.objects.using(using).filter(claims).update(
+            status=Task.Status.DONE, finished_at=timezone.now(), lock_id='', locked_until=None,
+        )
+
+
+def _record_failure(task, message, using):
+    now = timezone.now()
+    claimed = Task.objects.using(using).filter(pk=task.pk, lock_id=task.lock_id)
+    ended = {'finished_at': now, 'last_error': message[-MAX_ERROR_LENGTH:], 'lock_id': '', 'locked_until': None}
+    if task.attempts >= task.max_attempts:
+        claimed.update(status=Task.Status.FAILED, **ended)
+        return
+    try:
+        with transaction.atomic(using=using):
+            claimed.update(
+                status=Task.Status.QUEUED, run_at=now + timedelta(seconds=retry_delay(task.attempts)),
+                last_error=ended['last_error'], lock_id='', locked_until=None,
+            )
+    except IntegrityError:
+        # A task with the same key was queued since this one started, and
+        # does its work.
+        claimed.update(status=Task.Status.DONE, **ended)
+
+
+def renew_leases(lock_ids, using=DEFAULT_DB_ALIAS):
+    if lock_ids:
+        Task.objects.using(using).filter(status=Task.Status.RUNNING, lock_id__in=lock_ids).update(
+            locked_until=timezone.now() + timedelta(seconds=tasks_setting('LEASE')),
+        )
+
+
+def requeue_expired(using=DEFAULT_DB_ALIAS):
+    """
+    Retry, or fail, the running tasks whose claim ran out: their worker
+    died or hung. Returns how many there were.
+    """
+    expired = Task.objects.using(using).filter(status=Task.Status.RUNNING, locked_until__lt=timezone.now())
+    expired = list(expired.only('name', 'attempts', 'max_attempts', 'lock_id', 'locked_until'))
+    for task in expired:
+        logger.warning('Task %s %s was not finished by %s', task.pk, task.name, task.locked_until)
+        _record_failure(task, f'The claim expired at {task.locked_until}', using)
+    return len(expired)
+
+
+def purge_finished(using=DEFAULT_DB_ALIAS):
+    """
+    Delete the done tasks older than ``KEEP_FINISHED``.
+    """
+    cutoff = timezone.now() - timedelta(seconds=tasks_setting('KEEP_FINISHED'))
+    return Task.objects.using(using).filter(finished_at__lt=cutoff, status=Task.Status.DONE).delete()[0]
+
+
+def maintain_queue(using=DEFAULT_DB_ALIAS):
+    requeue_expired(using)
+    purge_finished(using)
+
+
+def queue_stats(using=DEFAULT_DB_ALIAS):
+    """
+    Per task name: how many tasks are ready, scheduled for later, running
+    and failed, how long the oldest ready one has waited, and percentiles of
+    the queue wait and run time of the most recently finished ones, in
+    milliseconds.
+    """
+    now = timezone.now()
+    tasks = Task.objects.using(using)
+    ready = Q(status=Task.Status.QUEUED, run_at__lte=now)
+    stats = defaultdict(lambda: {
+        'ready': 0, 'scheduled': 0, 'running': 0, 'failed': 0, 'oldest_ready_age': 0.0,
+        'finished': 0, 'wait_ms': {}, 'run_ms': {},
+    })
+    depths = tasks.filter(
+        status__in=[Task.Status.QUEUED, Task.Status.RUNNING, Task.Status.FAILED],
+    ).values('name').annotate(
+        ready=Count('pk', filter=ready),
+        scheduled=Count('pk', filter=Q(status=Task.Status.QUEUED, run_at__gt=now)),
+        running=Count('pk', filter=Q(status=Task.Status.RUNNING)),
+        failed=Count('pk', filter=Q(status=Task.Status.FAILED)),
+        oldest_ready=Min('run_at', filter=ready),
+    ).order_by()
+    for row in depths:
+        oldest_ready = row.pop('oldest_ready')
+        stats[row.pop('name')].update(
+            row, oldest_ready_age=round((now - oldest_ready).total_seconds(), 3) if oldest_ready else 0.0,
+        )
+
+    waits, runs = defaultdict(list), defaultdict(list)
+    finished = tasks.filter(finished_at__isnull=False).order_by('-finished_at').values_list(
+        'name', 'run_at', 'started_at', 'finished_at',
+    )[:LATENCY_SAMPLE_SIZE]
+    for name, run_at, started_at, finished_at in finished:
+        waits[name].append(max(0.0, (started_at - run_at).total_seconds() * 1000))
+        runs[name].append((finished_at - started_at).total_seconds() * 1000)
+    for name in waits:
+        stats[name]['finished'] = len(waits[name])
+        for key, samples in (('wait_ms', waits[name]), ('run_ms', runs[name])):
+            stats[name][key] = {f'p{pct}': round(percentile(samples, pct), 3) for pct in (50, 95, 99)}
+    return dict(sorted(stats.items()))
+
+
+def _run_in_pool(name, arguments, using):
+    try:
+        run_task(name, arguments, using)
+    finally:
+        # Pool threads and processes outlive their tasks.
+        close_old_connections()
+
+
+class Worker:
+    """
+    Claims ready tasks and runs them on a pool of ``concurrency`` threads,
+    or of processes with ``processes``, until stopped.
+    """
+
+    def __init__(self, concurrency=4, processes=False, using=DEFAULT_DB_ALIAS):
+        self.concurrency = concurrency
+        self.processes = processes
+        self.using = using
+        self.counts = Counter()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """
+        Claim nothing more, and return once the running tasks have finished.
+        """
+        self._stopping.set()
+
+    def _pool(self):
+        if self.processes:
+            # Spawned rather than forked, so children share no connections
+            # with this process; django.setup registers their tasks.
+            return ProcessPoolExecutor(
+                self.concurrency, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            )
+        return ThreadPoolExecutor(self.concurrency, thread_name_prefix='blog-task')
+
+    def run(self, until_empty=False):
+        """
+        Run tasks until stopped or, with ``until_empty``, until none is ready.
+        """
+        running = {}
+        maintained = 0.0
+        poll_interval = tasks_setting('POLL_INTERVAL')
+        with self._pool() as pool:
+            while running or not self._stopping.is_set():
+                if time.monotonic() - maintained >= MAINTENANCE_INTERVAL:
+                    renew_leases({task.lock_id for task in running.values()}, self.using)
+                    maintain_queue(self.using)
+                    maintained = time.monotonic()
+                free = self.concurrency - len(running)
+                if free and not self._stopping.is_set():
+                    for task in claim_tasks(free, self.using):
+                        running[pool.submit(_run_in_pool, task.name, task.arguments, self.using)] = task
+                if not running:
+                    if until_empty:
+                        break
+                    self._stopping.wait(poll_interval)
+                    continue
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                succeeded = []
+                for future in done:
+                    task, error = running.pop(future), future.exception()
+                    if error is None:
+                        succeeded.append(task)
+                    else:
+                        finish_task(task, error, self.using)
+                        self.counts['failed'] += 1
+                # Tasks finishing together are recorded with one commit.
+                complete_tasks(succeeded, self.using)
+                self.counts['done'] += len(succeeded)
+        return self.counts
+
+
+class InProcessTasks:
+    """
+    Runs ready tasks on a background thread of this process, once the
+    transaction that queued them commits, while ``RUN_IN_PROCESS`` is on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+        self._maintained = 0.0
+        self._started = False
+
+    def started(self, using=DEFAULT_DB_ALIAS):
+        """
+        Schedule a run for the tasks left queued by earlier processes, which
+        no commit in this one would wake. Server entry points call this
+        when they load; later calls do nothing.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if tasks_setting('RUN_IN_PROCESS'):
+            # Never in the caller's thread: that is loading the server.
+            self._schedule(tasks_setting('IN_PROCESS_DELAY') or 0.01, using)
+
+    def queued(self, using=DEFAULT_DB_ALIAS):
+        if tasks_setting('RUN_IN_PROCESS'):
+            transaction.on_commit(lambda: self._schedule(tasks_setting('IN_PROCESS_DELAY'), using), using=using)
+
+    def _schedule(self, delay, using):
+        if not delay:
+            self.run(using)
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(delay, self._run_in_background, args=(using,))
+                self._timer.daemon = True
+                self._timer.start()
+
+    def run(self, using=DEFAULT_DB_ALIAS):
+        """
+        Run every ready task in this thread and return how many ran.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if time.monotonic() - self._maintained >= MAINTENANCE_INTERVAL:
+            self._maintained = time.monotonic()
+            maintain_queue(using)
+        count = 0
+        while tasks := claim_tasks(1, using):
+            for task in tasks:
+                error = None
+                try:
+                    run_task(task.name, task.arguments, using)
+                except Exception as exc:
+                    error = exc
+                finish_task(task, error, using)
+                count += 1
+        # Come back for retries, and for tasks queued with a delay.
+        next_run = Task.objects.using(using).filter(status=Task.Status.QUEUED).aggregate(
+            next_run=Min('run_at'),
+        )['next_run']
+        if next_run is not None:
+            self._schedule(max((next_run - timezone.now()).total_seconds(), 0.01), using)
+        return count
+
+    def _run_in_background(self, using):
+        with self._lock:
+            self._timer = None
+        try:
+            self.run(using)
+        finally:
+            connections.close_all()
+
+
+in_process_tasks = InProcessTasks()
@@ -1,3 +1,1513 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import itertools
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from postflow import urls as project_urls
+from postflow.instrumentation import InstrumentationMiddleware, span
+from postflow.replicas import is_pinned, pin
+
+from . import urls as blog_urls
+from .async_views import AsyncBlogPostViewSet
+from .benchmarks import time_calls
+from .bulk import MAX_BATCH_SIZE, NOT_AN_OBJECT, NOT_FOUND, NOT_PERMITTED, PRECONDITION_FAILED
+from .cache import tag_versions
+from .changes import compact_changes
+from .checks import check_replica_pins, check_response_cache
+from .counters import view_counter
+from .filters import tag_ids_by_name
+from .management.commands.bench_instrumentation import HOOKS_PER_REQUEST, MAX_DISABLED_OVERHEAD
+from .management.commands.check_change_feed import URL as CHANGES_URL, apply_page, async_feed, database_state
+from .management.commands.check_query_plans import (
+    ENDPOINTS, Endpoint, endpoint_plans, plan_fixtures, plan_problems, query_plan,
+)
+from .models import AuthorStats, BlogPost, Category, PostStats, RelatedPost, Tag, Task, TrendingScore
+from .related import rebuild_related_posts
+from .search import get_search_backend
+from .serializers import BlogPostDetailSerializer
+from .similarity import RelatedIndex, tokenize
+from .tasks import (
+    InProcessTasks, Worker, claim_tasks, enqueue, enqueue_many, finish_task, in_process_tasks, purge_finished,
+    queue_stats, requeue_expired, task,
+)
+from .trending import add_score, rebuild_trending_scores, record_trending_views, trending_setting, view_score
+from .views import BlogPostViewSet, CategoryViewSet, TagViewSet
+
+CONTENT = 'Enough words about the framework to pass the fifty character minimum. '
+
+
+def make_post(author, title, content=CONTENT, category=None, tags=(), **fields):
+    post = BlogPost.objects.create(
+        author=author, title=title, content=content, category=category,
+        status=fields.pop('status', BlogPost.Status.PUBLISHED), **fields
+    )
+    if tags:
+        post.tags.set(tags)
+    return post
+
+
+RECORD_TASK = 'blog.tests.record'
+FLAKY_TASK = 'blog.tests.flaky'
+
+task_runs = Counter()
+task_run_times = defaultdict(list)
+_task_runs_lock = threading.Lock()
+
+
+@task(RECORD_TASK)
+def record_task_run(key, using='default'):
+    with _task_runs_lock:
+        task_runs[key] += 1
+
+
+@task(FLAKY_TASK, max_attempts=3)
+def flaky_task_run(key, failures, using='default'):
+    with _task_runs_lock:
+        task_runs[key] += 1
+        task_run_times[key].append(time.monotonic())
+        attempt = task_runs[key]
+    if attempt <= failures:
+        raise RuntimeError(f'{key} fails on attempt {attempt}')
+
+
+# Related-post updates run with run_tasks, and never touch the saved index.
+@override_settings(BLOG_RELATED={'INDEX_PATH': None, 'UPDATE_DELAY': 0})
+class BlogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('alice', password='secret-password')
+        cls.staff = User.objects.create_user('editor', password='secret-password', is_staff=True)
+        cls.category = Category.objects.create(name='Backend')
+        cls.django_tag = Tag.objects.create(name='django')
+        cls.python_tag = Tag.objects.create(name='python')
+
+    def setUp(self):
+        # Cached responses and tag ids live in the default cache, which
+        # outlives each test's rolled back transaction.
+        cache.clear()
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def run_tasks(self):
+        # Tasks queued in a test never see their transaction commit.
+        return in_process_tasks.run()
+
+    def post_titles(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(post['title'] for post in response.json()['results'])
+
+
+class SearchTests(BlogTestCase):
+    def test_q_matches_word_prefixes_only(self):
+        make_post(self.author, 'Django tips', content='Django ' + CONTENT)
+        self.assertEqual(self.post_titles('/api/blog/posts/?q=djan'), ['Django tips'])
+        self.assertEqual(self.post_titles('/api/blog/posts/?q=jang'), [])
+
+    def test_search_matches_substrings(self):
+        make_post(self.author, 'Django tips', content=CONTENT, tags=[self.python_tag])
+        make_post(self.staff, 'Other tips', category=self.category)
+        self.assertEqual(self.post_titles('/api/blog/posts/?search=jang'), ['Django tips'])
+        self.assertEqual(self.post_titles('/api/blog/posts/?search=ytho'), ['Django tips'])
+        self.assertEqual(self.post_titles('/api/blog/posts/?search=acken'), ['Other tips'])
+        self.assertEqual(self.post_titles('/api/blog/posts/?search=dito'), ['Other tips'])
+        self.assertEqual(self.post_titles('/api/blog/posts/?search=ips'), ['Django tips', 'Other tips'])
+        self.assertEqual(self.post_titles('/api/blog/posts/?search=ips&pagination=cursor'),
+                         ['Django tips', 'Other tips'])
+
+    def test_author_rename_reindexes_their_posts(self):
+        make_post(self.author, 'Guest column')
+        self.assertEqual(self.post_titles('/api/blog/posts/?q=alice'), ['Guest column'])
+        self.author.username = 'carol'
+        self.author.save()
+        self.run_tasks()
+        self.assertEqual(self.post_titles('/api/blog/posts/?q=alice'), [])
+        self.assertEqual(self.post_titles('/api/blog/posts/?q=carol'), ['Guest column'])
+
+    def test_saving_a_user_does_not_read_the_stored_username(self):
+        with self.assertNumQueries(1):
+            self.author.save(update_fields=['last_login'])
+        loaded = User.objects.get(pk=self.author.pk)
+        with self.assertNumQueries(1):
+            loaded.save()
+        self.assertFalse(Task.objects.filter(name='index_label_posts').exists())
+
+    def test_only_label_renames_reindex_their_posts(self):
+        make_post(self.author, 'Labelled post', category=self.category, tags=[self.django_tag])
+        reindexes = Task.objects.filter(name='index_label_posts')
+        renames = [
+            (Category.objects.get(pk=self.category.pk), 'Servers'), (Tag.objects.get(pk=self.django_tag.pk), 'webdev'),
+        ]
+        for label, name in renames:
+            with self.subTest(label=label):
+                label.save()
+                self.assertFalse(reindexes.filter(status=Task.Status.QUEUED).exists())
+                label.name = name
+                label.save()
+                self.run_tasks()
+                self.assertEqual(self.post_titles(f'/api/blog/posts/?q={name}'), ['Labelled post'])
+
+
+@override_settings(BLOG_TASKS={
+    'RUN_IN_PROCESS': False, 'RETRY_DELAY': 0.05, 'MAX_RETRY_DELAY': 0.2, 'POLL_INTERVAL': 0.05,
+})
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        task_runs.clear()
+        task_run_times.clear()
+
+    def tasks(self, name, key):
+        return Task.objects.filter(name=name, arguments__0=key)
+
+    def test_dedup_keys_collapse_queued_tasks_only(self):
+        with transaction.atomic():
+            for _ in range(3):
+                enqueue(RECORD_TASK, 'dedup', dedup_key='tests:dedup')
+        self.assertEqual(self.tasks(RECORD_TASK, 'dedup').count(), 1)
+        claimed = claim_tasks(10)
+        # Work queued once the task has started is not collapsed into it.
+        enqueue(RECORD_TASK, 'dedup', dedup_key='tests:dedup')
+        self.assertEqual(self.tasks(RECORD_TASK, 'dedup').filter(status=Task.Status.QUEUED).count(), 1)
+        for claimed_task in claimed:
+            finish_task(claimed_task)
+        Worker(1).run(until_empty=True)
+        self.assertEqual(self.tasks(RECORD_TASK, 'dedup').filter(status=Task.Status.DONE).count(), 2)
+
+    def test_concurrent_workers_run_each_task_once(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Shared-cache table locks fail at once rather than wait.
+            self.skipTest('Concurrent claims need a database whose locks wait')
+        keys = [f'once-{index}' for index in range(300)]
+        enqueue_many(RECORD_TASK, [[key] for key in keys])
+        pool = [Worker(4) for _ in range(3)]
+        threads = [threading.Thread(target=worker.run, kwargs={'until_empty': True}) for worker in pool]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({key: task_runs[key] for key in keys}, dict.fromkeys(keys, 1))
+        self.assertEqual(sum(worker.counts['done'] for worker in pool), len(keys))
+        self.assertFalse(Task.objects.filter(name=RECORD_TASK).exclude(status=Task.Status.DONE).exists())
+
+    def test_failures_are_retried_with_backoff_then_kept(self):
+        enqueue(FLAKY_TASK, 'recovers', 2)
+        enqueue(FLAKY_TASK, 'fails', 10)
+        deadline = time.monotonic() + 10
+        with self.assertLogs('blog.tasks', 'WARNING') as logs:
+            while Task.objects.filter(status__in=[Task.Status.QUEUED, Task.Status.RUNNING]).exists():
+                self.assertLess(time.monotonic(), deadline, 'Retried tasks did not finish')
+                Worker(2).run(until_empty=True)
+                time.sleep(0.02)
+        self.assertEqual(len(logs.records), 5)
+        recovered = self.tasks(FLAKY_TASK, 'recovers').get()
+        failed = self.tasks(FLAKY_TASK, 'fails').get()
+        self.assertEqual((recovered.status, recovered.attempts), (Task.Status.DONE, 3))
+        self.assertEqual((failed.status, failed.attempts, task_runs['fails']), (Task.Status.FAILED, 3, 3))
+        self.assertIn('RuntimeError: fails fails on attempt 3', failed.last_error)
+        # RETRY_DELAY 0.05, doubled per attempt, less up to a quarter.
+        times = task_run_times['fails']
+        self.assertGreaterEqual(times[1] - times[0], 0.0375)
+        self.assertGreaterEqual(times[2] - times[1], 0.075)
+
+    def test_expired_claims_are_retried(self):
+        enqueue(RECORD_TASK, 'expired')
+        # A worker claims the task and dies.
+        lost = claim_tasks(1)[0]
+        Task.objects.filter(pk=lost.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        with self.assertLogs('blog.tasks', 'WARNING'):
+            self.assertEqual(requeue_expired(), 1)
+        requeued = Task.objects.get(pk=lost.pk)
+        self.assertEqual(requeued.status, Task.Status.QUEUED)
+        self.assertIn('claim expired', requeued.last_error)
+        Task.objects.filter(pk=lost.pk).update(run_at=timezone.now())
+        claimed = claim_tasks(1)[0]
+        # The dead worker's late report must not end the new attempt.
+        finish_task(lost)
+        self.assertEqual(Task.objects.get(pk=lost.pk).status, Task.Status.RUNNING)
+        finish_task(claimed)
+        requeued = Task.objects.get(pk=lost.pk)
+        self.assertEqual((requeued.status, requeued.attempts), (Task.Status.DONE, 2))
+
+    def test_purge_keeps_failed_and_recent_tasks(self):
+        enqueue_many(RECORD_TASK, [['old'], ['recent'], ['failed']])
+        Worker(1).run(until_empty=True)
+        old = timezone.now() - timedelta(days=2)
+        self.tasks(RECORD_TASK, 'old').update(finished_at=old)
+        self.tasks(RECORD_TASK, 'failed').update(finished_at=old, status=Task.Status.FAILED)
+        self.assertEqual(purge_finished(), 1)
+        self.assertEqual(
+            sorted(Task.objects.filter(name=RECORD_TASK).values_list('arguments__0', flat=True)),
+            ['failed', 'recent'],
+        )
+
+    def test_queue_stats(self):
+        enqueue(RECORD_TASK, 'done')
+        Worker(1).run(until_empty=True)
+        enqueue(RECORD_TASK, 'ready')
+        enqueue(RECORD_TASK, 'later', delay=60)
+        stats = queue_stats()[RECORD_TASK]
+        self.assertEqual((stats['ready'], stats['scheduled'], stats['running'], stats['finished']), (1, 1, 0, 1))
+        self.assertEqual(set(stats['wait_ms']), {'p50', 'p95', 'p99'})
+
+    @override_settings(BLOG_TASKS={'RUN_IN_PROCESS': True, 'IN_PROCESS_DELAY': 0})
+    def test_in_process_tasks_run_on_commit(self):
+        with transaction.atomic():
+            enqueue(RECORD_TASK, 'in-process')
+            self.assertEqual(task_runs['in-process'], 0)
+        self.assertEqual(task_runs['in-process'], 1)
+
+    def test_server_start_runs_tasks_left_queued(self):
+        # Queued by a process that exited before running it.
+        enqueue(RECORD_TASK, 'left-over')
+        with override_settings(BLOG_TASKS={'RUN_IN_PROCESS': True, 'IN_PROCESS_DELAY': 0}):
+            InProcessTasks().started()
+            deadline = time.monotonic() + 5
+            while not task_runs['left-over'] and time.monotonic() < deadline:
+                time.sleep(0.02)
+        self.assertEqual(task_runs['left-over'], 1)
+
+
+@override_settings(BLOG_VIEW_COUNTER={'FLUSH_INTERVAL': 60, 'MAX_PENDING': 10 ** 6})
+class ViewCounterTests(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('alice')
+        self.category = Category.objects.create(name='Backend')
+        tag = Tag.objects.create(name='django')
+        self.posts = [make_post(self.author, f'Post number {index}', category=self.category, tags=[tag])
+                      for index in range(3)]
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def test_concurrent_views_are_all_counted(self):
+        threads, per_thread = 8, 500
+        adding = threading.Event()
+
+        def view():
+            adding.wait()
+            for index in range(per_thread):
+                view_counter.add(self.posts[index % len(self.posts)].pk)
+
+        def flush():
+            # Flushes race the adds, as the background timer's would.
+            adding.wait()
+            try:
+                while any(worker.is_alive() for worker in workers):
+                    view_counter.flush()
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=view) for _ in range(threads)]
+        flusher = threading.Thread(target=flush)
+        for thread in [*workers, flusher]:
+            thread.start()
+        adding.set()
+        for thread in [*workers, flusher]:
+            thread.join()
+        view_counter.flush()
+
+        counts = dict(BlogPost.objects.values_list('pk', 'view_count'))
+        expected = {post.pk: 0 for post in self.posts}
+        for index in range(per_thread):
+            expected[self.posts[index % len(self.posts)].pk] += threads
+        self.assertEqual(counts, expected)
+        total = threads * per_thread
+        self.assertEqual(Category.objects.get().total_views, total)
+        self.assertEqual(Tag.objects.get().total_views, total)
+        self.assertEqual(AuthorStats.objects.get().total_views, total)
+
+    @override_settings(BLOG_VIEW_COUNTER={'FLUSH_INTERVAL': 60, 'MAX_PENDING': 3})
+    def test_failed_inline_flushes_keep_the_views_pending(self):
+        post = self.posts[0]
+        with mock.patch('blog.counters.record_trending_views', side_effect=DatabaseError('locked')):
+            view_counter.add(post.pk)
+            view_counter.add(post.pk)
+            with self.assertLogs('blog.counters', 'ERROR'):
+                self.assertEqual(view_counter.add(post.pk), 3)
+            self.assertEqual(view_counter.pending(post.pk), 3)
+            # The timer and shutdown flushes still raise.
+            with self.assertRaises(DatabaseError):
+                view_counter.flush()
+        self.assertEqual(BlogPost.objects.get(pk=post.pk).view_count, 0)
+        self.assertEqual(view_counter.flush(), 3)
+        self.assertEqual(BlogPost.objects.get(pk=post.pk).view_count, 3)
+
+    def test_flush_only_invalidates_the_viewed_posts(self):
+        viewed, other = self.posts[0], self.posts[1]
+        tags = ['posts', 'posts:trending', f'post:{viewed.pk}', f'post:{other.pk}',
+                f'category:{self.category.pk}']
+        before = tag_versions(tags)
+        view_counter.add(viewed.pk)
+        view_counter.flush()
+        after = tag_versions(tags)
+        moved = {tag.rsplit(':tag:', 1)[1] for tag in before if before[tag] != after[tag]}
+        self.assertEqual(moved, {f'post:{viewed.pk}'})
+
+
+class TrendingTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = make_post(self.author, 'Trending post', category=self.category)
+
+    def score(self, post):
+        return TrendingScore.objects.get(post=post).score
+
+    def test_added_scores_are_log_sum_exp(self):
+        TrendingScore.objects.create(post=self.post, category=self.category, score=0.0)
+        for stored, added in [(0.0, 0.0), (1.5, -2.0), (1000.0, 1000.5), (5.0, -800.0)]:
+            with self.subTest(stored=stored, added=added):
+                TrendingScore.objects.update(score=stored)
+                TrendingScore.objects.update(score=add_score(added))
+                # Naively, exp(1000) overflows a double.
+                larger, smaller = max(stored, added), min(stored, added)
+                expected = larger + math.log1p(math.exp(smaller - larger))
+                self.assertAlmostEqual(self.score(self.post), expected, places=9)
+
+    def test_views_halve_every_half_life(self):
+        half_life = timedelta(seconds=trending_setting('HALF_LIFE'))
+        start = timezone.now()
+        record_trending_views({self.post.pk: 4}, at=start)
+        record_trending_views({self.post.pk: 4}, at=start + half_life)
+        # The first four views are worth two by the time of the next four.
+        self.assertAlmostEqual(self.score(self.post), view_score(6, start + half_life), places=9)
+
+    @override_settings(BLOG_VIEW_COUNTER={'FLUSH_INTERVAL': 0})
+    def test_view_counter_flushes_record_views_of_published_posts(self):
+        draft = make_post(self.author, 'Draft post', status=BlogPost.Status.DRAFT)
+        before = timezone.now()
+        view_counter.add(self.post.pk, 3)
+        view_counter.add(draft.pk, 3)
+        self.assertFalse(TrendingScore.objects.filter(post=draft).exists())
+        score = TrendingScore.objects.get(post=self.post)
+        self.assertEqual(score.category_id, self.category.pk)
+        self.assertTrue(view_score(3, before) <= score.score <= view_score(3, timezone.now()))
+
+        view_counter.add(self.post.pk, 2)
+        self.assertTrue(view_score(5, before) <= self.score(self.post) <= view_score(5, timezone.now()))
+
+    def test_scores_follow_status_and_category(self):
+        record_trending_views({self.post.pk: 3})
+        score = self.score(self.post)
+        other = Category.objects.create(name='Frontend')
+
+        self.post.category = other
+        self.post.save()
+        self.assertEqual(TrendingScore.objects.get(post=self.post).category_id, other.pk)
+        self.assertEqual(self.score(self.post), score)
+
+        self.post.status = BlogPost.Status.DRAFT
+        self.post.save()
+        self.assertFalse(TrendingScore.objects.filter(post=self.post).exists())
+
+        # Views while unpublished are not scored; the next ones after
+        # publishing start a new score.
+        record_trending_views({self.post.pk: 3})
+        self.post.status = BlogPost.Status.PUBLISHED
+        self.post.save()
+        self.assertFalse(TrendingScore.objects.filter(post=self.post).exists())
+        record_trending_views({self.post.pk: 2})
+        self.assertEqual(TrendingScore.objects.get(post=self.post).category_id, other.pk)
+
+    def test_rebuild_matches_incremental_scores(self):
+        start = timezone.now() - timedelta(days=3)
+        posts = [self.post] + [
+            make_post(self.author, f'Trending post {index}', category=self.category,
+                      published_date=start + timedelta(hours=7 * index))
+            for index in range(1, 4)
+        ]
+        make_post(self.author, 'Unviewed post', category=self.category)
+        make_post(self.author, 'Viewed draft', status=BlogPost.Status.DRAFT, view_count=5)
+        for views, post in enumerate(posts, start=1):
+            post.refresh_from_db()
+            BlogPost.objects.filter(pk=post.pk).update(view_count=views)
+            record_trending_views({post.pk: views}, at=post.published_date)
+        incremental = dict(TrendingScore.objects.values_list('post_id', 'score'))
+
+        rebuild_trending_scores()
+        rebuilt = dict(TrendingScore.objects.values_list('post_id', 'score'))
+        self.assertEqual(rebuilt.keys(), incremental.keys())
+        for pk, score in incremental.items():
+            self.assertAlmostEqual(rebuilt[pk], score, places=9)
+
+    def test_trending_lists_by_category_and_limit(self):
+        other = Category.objects.create(name='Frontend')
+        posts = [self.post] + [
+            make_post(self.author, f'Trending post {index}', category=other if index % 2 else self.category)
+            for index in range(1, 5)
+        ]
+        record_trending_views({post.pk: views for views, post in enumerate(posts, start=1)})
+        ranked = [post.title for post in reversed(posts)]
+
+        def titles(query=''):
+            response = self.client.get(f'/api/blog/posts/trending/{query}')
+            self.assertEqual(response.status_code, 200, response.content)
+            return [post['title'] for post in response.json()]
+
+        self.assertEqual(titles(), ranked)
+        self.assertEqual(titles(f'?category={other.pk}'),
+                         [post.title for post in reversed(posts) if post.category_id == other.pk])
+        self.assertEqual(titles(f'?category={self.category.pk}&limit=2'), ranked[::2][:2])
+        self.assertEqual(titles('?limit=0'), ranked[:1])
+        with override_settings(BLOG_TRENDING={'MAX_LIMIT': 3}):
+            self.assertEqual(titles('?limit=1000'), ranked[:3])
+        response = self.client.get('/api/blog/posts/trending/?limit=many')
+        self.assertEqual(response.status_code, 400)
+
+
+class PostMetricsTests(BlogTestCase):
+    LONG = 'word ' * 449 + 'word'
+
+    def metrics(self, pk):
+        return BlogPost.objects.values('excerpt', 'word_count', 'read_time', 'content_hash').get(pk=pk)
+
+    def expected(self, content):
+        return {
+            'excerpt': content[:150] + '...' if len(content) > 150 else content,
+            'word_count': len(content.split()),
+            'read_time': max(1, len(content.split()) // 200),
+            'content_hash': hashlib.sha256(content.encode()).hexdigest(),
+        }
+
+    def test_saves_store_metrics_for_new_content(self):
+        post = make_post(self.author, 'Measured post')
+        self.assertEqual(self.metrics(post.pk), self.expected(CONTENT))
+        post.content = self.LONG
+        post.save(update_fields=['content'])
+        self.assertEqual(self.metrics(post.pk), self.expected(self.LONG))
+        post.content = CONTENT
+        post.save(update_fields=['title'])
+        self.assertEqual(self.metrics(post.pk), self.expected(self.LONG))
+
+    def test_bulk_writes_store_metrics_when_content_is_written(self):
+        BlogPost.objects.bulk_create([
+            BlogPost(author=self.author, title=f'Bulk post {index}', content=CONTENT) for index in range(2)
+        ])
+        posts = list(BlogPost.objects.order_by('pk'))
+        self.assertEqual([self.metrics(post.pk) for post in posts], [self.expected(CONTENT)] * 2)
+        for post in posts:
+            post.content = self.LONG
+        BlogPost.objects.bulk_update(posts[:1], ['title'])
+        BlogPost.objects.bulk_update(posts[1:], ['content'])
+        self.assertEqual([self.metrics(post.pk) for post in posts],
+                         [self.expected(CONTENT), self.expected(self.LONG)])
+
+    def test_backfill_recomputes_stored_metrics(self):
+        posts = [make_post(self.author, f'Backfilled post {index}', content=content)
+                 for index, content in enumerate([CONTENT, self.LONG, CONTENT])]
+        BlogPost.objects.update(excerpt='', word_count=0, read_time=1, content_hash='')
+        output = StringIO()
+        call_command('backfill_post_metrics', batch_size=2, stdout=output)
+        self.assertIn('Backfilled 3 posts', output.getvalue())
+        self.assertEqual([self.metrics(post.pk) for post in posts],
+                         [self.expected(post.content) for post in posts])
+
+
+class KeysetPaginationTests(BlogTestCase):
+    def test_cursor_pages_follow_the_keyset_order(self):
+        for index in range(3):
+            make_post(self.author, f'Post number {index}')
+        response = self.client.get('/api/blog/posts/?pagination=cursor&ordering=-published_date')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['title'] for post in response.json()['results']],
+                         ['Post number 2', 'Post number 1', 'Post number 0'])
+
+    def test_cursor_pages_reject_other_orderings(self):
+        response = self.client.get('/api/blog/posts/?pagination=cursor&ordering=title')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.json())
+
+    def test_cursor_pages_reject_ranked_search(self):
+        response = self.client.get('/api/blog/posts/?pagination=cursor&q=django')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('q', response.json())
+        self.assertEqual(self.client.get('/api/blog/posts/?q=django').status_code, 200)
+
+
+class ResponseCacheTests(BlogTestCase):
+    def test_process_local_cache_is_not_used_for_responses(self):
+        make_post(self.author, 'Cached post')
+        self.assertNotIn('X-Cache', self.client.get('/api/blog/posts/recent/'))
+        self.assertEqual([warning.id for warning in check_response_cache(None)], ['blog.W001'])
+
+    def test_single_process_may_cache_in_local_memory(self):
+        make_post(self.author, 'Cached post')
+        with override_settings(BLOG_RESPONSE_CACHE={'ALLOW_PROCESS_LOCAL': True}):
+            self.assertEqual(self.client.get('/api/blog/posts/recent/')['X-Cache'], 'MISS')
+            self.assertEqual(self.client.get('/api/blog/posts/recent/')['X-Cache'], 'HIT')
+            self.assertEqual(check_response_cache(None), [])
+
+
+class ReplicaPinTests(BlogTestCase):
+    replicas = {'ALIASES': ['replica'], 'CACHE_ALIAS': 'default'}
+
+    def token_request(self):
+        token = RefreshToken.for_user(self.author).access_token
+        request = APIRequestFactory().get('/api/blog/posts/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        request.user = self.author
+        return request
+
+    def test_token_clients_read_from_the_primary_without_a_shared_cache(self):
+        with override_settings(DATABASE_REPLICAS=self.replicas):
+            self.assertTrue(is_pinned(self.token_request()))
+            self.assertFalse(is_pinned(APIRequestFactory().get('/api/blog/posts/')))
+            self.assertEqual([error.id for error in check_replica_pins(None)], ['postflow.W001'])
+
+    def test_single_process_pins_in_local_memory(self):
+        with override_settings(DATABASE_REPLICAS={**self.replicas, 'ALLOW_PROCESS_LOCAL': True}):
+            request = self.token_request()
+            self.assertFalse(is_pinned(request))
+            pin(request, Response())
+            self.assertTrue(is_pinned(self.token_request()))
+            self.assertEqual(check_replica_pins(None), [])
+
+
+class TagFilterTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        tag_ids_by_name.clear()
+        make_post(self.author, 'Tagged post', tags=[self.django_tag])
+        make_post(self.author, 'Other post', tags=[self.python_tag])
+
+    async def test_async_list_resolves_tags_with_the_async_orm(self):
+        view = AsyncBlogPostViewSet.as_async_view(BlogPostViewSet.as_view({'get': 'list'}))
+        response = await view(AsyncRequestFactory().get('/api/blog/posts/', {'tags': 'django,missing'}))
+        response.render()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([post['title'] for post in response.data['results']], ['Tagged post'])
+
+    def test_resolved_tags_expire(self):
+        self.assertEqual(self.post_titles('/api/blog/posts/?tags=django'), ['Tagged post'])
+        # A rename that moved no version this process sees.
+        Tag.objects.filter(pk=self.django_tag.pk).update(name='web')
+        self.assertEqual(self.post_titles('/api/blog/posts/?tags=django'), ['Tagged post'])
+        later = time.monotonic() + tag_ids_by_name.TTL + 1
+        with mock.patch('blog.filters.time.monotonic', return_value=later):
+            self.assertEqual(self.post_titles('/api/blog/posts/?tags=django'), [])
+            self.assertEqual(self.post_titles('/api/blog/posts/?tags=web'), ['Tagged post'])
+
+
+class InstrumentationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        for index in range(20):
+            make_post(self.author, f'Instrumented post {index}', tags=[self.django_tag])
+
+    def instrumentation(self, enabled):
+        return override_settings(REQUEST_INSTRUMENTATION={'ENABLED': enabled, 'SERVER_TIMING': True})
+
+    def test_disabled_instrumentation_adds_no_measurable_cost(self):
+        with self.instrumentation(False):
+            with self.assertRaises(MiddlewareNotUsed):
+                InstrumentationMiddleware(lambda request: None)
+            # A new client builds its middleware chain with these settings.
+            client = APIClient()
+            self.assertFalse(client.get('/api/blog/posts/').has_header('Server-Timing'))
+            request = time_calls(lambda: client.get('/api/blog/posts/'), repeat=20)
+            calls = 100_000
+            started = time.perf_counter()
+            for _ in range(calls):
+                with span('serialize'):
+                    pass
+            hook_ms = (time.perf_counter() - started) / calls * 1000
+        self.assertLess(hook_ms * HOOKS_PER_REQUEST, request['p50_ms'] * MAX_DISABLED_OVERHEAD)
+
+    def test_enabled_instrumentation_reports_every_query(self):
+        with self.instrumentation(True):
+            with CaptureQueriesContext(connection) as queries:
+                response = APIClient().get('/api/blog/posts/')
+        timing = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertTrue(timing['db'].endswith(f'desc="{len(queries.captured_queries)} queries"'), timing['db'])
+        self.assertLessEqual({'total', 'db-slowest', 'auth', 'serialize', 'size'}, timing.keys())
+
+
+class ProjectionTests(BlogTestCase):
+    def assert_list_skips_bodies(self, url):
+        make_post(self.author, 'Projected post', category=self.category, tags=[self.django_tag])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(any('"blog_blogpost"."title"' in sql for sql in selects), selects)
+        for column in ('"blog_blogpost"."content"', '"blog_blogpost"."content_html"', '"auth_user"."password"'):
+            self.assertFalse([sql for sql in selects if column in sql], column)
+
+    def test_list_does_not_select_post_bodies(self):
+        self.assert_list_skips_bodies('/api/blog/posts/')
+
+    @override_settings(BLOG_FAST_LIST_SERIALIZATION=False)
+    def test_serializer_list_does_not_select_post_bodies(self):
+        self.assert_list_skips_bodies('/api/blog/posts/')
+
+    def test_post_actions_do_not_select_post_bodies(self):
+        self.assert_list_skips_bodies(f'/api/blog/categories/{self.category.pk}/posts/')
+
+
+@override_settings(BLOG_QUERY_BUDGET={'ENABLED': True, 'STRICT': True})
+class QueryBudgetTests(BlogTestCase):
+    """
+    Every ``@query_budget`` endpoint, run over more posts than fit on a page
+    with STRICT budgets, so going over budget fails here.
+    """
+    viewsets = (CategoryViewSet, TagViewSet, BlogPostViewSet)
+
+    def budgeted_requests(self):
+        post = BlogPost.objects.published().first()
+        return {
+            'CategoryViewSet.list': '/api/blog/categories/',
+            'CategoryViewSet.posts': f'/api/blog/categories/{self.category.pk}/posts/',
+            'TagViewSet.list': '/api/blog/tags/',
+            'TagViewSet.posts': f'/api/blog/tags/{self.django_tag.pk}/posts/',
+            'BlogPostViewSet.list': '/api/blog/posts/',
+            'BlogPostViewSet.retrieve': f'/api/blog/posts/{post.pk}/',
+            'BlogPostViewSet.by_author': f'/api/blog/posts/by_author/?author={self.author.pk}',
+            'BlogPostViewSet.by_category': f'/api/blog/posts/by_category/?category={self.category.pk}',
+            'BlogPostViewSet.featured': '/api/blog/posts/featured/',
+            'BlogPostViewSet.recent': '/api/blog/posts/recent/',
+            'BlogPostViewSet.trending': '/api/blog/posts/trending/',
+            'BlogPostViewSet.related': f'/api/blog/posts/{post.pk}/related/',
+            'BlogPostViewSet.my_posts': '/api/blog/posts/my_posts/',
+        }
+
+    def test_every_budgeted_endpoint_is_covered(self):
+        make_post(self.author, 'Budgeted post')
+        budgeted = {
+            f'{viewset.__name__}.{name}'
+            for viewset in self.viewsets
+            for name, method in vars(viewset).items()
+            if hasattr(method, 'query_budget')
+        }
+        self.assertEqual(budgeted, set(self.budgeted_requests()))
+
+    def test_endpoints_stay_within_budget(self):
+        other_category = Category.objects.create(name='Frontend')
+        for index in range(15):
+            make_post(
+                self.author if index % 2 else self.staff, f'Budgeted post {index}',
+                category=self.category if index % 3 else other_category,
+                tags=[self.django_tag, self.python_tag][:index % 3], is_featured=index % 2 == 0,
+            )
+        make_post(self.author, 'Budgeted draft', status=BlogPost.Status.DRAFT)
+        self.authenticate(self.author)
+        for endpoint, url in self.budgeted_requests().items():
+            for path in (url, f"{url}{'&' if '?' in url else '?'}pagination=cursor"):
+                with self.subTest(endpoint=endpoint, path=path):
+                    self.assertEqual(self.client.get(path).status_code, 200)
+
+
+    @skipUnless(connection.vendor == 'sqlite', 'The search index statements are SQLite FTS5 ones')
+    def test_post_saves_write_only_what_changed(self):
+        def statements(save):
+            with CaptureQueriesContext(connection) as queries:
+                save()
+            return [
+                (query['sql'].split()[0], re.search(r'(?:FROM|INTO|UPDATE) "?(\w+)', query['sql'])[1])
+                for query in queries
+            ]
+
+        indexed = [('DELETE', 'blog_post_fts'), ('INSERT', 'blog_post_fts')]
+        queued = [('INSERT', 'blog_task')] * 2 + [('INSERT', 'blog_change')]
+        post = make_post(self.author, 'Saved post', category=self.category, tags=[self.django_tag])
+        post = BlogPost.objects.get(pk=post.pk)
+        post.title = 'Retitled post'
+        # The stored row, the row, the search index, the related-list and
+        # HTML tasks, and the change feed entry.
+        self.assertEqual(statements(post.save), [
+            ('SELECT', 'blog_blogpost'), ('UPDATE', 'blog_blogpost'), *indexed, *queued,
+        ])
+        post.status = BlogPost.Status.DRAFT
+        # Plus the category, author and tag counters, and the trending score.
+        self.assertEqual(statements(post.save), [
+            ('SELECT', 'blog_blogpost'), ('UPDATE', 'blog_blogpost'), *indexed,
+            ('UPDATE', 'blog_category'), ('UPDATE', 'blog_authorstats'), ('UPDATE', 'blog_tag'),
+            ('DELETE', 'blog_trendingscore'), *queued,
+        ])
+        self.assertEqual(statements(lambda: make_post(self.author, 'Created post', category=self.category)), [
+            ('INSERT', 'blog_blogpost'), *indexed, ('UPDATE', 'blog_category'), ('UPDATE', 'blog_authorstats'),
+            *queued,
+        ])
+
+class SeedBlogTests(TestCase):
+    def seed(self, prefix):
+        call_command('seed_blog', users=4, categories=3, tags=12, posts=40, median_words=40, batch_size=15,
+                     prefix=prefix, random_seed=7, stdout=StringIO())
+        return BlogPost.objects.filter(author__username__startswith=f'{prefix}-').order_by('pk')
+
+    def test_seeded_rows_and_counters(self):
+        posts = self.seed('first')
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 12)
+        self.assertEqual(posts.count(), 40)
+        self.assertFalse(posts.filter(word_count=0).exists())
+
+        for model, lookup in ((Category, 'category'), (Tag, 'tags'), (AuthorStats, 'author')):
+            for row in model.objects.all():
+                with self.subTest(row=row):
+                    labelled = BlogPost.objects.filter(**{lookup: row.pk})
+                    self.assertEqual(
+                        [getattr(row, field) for field in PostStats.STAT_FIELDS],
+                        [labelled.count(), labelled.published().count(),
+                         sum(labelled.values_list('view_count', flat=True))],
+                    )
+        self.assertEqual(
+            set(TrendingScore.objects.values_list('post_id', flat=True)),
+            set(posts.published().filter(view_count__gt=0).values_list('pk', flat=True)),
+        )
+        title = posts.published().first().title
+        self.assertIn(title, [post.title for post in get_search_backend().filter(posts, title.split()[0])])
+
+    def test_the_same_seed_generates_the_same_posts(self):
+        fields = ('title', 'content', 'status', 'view_count', 'is_featured', 'author__first_name')
+        first = list(self.seed('first').values_list(*fields))
+        self.assertEqual(list(self.seed('second').values_list(*fields)), first)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_blog', posts=1000, median_words=40, stdout=StringIO())
+        # Plans as they will be once statistics are current; see seed_blog.
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_queries_are_served_by_indexes(self):
+        ctx = plan_fixtures()
+        for endpoint in ENDPOINTS:
+            with self.subTest(path=endpoint.path, user=endpoint.user):
+                path, plans = endpoint_plans(endpoint, ctx)
+                self.assertEqual(plan_problems(endpoint, plans), [], plans)
+
+    def test_unindexed_queries_are_caught(self):
+        query = BlogPost.objects.filter(word_count__gt=10).order_by('-updated_at').query
+        plan = query_plan(*query.sql_with_params())
+        problems = plan_problems(Endpoint('/', index='post_published_idx'), [('', plan)])
+        self.assertEqual(len(problems), 3, problems)
+
+
+class LabelPayloadTests(BlogTestCase):
+    category_fields = ['id', 'name', 'description', 'created_at', 'post_count']
+    tag_fields = ['id', 'name', 'created_at', 'post_count']
+
+    def test_counters_beyond_post_count_stay_internal(self):
+        make_post(self.author, 'Labelled post', category=self.category, tags=[self.django_tag])
+        self.assertEqual(list(self.client.get('/api/blog/categories/').json()['results'][0]), self.category_fields)
+        self.assertEqual(list(self.client.get('/api/blog/tags/').json()['results'][0]), self.tag_fields)
+        for fast in (True, False):
+            with self.subTest(fast=fast), override_settings(BLOG_FAST_LIST_SERIALIZATION=fast):
+                post = self.client.get('/api/blog/posts/').json()['results'][0]
+                self.assertEqual(list(post['category']), self.category_fields)
+                self.assertEqual(list(post['tags'][0]), self.tag_fields)
+
+
+class ConditionalRequestTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = make_post(self.author, 'Conditional post', category=self.category, tags=[self.django_tag])
+        self.url = f'/api/blog/posts/{self.post.pk}/'
+
+    def etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_etag_survives_cache_loss(self):
+        etag = self.etag()
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_etag_follows_stored_state(self):
+        # Writes that bypass signals, and so any cache invalidation.
+        etag = self.etag()
+        BlogPost.objects.filter(pk=self.post.pk).update(view_count=5)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.etag()
+        Tag.objects.filter(pk=self.django_tag.pk).update(name='web')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_stale_if_match_is_rejected(self):
+        self.authenticate(self.author)
+        etag = self.etag()
+        response = self.client.patch(self.url, {'title': 'First edit'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.client.patch(self.url, {'title': 'Lost edit'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(BlogPost.objects.get(pk=self.post.pk).title, 'First edit')
+
+    def test_written_etag_matches_the_next_read(self):
+        self.authenticate(self.author)
+        # Moving the post recounts both categories, which the payload embeds.
+        frontend = Category.objects.create(name='Frontend')
+        response = self.client.patch(self.url, {'category': frontend.pk}, format='json', HTTP_IF_MATCH=self.etag())
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['ETag'], self.etag())
+
+    def test_if_match_is_checked_under_a_row_lock(self):
+        self.authenticate(self.author)
+        etag = self.etag()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(self.url, {'title': 'Locked edit'}, format='json', HTTP_IF_MATCH=etag)
+        # SQLite has no SELECT ... FOR UPDATE; a write takes its lock.
+        post_queries = [query['sql'] for query in queries.captured_queries if '"blog_blogpost"' in query['sql']]
+        self.assertTrue(post_queries[0].startswith('UPDATE "blog_blogpost" SET "id" = "blog_blogpost"."id"'),
+                        post_queries[0])
+
+
+class RenderedContentTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = make_post(self.author, 'Rendered post', content='Some *emphasis* ' + CONTENT)
+        self.url = f'/api/blog/posts/{self.post.pk}/'
+
+    def detail(self):
+        # Rendering is the queued task's job, never the request's.
+        with mock.patch('blog.rendering.render_html', side_effect=AssertionError('rendered on a read')):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_html_is_pending_until_the_render_lands(self):
+        post = self.detail()
+        self.assertEqual((post['content_html'], post['content_html_pending']), (None, True))
+        self.run_tasks()
+        post = self.detail()
+        self.assertIn('<em>emphasis</em>', post['content_html'])
+        self.assertFalse(post['content_html_pending'])
+
+    def test_edits_serve_the_previous_revision_until_rendered(self):
+        self.run_tasks()
+        self.post.refresh_from_db()
+        self.post.content = 'Some **strong** ' + CONTENT
+        self.post.save()
+        post = self.detail()
+        self.assertIn('<em>emphasis</em>', post['content_html'])
+        self.assertTrue(post['content_html_pending'])
+        self.run_tasks()
+        self.assertIn('<strong>strong</strong>', self.detail()['content_html'])
+
+    def test_detail_fields_are_explicit(self):
+        self.assertEqual(list(self.detail()), [
+            'id', 'author', 'category', 'tags', 'content_html', 'content_html_pending',
+            'title', 'content', 'published_date', 'created_at', 'updated_at', 'status',
+            'view_count', 'is_featured', 'excerpt', 'word_count', 'read_time',
+        ])
+
+
+@contextmanager
+def async_reads():
+    """
+    Serve the project's URLs as an ASGI deployment does, with
+    ``BLOG_ASYNC_READS`` on.
+    """
+    def reload_urls():
+        # blog.urls reads the setting on import, and postflow.urls holds
+        # resolvers for the patterns it included.
+        importlib.reload(blog_urls)
+        importlib.reload(project_urls)
+        clear_url_caches()
+
+    try:
+        with override_settings(BLOG_ASYNC_READS=True):
+            reload_urls()
+            yield
+    finally:
+        reload_urls()
+
+
+class AsyncReadTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('bob')
+        posts = [
+            make_post(self.author, f'Async post {index}', category=self.category if index % 2 else None,
+                      tags=[self.django_tag, self.python_tag][:index % 3], is_featured=index % 4 == 0)
+            for index in range(13)
+        ]
+        self.post = posts[1]
+        self.draft = make_post(self.author, 'Async draft', category=self.category, tags=[self.django_tag],
+                               status=BlogPost.Status.DRAFT)
+        record_trending_views({post.pk: index + 1 for index, post in enumerate(posts)})
+        self.users = {
+            'anonymous': None,
+            'author': f'Bearer {RefreshToken.for_user(self.author).access_token}',
+            'other': f'Bearer {RefreshToken.for_user(self.other).access_token}',
+            'staff': f'Bearer {RefreshToken.for_user(self.staff).access_token}',
+            'bad token': 'Bearer not-a-token',
+        }
+
+    def urls(self):
+        category, tag = self.category.pk, self.django_tag.pk
+        return [
+            '/api/blog/posts/', '/api/blog/posts/?page=2', '/api/blog/posts/?page=9',
+            '/api/blog/posts/?pagination=cursor', '/api/blog/posts/?tags=django,python',
+            f'/api/blog/posts/?category={category}&ordering=title',
+            f'/api/blog/posts/{self.post.pk}/', f'/api/blog/posts/{self.draft.pk}/',
+            '/api/blog/posts/0/', '/api/blog/posts/none/',
+            '/api/blog/posts/featured/', '/api/blog/posts/recent/', '/api/blog/posts/trending/',
+            f'/api/blog/posts/trending/?category={category}&limit=2', '/api/blog/posts/trending/?limit=many',
+            f'/api/blog/categories/{category}/posts/', f'/api/blog/categories/{category}/posts/?page=2',
+            '/api/blog/categories/0/posts/', f'/api/blog/tags/{tag}/posts/', '/api/blog/tags/0/posts/',
+        ]
+
+    def get(self, url, authorization, **headers):
+        # The cache would hand one deployment's responses to the other.
+        cache.clear()
+        if authorization:
+            headers['Authorization'] = authorization
+        return self.client.get(url, headers=headers)
+
+    def aget(self, url, authorization, **headers):
+        cache.clear()
+        if authorization:
+            headers['Authorization'] = authorization
+
+        async def get():
+            return await self.async_client.get(url, headers=headers)
+        return async_to_sync(get)()
+
+    def test_async_views_answer_as_the_sync_views(self):
+        expected = {
+            (url, user): self.get(url, authorization)
+            for url in self.urls() for user, authorization in self.users.items()
+        }
+        self.assertEqual(expected[f'/api/blog/posts/{self.draft.pk}/', 'author'].status_code, 200)
+        self.assertEqual(expected[f'/api/blog/posts/{self.draft.pk}/', 'other'].status_code, 404)
+        with async_reads(), mock.patch('blog.async_views.sync_to_async', side_effect=AssertionError):
+            # Any fallback to a sync view fails the request.
+            for (url, user), sync in expected.items():
+                with self.subTest(url=url, user=user):
+                    response = self.aget(url, self.users[user])
+                    self.assertEqual(response.status_code, sync.status_code)
+                    self.assertEqual(dict(response.headers), dict(sync.headers))
+                    self.assertEqual(response.content, sync.content)
+                    etag = sync.headers.get('ETag')
+                    if etag:
+                        self.assertEqual(self.aget(url, self.users[user], if_none_match=etag).status_code, 304)
+
+    def test_other_requests_fall_back_to_the_sync_views(self):
+        url = f'/api/blog/posts/{self.post.pk}/'
+        with async_reads(), mock.patch('blog.async_views.sync_to_async', wraps=sync_to_async) as fallback:
+            self.assertEqual(self.aget(url, self.users['author']).status_code, 200)
+            fallback.assert_not_called()
+            response = self.aget(url, None, accept='text/html')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Content-Type'], 'text/html; charset=utf-8')
+            self.assertEqual(fallback.call_count, 1)
+            self.assertEqual(self.aget(url, 'Basic YWxpY2U6c2VjcmV0LXBhc3N3b3Jk').status_code, 200)
+            self.assertEqual(fallback.call_count, 2)
+
+
+class ChangeFeedTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = make_post(self.author, 'Feed post', category=self.category, tags=[self.django_tag])
+        self.draft = make_post(self.author, 'Feed draft', status=BlogPost.Status.DRAFT)
+
+    def replay(self, state, cursor, user=None, feed=None):
+        """
+        Apply the feed after ``cursor`` to ``state`` three changes at a time;
+        return the next cursor.
+        """
+        self.client.credentials()
+        if user is not None:
+            self.authenticate(user)
+        while True:
+            params = {'since': cursor, 'limit': 3}
+            page = feed(params) if feed else self.client.get(CHANGES_URL, params).json()
+            apply_page(state, page)
+            cursor = page['cursor']
+            if not page['more']:
+                return cursor
+
+    def write(self):
+        make_post(self.author, 'Created post', tags=[self.python_tag])
+        self.post.title = 'Edited post'
+        self.post.save()
+        self.draft.status = BlogPost.Status.PUBLISHED
+        self.draft.save()
+        hidden = make_post(self.author, 'Hidden later')
+        hidden.status = BlogPost.Status.DRAFT
+        hidden.save()
+        self.post.tags.add(self.python_tag)
+        make_post(self.author, 'Deleted post').delete()
+        # Without signals for the posts: SET_NULL and the through cascade.
+        self.category.delete()
+        self.django_tag.delete()
+
+    def test_replay_reproduces_the_database(self):
+        for user in (None, self.author, self.staff):
+            with self.subTest(user=user):
+                state = {}
+                self.replay(state, '', user)
+                self.assertEqual(state, database_state(user))
+        snapshots = {user: (database_state(user), self.replay({}, '', user)) for user in (None, self.author)}
+        self.write()
+        for user, (state, cursor) in snapshots.items():
+            with self.subTest(user=user):
+                self.replay(state, cursor, user)
+                self.assertEqual(state, database_state(user))
+        compact_changes()
+        for user in snapshots:
+            with self.subTest(user=user, compacted=True):
+                state = {}
+                self.replay(state, '', user)
+                self.assertEqual(state, database_state(user))
+
+    def test_async_feed_serves_the_same_pages(self):
+        state, cursor = database_state(None), self.replay({}, '')
+        self.write()
+        self.assertEqual(
+            async_to_sync(async_feed)({'since': cursor}),
+            self.client.get(CHANGES_URL, {'since': cursor}).json(),
+        )
+        self.replay(state, cursor, feed=async_to_sync(async_feed))
+        self.assertEqual(state, database_state(None))
+
+    def test_only_the_async_feed_waits(self):
+        latest = self.replay({}, '')
+        started = time.monotonic()
+        page = self.client.get(CHANGES_URL, {'since': latest, 'wait': 5}).json()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((page['changes'], page['cursor']), ([], latest))
+        started = time.monotonic()
+        with override_settings(BLOG_CHANGES={'POLL_INTERVAL': 0.05}):
+            page = async_to_sync(async_feed)({'since': latest, 'wait': 0.2})
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual((page['changes'], page['cursor']), ([], latest))
+
+    def test_random_writes_replay(self):
+        call_command('check_change_feed', posts=60, operations=80, page_size=20, stdout=StringIO())
+
+
+class RelatedPostsTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.index_path = os.path.join(directory.name, 'related_index.npz')
+        settings = override_settings(BLOG_RELATED={
+            'INDEX_PATH': self.index_path, 'MIN_DF': 1, 'MAX_DF': 1.0, 'UPDATE_DELAY': 0,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.orm = make_post(self.author, 'Django ORM queries', 'Querysets, joins and prefetching in the ORM.',
+                             tags=[self.django_tag, self.python_tag])
+        self.migrations = make_post(self.author, 'Django ORM migrations', 'Schema changes and the ORM.',
+                                    tags=[self.django_tag])
+        self.garden = make_post(self.author, 'Growing tomatoes', 'Soil, compost and sunlight for tomatoes.')
+        self.compost = make_post(self.author, 'Compost heaps', 'Turning compost for the garden soil.')
+        self.draft = make_post(self.author, 'Django ORM draft', 'Querysets and joins.', status=BlogPost.Status.DRAFT)
+
+    def stored_list(self, post):
+        return list(RelatedPost.objects.filter(post=post).order_by('-score').values_list('related_id', 'score'))
+
+    def direct_score(self, index, first, second):
+        def weights(post):
+            counts = Counter(tokenize(f'{post.title} {post.content}'))
+            weights = {
+                term: (1 + math.log(count)) * index.idf[index.columns[term]]
+                for term, count in counts.items() if term in index.columns
+            }
+            norm = math.sqrt(sum(value * value for value in weights.values()))
+            return {term: value / norm for term, value in weights.items()}
+
+        first_weights, second_weights = weights(first), weights(second)
+        cosine = sum(value * second_weights.get(term, 0) for term, value in first_weights.items())
+        first_tags, second_tags = set(first.tags.all()), set(second.tags.all())
+        jaccard = len(first_tags & second_tags) / len(first_tags | second_tags) if first_tags | second_tags else 0
+        return 0.5 * cosine + 0.5 * jaccard
+
+    def test_rebuild_stores_the_best_published_neighbours(self):
+        rebuild_related_posts()
+        self.assertTrue(os.path.exists(self.index_path))
+        related = [pk for pk, _ in self.stored_list(self.orm)]
+        self.assertEqual(related[0], self.migrations.pk)
+        self.assertNotIn(self.orm.pk, related)
+        self.assertNotIn(self.draft.pk, related)
+        self.assertEqual([pk for pk, _ in self.stored_list(self.garden)][0], self.compost.pk)
+        self.assertEqual(self.stored_list(self.draft), [])
+
+    def test_scores_add_tfidf_cosine_and_tag_jaccard(self):
+        index = rebuild_related_posts()
+        posts = [self.orm, self.migrations, self.garden, self.compost]
+        for first, second in itertools.permutations(posts, 2):
+            with self.subTest(first=first.title, second=second.title):
+                score = index.similarities([index.rows[first.pk]])[0][index.rows[second.pk]]
+                self.assertAlmostEqual(score, self.direct_score(index, first, second))
+        for first in posts:
+            expected = sorted(
+                (score for score in (self.direct_score(index, first, second) for second in posts if second != first)
+                 if score > 0),
+                reverse=True,
+            )
+            self.assertEqual([round(score, 9) for _, score in self.stored_list(first)],
+                             [round(score, 9) for score in expected])
+
+    def test_retag_updates_the_saved_index_and_lists(self):
+        rebuild_related_posts()
+        before = dict(self.stored_list(self.migrations)).get(self.garden.pk, 0)
+        self.garden.tags.add(self.django_tag)
+        self.run_tasks()
+        # Other processes load the update from the saved index.
+        index = RelatedIndex.load(self.index_path)
+        expected = self.direct_score(index, self.garden, self.migrations)
+        self.assertAlmostEqual(
+            index.similarities([index.rows[self.garden.pk]])[0][index.rows[self.migrations.pk]], expected,
+        )
+        # The shared tag adds TAG_WEIGHT times a Jaccard overlap of 1.
+        self.assertAlmostEqual(expected - before, 0.5)
+        self.assertAlmostEqual(dict(self.stored_list(self.migrations))[self.garden.pk], expected)
+        self.assertAlmostEqual(dict(self.stored_list(self.garden))[self.migrations.pk], expected)
+        # Unpublishing drops the post from every list.
+        self.garden.status = BlogPost.Status.DRAFT
+        self.garden.save()
+        self.run_tasks()
+        self.assertEqual(self.stored_list(self.garden), [])
+        self.assertFalse(RelatedPost.objects.filter(related=self.garden).exists())
+
+    def test_updates_of_a_post_are_collapsed(self):
+        with override_settings(BLOG_RELATED={'INDEX_PATH': self.index_path, 'UPDATE_DELAY': 60}):
+            self.orm.save()
+            self.orm.save()
+        self.assertEqual(Task.objects.filter(name='related_posts_update', arguments=[[self.orm.pk]]).count(), 1)
+
+    def test_related_action(self):
+        rebuild_related_posts()
+        response = self.client.get(f'/api/blog/posts/{self.orm.pk}/related/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([post['id'] for post in response.json()], [pk for pk, _ in self.stored_list(self.orm)])
+        self.assertEqual(self.client.get(f'/api/blog/posts/{self.draft.pk}/related/').status_code, 404)
+
+
+class BulkWriteTests(BlogTestCase):
+    url = '/api/blog/posts/bulk/'
+
+    def setUp(self):
+        super().setUp()
+        self.post = make_post(self.author, 'Existing post', category=self.category, tags=[self.django_tag])
+        self.authenticate(self.author)
+
+    def bulk(self, items):
+        return self.client.post(self.url, items, format='json')
+
+    def item(self, title, **fields):
+        return {'title': title, 'content': CONTENT, 'status': 'published', 'category': self.category.pk, **fields}
+
+    def stats(self, model, pk):
+        return model.objects.filter(pk=pk).values_list(*PostStats.STAT_FIELDS).get()[:2]
+
+    def indexed_titles(self, word):
+        posts = get_search_backend().filter(BlogPost.objects.all(), word)
+        return sorted(posts.values_list('title', flat=True))
+
+    def test_status_follows_item_results(self):
+        self.assertEqual(self.bulk([self.item('Bulk one'), self.item('Bulk two')]).status_code, 201)
+        self.assertEqual(self.bulk([self.item('Bulk three'), self.item('')]).status_code, 207)
+        self.assertEqual(self.bulk([self.item(''), 'not an object']).status_code, 400)
+        self.assertEqual(self.bulk([]).status_code, 400)
+        self.assertEqual(self.bulk({'title': 'Not a list'}).status_code, 400)
+        self.assertEqual(self.bulk([self.item('Too many')] * (MAX_BATCH_SIZE + 1)).status_code, 400)
+
+    def test_item_errors(self):
+        other = make_post(self.staff, 'Someone else\'s post')
+        response = self.bulk([
+            'not an object',
+            {'id': 10 ** 9, 'title': 'Missing'},
+            {'id': other.pk, 'title': 'Not mine'},
+            self.item('Bad tags', tags=[10 ** 9]),
+            self.item('Bad category', category='abc'),
+            {'id': self.post.pk, 'title': 'Stale', 'if_match': '"stale"'},
+            self.item('Fine post'),
+        ])
+        self.assertEqual(response.status_code, 207, response.content)
+        results = response.json()['results']
+        self.assertEqual(results[0]['errors'], NOT_AN_OBJECT)
+        self.assertEqual(results[1]['errors'], NOT_FOUND)
+        self.assertEqual(results[2]['errors'], NOT_PERMITTED)
+        self.assertEqual(results[3]['errors'], {'tags': [f'Invalid pk "{10 ** 9}" - object does not exist.']})
+        self.assertEqual(results[4]['errors'], {'category': ['Incorrect type. Expected pk value, received str.']})
+        self.assertEqual(results[5]['errors'], PRECONDITION_FAILED)
+        self.assertEqual((results[6]['index'], results[6]['status']), (6, 'created'))
+        self.assertEqual(BlogPost.objects.get(pk=other.pk).title, 'Someone else\'s post')
+        self.assertEqual(BlogPost.objects.get(pk=self.post.pk).title, 'Existing post')
+
+    def test_if_match_takes_the_detail_etag(self):
+        etag = self.client.get(f'/api/blog/posts/{self.post.pk}/')['ETag']
+        response = self.bulk([{'id': self.post.pk, 'title': 'First edit', 'if_match': etag}])
+        self.assertEqual(response.status_code, 201, response.content)
+        response = self.bulk([{'id': self.post.pk, 'title': 'Lost edit', 'if_match': etag}])
+        self.assertEqual(response.json()['results'][0]['errors'], PRECONDITION_FAILED)
+        self.assertEqual(BlogPost.objects.get(pk=self.post.pk).title, 'First edit')
+
+    def test_updates_lock_their_rows_before_reading_them(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.bulk([{'id': self.post.pk, 'title': 'Locked edit'}])
+        post_queries = [query['sql'] for query in queries.captured_queries if '"blog_blogpost"' in query['sql']]
+        # SQLite has no SELECT ... FOR UPDATE; a write takes its lock.
+        self.assertTrue(post_queries[0].startswith('UPDATE "blog_blogpost" SET "id" = "blog_blogpost"."id"'),
+                        post_queries[0])
+
+    def test_tags_counters_and_search_index_follow_writes(self):
+        frontend = Category.objects.create(name='Frontend')
+        response = self.bulk([
+            self.item('Bulk zeppelin', category=frontend.pk, tags=[self.python_tag.pk, self.python_tag.pk]),
+            {'id': self.post.pk, 'category': frontend.pk, 'tags': [self.python_tag.pk], 'status': 'draft'},
+        ])
+        self.assertEqual(response.status_code, 201, response.content)
+        created = response.json()['results'][0]['id']
+        through = BlogPost.tags.through.objects
+        self.assertEqual(list(through.filter(blogpost_id=created).values_list('tag_id', flat=True)),
+                         [self.python_tag.pk])
+        self.assertEqual(list(through.filter(blogpost_id=self.post.pk).values_list('tag_id', flat=True)),
+                         [self.python_tag.pk])
+        # (post_count, published_post_count)
+        self.assertEqual(self.stats(Category, self.category.pk), (0, 0))
+        self.assertEqual(self.stats(Category, frontend.pk), (2, 1))
+        self.assertEqual(self.stats(Tag, self.django_tag.pk), (0, 0))
+        self.assertEqual(self.stats(Tag, self.python_tag.pk), (2, 1))
+        self.assertEqual(self.stats(AuthorStats, self.author.pk), (2, 1))
+        self.assertEqual(self.indexed_titles('zeppelin'), ['Bulk zeppelin'])
+        self.bulk([{'id': created, 'title': 'Bulk airship'}])
+        self.assertEqual(self.indexed_titles('zeppelin'), [])
+        self.assertEqual(self.indexed_titles('airship'), ['Bulk airship'])
+
+    def test_import_posts_reports_bad_lines(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'posts.ndjson')
+        with open(path, 'w') as file:
+            file.write(json.dumps(self.item('Imported one')) + '\n')
+            file.write('{"title": "Broken\n')
+            file.write('\n')
+            file.write(json.dumps(self.item('')) + '\n')
+            file.write(json.dumps(self.item('Imported two')) + '\n')
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_posts', path, author='alice', batch_size=2, stdout=stdout, stderr=stderr)
+        self.assertIn('Imported 2 posts, 2 failed', stdout.getvalue())
+        self.assertIn('line 2: invalid JSON', stderr.getvalue())
+        self.assertIn('line 4: {"title"', stderr.getvalue())
+        self.assertEqual(
+            sorted(BlogPost.objects.filter(title__startswith='Imported').values_list('title', flat=True)),
+            ['Imported one', 'Imported two'],
+        )
+
+
+class ExportTests(BlogTestCase):
+    chunk_size = 100
+
+    def seed(self, count):
+        start = BlogPost.objects.count()
+        posts = BlogPost.objects.bulk_create(
+            BlogPost(title=f'Export post {start + index}', content=CONTENT * 40, author=self.author,
+                     category=self.category, status=BlogPost.Status.PUBLISHED)
+            for index in range(count)
+        )
+        BlogPost.tags.through.objects.bulk_create(
+            BlogPost.tags.through(blogpost_id=post.pk, tag_id=tag.pk)
+            for post in posts for tag in (self.django_tag, self.python_tag)
+        )
+
+    def stream(self, export_format='ndjson'):
+        """
+        Stream the export under tracemalloc and return ``(lines, bytes, peak)``.
+        """
+        self.authenticate(self.staff)
+        tracemalloc.start()
+        try:
+            response = self.client.get(f'/api/blog/posts/export/?format={export_format}')
+            lines = size = 0
+            for chunk in response.streaming_content:
+                lines += chunk.count(b'\n')
+                size += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(response.status_code, 200)
+        return lines, size, peak
+
+    def test_export_streams_in_bounded_memory(self):
+        with mock.patch('blog.export.EXPORT_CHUNK_SIZE', self.chunk_size):
+            self.seed(5 * self.chunk_size)
+            small = self.stream()
+            self.seed(20 * self.chunk_size)
+            large = self.stream()
+        self.assertEqual((small[0], large[0]), (5 * self.chunk_size, 25 * self.chunk_size))
+        # Holding the rows would take more than the ~7 MB streamed; a few
+        # chunks' worth of rows and the request itself are about 1.5 MB.
+        self.assertLess(large[2], large[1] / 3)
+        self.assertLess(large[2], small[2] * 1.5)
+
+    def test_csv_export_streams_in_bounded_memory(self):
+        with mock.patch('blog.export.EXPORT_CHUNK_SIZE', self.chunk_size):
+            self.seed(20 * self.chunk_size)
+            lines, size, peak = self.stream('csv')
+        self.assertGreaterEqual(lines, 20 * self.chunk_size + 1)
+        self.assertLess(peak, size / 3)
+
+
+class ReferenceDetailSerializer(BlogPostDetailSerializer):
+    """
+    The detail serializer with DRF's own one-query-per-id relations.
+    """
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
+    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True, required=False)
+
+
+class SerializerContractTests(BlogTestCase):
+    """
+    Payloads and validation errors must match byte for byte those of DRF's
+    plain relations and of the serializer-rendered lists.
+    """
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def payload(self, **fields):
+        return {'title': 'Contract post', 'content': CONTENT, 'category': self.category.pk, **fields}
+
+    def test_detail_payload_matches_drf_relations(self):
+        post = make_post(self.author, 'Contract post', category=self.category,
+                         tags=[self.python_tag, self.django_tag])
+        response = self.client.get(f'/api/blog/posts/{post.pk}/')
+        expected = ReferenceDetailSerializer(BlogPost.objects.for_detail().get(pk=post.pk)).data
+        self.assertEqual(response.content, self.render(expected))
+
+    def write(self, serializer_class, method, url, payload):
+        with mock.patch('blog.views.BlogPostDetailSerializer', serializer_class):
+            response = getattr(self.client, method)(url, payload, format='json')
+        data = response.json()
+        # The only values that differ between two identical writes.
+        for field in ('created_at', 'updated_at', 'published_date'):
+            data.pop(field, None)
+        return response.status_code, self.render(data)
+
+    def test_written_payloads_match_drf_relations(self):
+        self.authenticate(self.author)
+        post = make_post(self.author, 'Contract post', category=self.category)
+        tags = [self.python_tag.pk, self.django_tag.pk, self.python_tag.pk]
+        writes = [
+            ('post', '/api/blog/posts/', self.payload(tags=tags)),
+            ('post', '/api/blog/posts/', self.payload(tags=[self.django_tag.pk, 999])),
+            ('put', f'/api/blog/posts/{post.pk}/', self.payload(tags=tags)),
+            ('patch', f'/api/blog/posts/{post.pk}/', {'tags': [self.django_tag.pk]}),
+            ('patch', f'/api/blog/posts/{post.pk}/', {'tags': ['abc', 999]}),
+        ]
+        for method, url, payload in writes:
+            with self.subTest(method=method, payload=payload):
+                with transaction.atomic():
+                    expected = self.write(ReferenceDetailSerializer, method, url, payload)
+                    transaction.set_rollback(True)
+                self.assertEqual(self.write(BlogPostDetailSerializer, method, url, payload), expected)
+
+    def test_validation_matches_drf_relations(self):
+        tag, other = self.django_tag.pk, self.python_tag.pk
+        payloads = [
+            self.payload(tags=[tag, other, tag]),
+            self.payload(tags=[str(tag)]),
+            self.payload(tags=[]),
+            self.payload(tags=[999, 998]),
+            self.payload(tags=[tag, 999, 'abc']),
+            self.payload(tags=['abc', 999]),
+            self.payload(tags=[True]),
+            self.payload(tags=[None]),
+            self.payload(tags=[[tag]]),
+            self.payload(tags='not a list'),
+            self.payload(tags={'id': tag}),
+            self.payload(category=555),
+            self.payload(category='abc'),
+            self.payload(category=None),
+        ]
+        resolved = {'resolved_objects': {Category: {self.category.pk: self.category},
+                                         Tag: {tag: self.django_tag, other: self.python_tag}}}
+        for payload in payloads:
+            for context in ({}, resolved):
+                with self.subTest(payload=payload, resolved=bool(context)):
+                    bulk = BlogPostDetailSerializer(data=payload, context=context)
+                    reference = ReferenceDetailSerializer(data=payload)
+                    self.assertEqual(bulk.is_valid(), reference.is_valid())
+                    self.assertEqual(self.render(bulk.errors), self.render(reference.errors))
+                    if reference.is_valid():
+                        self.assertEqual(bulk.validated_data, reference.validated_data)
+
+    def test_relations_are_resolved_with_one_query_per_model(self):
+        tags = [Tag.objects.create(name=f'contract-{index}').pk for index in range(8)]
+
+        def selects(payload):
+            with CaptureQueriesContext(connection) as queries:
+                serializer = BlogPostDetailSerializer(data=payload)
+                serializer.is_valid()
+            tables = [re.search(r' FROM "(\w+)"', query['sql'])[1] for query in queries]
+            return Counter(tables), serializer
+
+        counts, serializer = selects(self.payload(tags=tags))
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(counts, {'blog_category': 1, 'blog_tag': 1})
+        self.assertEqual([tag.pk for tag in serializer.validated_data['tags']], tags)
+
+        payload = self.payload(tags=[*tags, 999, tags[0], 998], category=555)
+        counts, serializer = selects(payload)
+        self.assertEqual(counts, {'blog_category': 1, 'blog_tag': 1})
+        reference = ReferenceDetailSerializer(data=payload)
+        self.assertFalse(reference.is_valid())
+        self.assertEqual(self.render(serializer.errors), self.render(reference.errors))
+
+        # Whole writes cost the same whatever the number of tags.
+        self.authenticate(self.author)
+        # The first write also creates the author's stats row.
+        self.client.post('/api/blog/posts/', self.payload(), format='json')
+        with CaptureQueriesContext(connection) as few:
+            self.client.post('/api/blog/posts/', self.payload(tags=tags[:2]), format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post('/api/blog/posts/', self.payload(tags=tags), format='json')
+        self.assertEqual(len(many), len(few))
+
+    def test_list_payloads_match_the_serializer(self):
+        for index in range(12):
+            make_post(self.author, f'Contract post {index}', category=self.category if index % 2 else None,
+                      tags=[self.django_tag, self.python_tag][:index % 3])
+        self.authenticate(self.author)
+        urls = [
+            '/api/blog/posts/', '/api/blog/posts/?page=2', '/api/blog/posts/?pagination=cursor',
+            '/api/blog/posts/recent/', '/api/blog/posts/my_posts/',
+            f'/api/blog/tags/{self.django_tag.pk}/posts/', f'/api/blog/categories/{self.category.pk}/posts/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                fast = self.client.get(url).content
+                with override_settings(BLOG_FAST_LIST_SERIALIZATION=False):
+                    self.assertEqual(fast, self.client.get(url).content)
@@ -0,0 +1,156 @@
+"""
+Trending posts.
+
+Each published post that has been viewed has a ``TrendingScore`` row holding
+its views weighted by ``2 ** ((t - EPOCH) / HALF_LIFE)``, where ``t`` is the
+time of each view. Scaling every score by the same ``2 ** (-(now - EPOCH) /
+HALF_LIFE)`` turns the sum into a view count that halves every
+``HALF_LIFE`` seconds. That scaling does not change the order, so the stored
+scores never need updating as time passes. Scores are stored as natural
+logarithms, which keeps them finite however far ``now`` is from ``EPOCH``.
+
+View-count flushes (see ``blog.counters``) add each batch with one
+log-sum-exp ``UPDATE`` per distinct increment. Rows exist only for published
+posts and carry the post's category, so the indexes on ``score`` and
+``(category, score)`` give the top N in N index entries. ``sync_trending_scores``
+keeps status and category in step, and ``rebuild_trending_scores`` recomputes
+everything from ``view_count``.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from .models import BlogPost, TrendingScore
+
+DEFAULTS = {
+    # Seconds for a view's weight to halve. Changing it needs a rebuild.
+    'HALF_LIFE': 6 * 60 * 60,
+    'DEFAULT_LIMIT': 10,
+    'MAX_LIMIT': 100,
+}
+
+# Landmark that scores are measured from; changing it needs a rebuild.
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+# exp() of anything below -700 is zero for our purposes, and PostgreSQL
+# raises an underflow error well before a double would.
+MIN_EXPONENT = -700.0
+
+# Posts scored per INSERT when rebuilding.
+REBUILD_BATCH_SIZE = 1000
+
+
+def trending_setting(name):
+    return getattr(settings, 'BLOG_TRENDING', {}).get(name, DEFAULTS[name])
+
+
+def view_score(views, at):
+    """
+    Log-space score of ``views`` views at time ``at``.
+    """
+    rate = math.log(2) / trending_setting('HALF_LIFE')
+    return math.log(views) + rate * (at - EPOCH).total_seconds()
+
+
+def add_score(score):
+    """
+    Expression for ``log(exp(score_column) + exp(score))``, computed as
+    ``max + log(1 + exp(-|difference|))`` so neither term overflows.
+    """
+    score = Value(score, output_field=FloatField())
+    exponent = Greatest(-Abs(F('score') - score), Value(MIN_EXPONENT))
+    return Greatest(F('score'), score) + Ln(Value(1.0) + Exp(exponent))
+
+
+def record_trending_views(views_by_post, at=None, using=DEFAULT_DB_ALIAS):
+    """
+    Add flushed view increments to the scores of the published posts among
+    them.
+    """
+    at = at or timezone.now()
+    category_by_post = dict(
+        BlogPost.objects.using(using).published().filter(
+            pk__in=list(views_by_post)
+        ).values_list('pk', 'category_id')
+    )
+    if not category_by_post:
+        return
+    scores = TrendingScore.objects.using(using)
+    existing = set(
+        scores.filter(post_id__in=list(category_by_post)).values_list('post_id', flat=True)
+    )
+    # A first view racing another process's flush loses that batch's views
+    # for the post; the next batch lands normally.
+    scores.bulk_create([
+        TrendingScore(post_id=pk, category_id=category_id, score=view_score(views_by_post[pk], at))
+        for pk, category_id in category_by_post.items() if pk not in existing
+    ], ignore_conflicts=True)
+
+    post_ids_by_delta = defaultdict(list)
+    for pk in existing:
+        post_ids_by_delta[views_by_post[pk]].append(pk)
+    for delta, post_ids in post_ids_by_delta.items():
+        scores.filter(post_id__in=post_ids).update(score=add_score(view_score(delta, at)))
+
+
+def sync_trending_scores(posts, using=DEFAULT_DB_ALIAS):
+    """
+    Drop the scores of posts that are no longer published and move the rest
+    to their current category. ``posts`` maps post ids to anything with
+    ``status`` and ``category_id``, such as posts or ``PostState`` tuples.
+    """
+    scores = TrendingScore.objects.using(using)
+    unpublished = []
+    post_ids_by_category = defaultdict(list)
+    for pk, post in posts.items():
+        if post.status == BlogPost.Status.PUBLISHED:
+            post_ids_by_category[post.category_id].append(pk)
+        else:
+            unpublished.append(pk)
+    if unpublished:
+        scores.filter(post_id__in=unpublished).delete()
+    for category_id, post_ids in post_ids_by_category.items():
+        scores.filter(post_id__in=post_ids).exclude(
+            category_id=category_id
+        ).update(category_id=category_id)
+
+
+def rebuild_trending_scores(using=DEFAULT_DB_ALIAS):
+    """
+    Recompute every score from ``view_count``. View times are not stored, so
+    a post's views count as arriving when it was published.
+    """
+    scores = TrendingScore.objects.using(using)
+    scores.all().delete()
+    now = timezone.now()
+    rows = BlogPost.objects.using(using).published().filter(
+        view_count__gt=0
+    ).order_by().values_list('pk', 'category_id', 'view_count', 'published_date')
+    batch = []
+    for pk, category_id, view_count, published_date in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+        batch.append(TrendingScore(
+            post_id=pk, category_id=category_id, score=view_score(view_count, published_date or now)
+        ))
+        if len(batch) == REBUILD_BATCH_SIZE:
+            scores.bulk_create(batch)
+            batch = []
+    scores.bulk_create(batch)
+
+
+def trending_post_ids(category_id=None, limit=None):
+    """
+    Queryset of the ids of the ``limit`` highest scoring posts, optionally
+    within one category.
+    """
+    scores = TrendingScore.objects.all()
+    if category_id is not None:
+        scores = scores.filter(category_id=category_id)
+    limit = limit or trending_setting('DEFAULT_LIMIT')
+    return scores.order_by('-score').values_list('post_id', flat=True)[:limit]
+
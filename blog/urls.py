@@ -1,12 +1,22 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .async_views import async_urls
 
 router = DefaultRouter()
 router.register(r'categories', views.CategoryViewSet)
 router.register(r'tags', views.TagViewSet)
 router.register(r'posts', views.BlogPostViewSet, basename='post')
+router.register(r'changes', views.ChangeViewSet, basename='change')
+
+router_urls = router.urls
+if settings.BLOG_ASYNC_READS:
+    router_urls = async_urls(router_urls)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
+    path('cache-stats/', views.CacheStatsView.as_view(), name='cache-stats'),
+    path('task-stats/', views.TaskStatsView.as_view(), name='task-stats'),
+    path('request-metrics/', views.RequestMetricsView.as_view(), name='request-metrics'),
 ]
\ No newline at end of file
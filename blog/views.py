@@ -1,70 +1,171 @@
-from rest_framework import viewsets, generics, filters, status
+
+from rest_framework import viewsets, generics, filters, status, exceptions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count
 from .models import BlogPost, Category, Tag
 from .serializers import (
     BlogPostListSerializer, BlogPostDetailSerializer,
     CategorySerializer, TagSerializer
 )
 from .permissions import IsAuthorOrReadOnly, IsAdminOrReadOnly, IsAuthorOrAdmin
-from .filters import BlogPostFilter
+from .filters import BlogPostFilter, SearchRankOrderingFilter
+from .counters import view_counter
+from .pagination import PostPagination
+from .cache import cache_response, cache_stats, label_payload_tags
+from .query_budget import query_budget
+from .bulk import MAX_BATCH_SIZE, write_posts
+from .export import CSVRenderer, NDJSONRenderer, export_response
+from .rows import by_rank, fast_list_enabled, list_values, post_list_data
+from .conditional import ConditionalObjectMixin, conditional_response, row_state
+from .trending import trending_post_ids, trending_setting
+from .related import related_post_ids
+from .rendering import PostHTMLRenderer
+from .changes import changes_setting, feed_page, parse_cursor
+from .tasks import queue_stats
 from django.utils import timezone
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from postflow.instrumentation import InstrumentedViewMixin, request_metrics, span
 
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.annotate(post_count=Count('blog_posts'))
+class PostListMixin:
+    """
+    Paginated post listings for custom actions, using the same paginator as
+    the post list regardless of the viewset's own pagination.
+    """
+    post_pagination_class = PostPagination
+    
+    def post_list_response(self, posts, paginator=None):
+        paginator = paginator or self.post_pagination_class()
+        if fast_list_enabled():
+            # values() rows rendered without serializers; see blog.rows.
+            page = paginator.paginate_queryset(
+                list_values(posts), self.request, view=self, count_queryset=posts
+            )
+            return paginator.get_paginated_response(post_list_data(page))
+        posts = posts.for_list()
+        page = paginator.paginate_queryset(posts, self.request, view=self)
+        serializer = BlogPostListSerializer(page, many=True, context={'request': self.request})
+        with span('serialize'):
+            data = serializer.data
+        return paginator.get_paginated_response(data)
+    
+    def ranked_list_response(self, post_ids):
+        """
+        The published posts among ``post_ids``, in that order, unpaginated.
+        """
+        # Unordered: by_rank puts them in order, so SQL need not sort.
+        posts = BlogPost.objects.published().filter(pk__in=post_ids).order_by()
+        if fast_list_enabled():
+            return Response(post_list_data(by_rank(list_values(posts), post_ids)))
+        posts = by_rank(posts.for_list(), post_ids)
+        serializer = BlogPostListSerializer(posts, many=True, context={'request': self.request})
+        with span('serialize'):
+            return Response(serializer.data)
+
+class CategoryViewSet(InstrumentedViewMixin, ConditionalObjectMixin, PostListMixin, viewsets.ModelViewSet):
+    queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'description']
     
+    def validator_state(self, category):
+        return row_state(category, CategorySerializer.Meta.fields)
+    
+    @conditional_response('categories', collect=label_payload_tags('category'))
+    @cache_response('categories', collect=label_payload_tags('category'))
+    @query_budget(2)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    @conditional_response('category:{pk}')
+    @cache_response('category:{pk}')
+    @query_budget(4)
     def posts(self, request, pk=None):
         category = self.get_object()
-        posts = category.blog_posts.filter(status='published')
-        serializer = BlogPostListSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        posts = category.blog_posts.published()
+        return self.post_list_response(posts)
 
-class TagViewSet(viewsets.ModelViewSet):
-    queryset = Tag.objects.annotate(post_count=Count('blog_posts'))
+class TagViewSet(InstrumentedViewMixin, ConditionalObjectMixin, PostListMixin, viewsets.ModelViewSet):
+    queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [IsAdminOrReadOnly]
     filter_backends = [filters.SearchFilter]
     search_fields = ['name']
     
+    def validator_state(self, tag):
+        return row_state(tag, TagSerializer.Meta.fields)
+    
+    @conditional_response('tags', collect=label_payload_tags('tag'))
+    @cache_response('tags', collect=label_payload_tags('tag'))
+    @query_budget(2)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    @conditional_response('tag:{pk}')
+    @cache_response('tag:{pk}')
+    @query_budget(4)
     def posts(self, request, pk=None):
         tag = self.get_object()
-        posts = tag.blog_posts.filter(status='published')
-        serializer = BlogPostListSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        posts = tag.blog_posts.published()
+        return self.post_list_response(posts)
 
-class BlogPostViewSet(viewsets.ModelViewSet):
+class BlogPostViewSet(InstrumentedViewMixin, ConditionalObjectMixin, PostListMixin, viewsets.ModelViewSet):
     serializer_class = BlogPostDetailSerializer
     permission_classes = [IsAuthorOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # ?search= (substrings) and ranked ?q= (the full-text index, see
+    # blog.search) are served by BlogPostFilter.
+    filter_backends = [DjangoFilterBackend, SearchRankOrderingFilter]
     filterset_class = BlogPostFilter
-    search_fields = ['title', 'content', 'author__username', 'category__name', 'tags__name']
     ordering_fields = ['published_date', 'created_at', 'view_count', 'title']
     ordering = ['-published_date']
+    pagination_class = PostPagination
     
     def get_queryset(self):
-        queryset = BlogPost.objects.select_related('author', 'category').prefetch_related('tags')
-        
-        # Filter based on user permissions
-        if self.request.user.is_authenticated:
-            if self.request.user.is_staff:
-                # Admins can see all posts
-                return queryset
-            # Authenticated users can see their own drafts and all published posts
-            return queryset.filter(
-                Q(status='published') | Q(author=self.request.user)
-            )
+        if self.action == 'list':
+            # Only the columns BlogPostListSerializer renders; no post bodies.
+            queryset = BlogPost.objects.for_list()
+        elif self.action == 'related':
+            # Only looked up for the visibility check.
+            queryset = BlogPost.objects.only('pk', 'status', 'author')
         else:
-            # Anonymous users can only see published posts
-            return queryset.filter(status='published')
+            queryset = BlogPost.objects.for_detail()
+        
+        return queryset.visible_to(self.request.user)
+    
+    @conditional_response('posts')
+    @query_budget(3)
+    def list(self, request, *args, **kwargs):
+        if not fast_list_enabled():
+            return super().list(request, *args, **kwargs)
+        posts = self.filter_queryset(self.get_queryset())
+        return self.post_list_response(posts, paginator=self.paginator)
+    
+    @query_budget(2)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    def validator_state(self, post):
+        # Everything the detail representation shows; bodies by their hashes.
+        state = [
+            row_state(post, exclude=('content', 'content_html')),
+            row_state(post.author, ('id', 'username', 'first_name', 'last_name')),
+        ]
+        if post.category_id:
+            state.append(row_state(post.category, CategorySerializer.Meta.fields))
+        state.extend(row_state(tag, TagSerializer.Meta.fields) for tag in post.tags.all())
+        return state
+    
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action == 'retrieve':
+            # ?format=html answers with just the rendered content.
+            renderers.append(PostHTMLRenderer())
+        return renderers
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -74,6 +175,47 @@ class BlogPostViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
     
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        # ?format=ndjson (default) or ?format=csv; same filters and visibility
+        # as the list. Streamed, so memory stays flat at any size.
+        posts = self.filter_queryset(self.get_queryset())
+        return export_response(posts, request.accepted_renderer.format)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "Expected a non-empty list of posts"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_BATCH_SIZE:
+            return Response(
+                {"error": f"At most {MAX_BATCH_SIZE} posts per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Items with an "id" update that post; the rest are created. An
+        # "if_match" is checked against the ETag of the post's detail.
+        permission = IsAuthorOrReadOnly()
+        results = write_posts(
+            items,
+            author=request.user,
+            posts=self.get_queryset(),
+            can_change=lambda post: permission.has_object_permission(request, self, post),
+            etag=lambda post: self.object_etag(post, reverse('post-detail', args=[post.pk])),
+            context=self.get_serializer_context(),
+        )
+        failed = sum('errors' in result for result in results)
+        if not failed:
+            response_status = status.HTTP_201_CREATED
+        elif failed == len(results):
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response({'results': results}, status=response_status)
+    
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def publish(self, request, pk=None):
         post = self.get_object()
@@ -92,12 +234,18 @@ class BlogPostViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def increment_views(self, request, pk=None):
-        post = self.get_object()
-        post.view_count += 1
-        post.save()
-        return Response({'view_count': post.view_count})
+        # Only the columns needed for the permission check and the response.
+        queryset = self.get_queryset().select_related(None).prefetch_related(None)
+        post = get_object_or_404(queryset.only('view_count', 'author'), pk=pk)
+        self.check_object_permissions(request, post)
+        # Buffered and flushed in batches; see blog.counters.
+        pending = view_counter.add(post.pk)
+        return Response({'view_count': post.view_count + pending})
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    @conditional_response('author:{author}')
+    @cache_response('author:{author}')
+    @query_budget(3)
     def by_author(self, request):
         author_id = request.query_params.get('author')
         if not author_id:
@@ -106,14 +254,13 @@ class BlogPostViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        posts = BlogPost.objects.filter(
-            author_id=author_id,
-            status='published'
-        )
-        serializer = BlogPostListSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        posts = BlogPost.objects.published().filter(author_id=author_id)
+        return self.post_list_response(posts)
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    @conditional_response('category:{category}')
+    @cache_response('category:{category}')
+    @query_budget(3)
     def by_category(self, request):
         category_id = request.query_params.get('category')
         if not category_id:
@@ -122,32 +269,116 @@ class BlogPostViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        posts = BlogPost.objects.filter(
-            category_id=category_id,
-            status='published'
-        )
-        serializer = BlogPostListSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        posts = BlogPost.objects.published().filter(category_id=category_id)
+        return self.post_list_response(posts)
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    @conditional_response('posts:featured')
+    @cache_response('posts:featured')
+    @query_budget(3)
     def featured(self, request):
-        posts = BlogPost.objects.filter(
-            is_featured=True,
-            status='published'
+        posts = BlogPost.objects.published().filter(
+            is_featured=True
         ).order_by('-published_date')
-        serializer = BlogPostListSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        return self.post_list_response(posts)
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    @conditional_response('posts:published')
+    @cache_response('posts:published')
+    @query_budget(2)
     def recent(self, request):
-        posts = BlogPost.objects.filter(
-            status='published'
-        ).order_by('-published_date')[:10]
-        serializer = BlogPostListSerializer(posts, many=True, context={'request': request})
+        posts = BlogPost.objects.published().order_by('-published_date')
+        if fast_list_enabled():
+            return Response(post_list_data(list_values(posts)[:10]))
+        serializer = BlogPostListSerializer(posts.for_list()[:10], many=True, context={'request': request})
         return Response(serializer.data)
     
+    def trending_params(self, request):
+        """
+        ``(category_id, limit)`` from ``?category=`` and ``?limit=``.
+        """
+        try:
+            category_id = request.query_params.get('category')
+            category_id = int(category_id) if category_id else None
+            limit = int(request.query_params.get('limit') or trending_setting('DEFAULT_LIMIT'))
+        except ValueError:
+            raise exceptions.ValidationError({"error": "category and limit must be integers"})
+        return category_id, max(1, min(limit, trending_setting('MAX_LIMIT')))
+    
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    @conditional_response('posts:trending')
+    @cache_response('posts:trending')
+    @query_budget(3)
+    def trending(self, request):
+        # Ranked by exponentially decayed recent views; see blog.trending.
+        post_ids = list(trending_post_ids(*self.trending_params(request)))
+        return self.ranked_list_response(post_ids)
+    
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    @conditional_response('related', 'related:{pk}')
+    @cache_response('related', 'related:{pk}')
+    @query_budget(4)
+    def related(self, request, pk=None):
+        # Precomputed neighbour lists; see blog.related.
+        post = self.get_object()
+        return self.ranked_list_response(list(related_post_ids(post.pk)))
+    
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @conditional_response('posts')
+    @query_budget(3)
     def my_posts(self, request):
         posts = BlogPost.objects.filter(author=request.user)
-        serializer = BlogPostListSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
\ No newline at end of file
+        return self.post_list_response(posts)
+
+class ChangeViewSet(InstrumentedViewMixin, viewsets.GenericViewSet):
+    """
+    ``?since=<cursor>`` returns the posts, categories and tags changed after
+    the cursor, in order, with the cursor to pass next; see blog.changes.
+    ``?wait=<seconds>`` holds the request until there are changes, but only
+    in AsyncChangeViewSet: here a waiting request would hold a worker for
+    its whole wait, so the feed answers at once.
+    """
+    permission_classes = [AllowAny]
+    pagination_class = None
+    long_polling = False
+    
+    def feed_params(self, request):
+        """
+        ``(cursor, limit, wait)`` from ``?since=``, ``?limit=`` and ``?wait=``.
+        """
+        try:
+            cursor = parse_cursor(request.query_params.get('since'))
+            limit = int(request.query_params.get('limit') or changes_setting('PAGE_SIZE'))
+            wait = float(request.query_params.get('wait') or 0)
+        except ValueError:
+            raise exceptions.ValidationError({"error": "since must be a cursor, limit and wait numbers"})
+        limit = max(1, min(limit, changes_setting('MAX_PAGE_SIZE')))
+        max_wait = changes_setting('MAX_WAIT') if self.long_polling else 0
+        return cursor, limit, max(0.0, min(wait, max_wait))
+    
+    def feed_posts(self):
+        return BlogPost.objects.visible_to(self.request.user)
+    
+    def list(self, request):
+        cursor, limit, _ = self.feed_params(request)
+        return Response(feed_page(cursor, limit, self.feed_posts()))
+
+class CacheStatsView(InstrumentedViewMixin, generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response(cache_stats.snapshot())
+
+class TaskStatsView(InstrumentedViewMixin, generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        # Queue depth and latency per task; see blog.tasks.
+        return Response(queue_stats())
+
+class RequestMetricsView(InstrumentedViewMixin, generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        # Per-view latency percentiles; see postflow.instrumentation.
+        return Response(request_metrics.snapshot())
@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'postflow.settings')
+# Hot read endpoints run as async views here; see blog/async_views.py.
+os.environ.setdefault('BLOG_ASYNC_READS', '1')
 
 application = get_asgi_application()
+
+# Tasks queued before this process started; see blog/tasks.py.
+from blog.tasks import in_process_tasks  # noqa: E402
+
+in_process_tasks.started()
@@ -0,0 +1,37 @@
+"""
+Cache backends shared between server processes.
+
+Response cache tag versions (``blog.cache``), read-replica pins
+(``postflow.replicas``) and user cache generations
+(``accounts.authentication``) are written by one worker and must be seen by
+all of them. A local-memory cache is private to its process, so under a
+multi-process server a write in one worker would go unnoticed by the others.
+Set ``CACHE_URL`` to a Redis or Memcached server to share the default cache.
+"""
+from django.conf import settings
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+def cache_config(url):
+    """
+    ``CACHES`` entry for ``url``: ``redis://`` or ``rediss://`` for Redis,
+    ``memcached://host:port`` for Memcached, and a local-memory cache when
+    ``url`` is empty.
+    """
+    if url.startswith(('redis://', 'rediss://')):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url}
+    if url.startswith('memcached://'):
+        return {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': url.removeprefix('memcached://'),
+        }
+    if url:
+        raise ValueError(f'Unsupported CACHE_URL scheme: {url!r}')
+    return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'postflow'}
+
+
+def is_process_local(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_BACKENDS
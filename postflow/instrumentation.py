@@ -0,0 +1,318 @@
+"""
+Per-request performance instrumentation.
+
+``InstrumentationMiddleware`` times every request and, through the hooks
+below, attributes that time to SQL (query count, total time and the slowest
+statement), authentication and serialization. The last two are spans opened
+by ``InstrumentedViewMixin`` around DRF's ``perform_authentication`` and
+serializer ``to_representation``, and by ``span()`` wherever code builds
+response data by hand (see ``blog.rows``). Span times exclude the SQL run
+inside them, so ``db + auth + serialize`` never exceeds ``total``.
+
+Each request's numbers are added to ``request_metrics``, an in-process
+registry of per-view p50/p95/p99 histograms, and, when
+``REQUEST_INSTRUMENTATION['SERVER_TIMING']`` is set, reported in a
+``Server-Timing`` response header that browser dev tools display.
+``LOG_SAMPLE_RATE`` of requests are also logged as one JSON object each to
+the ``postflow.performance`` logger.
+
+Disabled instrumentation (the default) costs nothing per request: the
+middleware removes itself with ``MiddlewareNotUsed``, no SQL wrapper is
+installed, and the hooks reduce to one ``ContextVar`` lookup each.
+``InstrumentationTests`` in blog.tests and ``manage.py bench_instrumentation``
+check that.
+"""
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('postflow.performance')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    # Fraction of requests logged to postflow.performance.
+    'LOG_SAMPLE_RATE': 0.0,
+    # Characters of the slowest statement kept in the log.
+    'MAX_SQL_LENGTH': 500,
+}
+
+# Timings of the current request; None when it is not instrumented.
+current_timings = ContextVar('current_timings', default=None)
+
+_disabled_span = nullcontext()
+
+
+def instrumentation_setting(name):
+    return getattr(settings, 'REQUEST_INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+class RequestTimings:
+    """
+    What one request spent its time on, in seconds.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.db = 0.0
+        self.slowest_sql = None
+        self.slowest_sql_time = 0.0
+        self.spans = defaultdict(float)
+        self.open_spans = set()
+        self.response_size = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(); see install_query_timer.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db += elapsed
+            if elapsed >= self.slowest_sql_time:
+                self.slowest_sql, self.slowest_sql_time = sql, elapsed
+
+    @contextmanager
+    def span(self, name):
+        self.open_spans.add(name)
+        started, db = time.perf_counter(), self.db
+        try:
+            yield
+        finally:
+            self.open_spans.discard(name)
+            self.spans[name] += (time.perf_counter() - started) - (self.db - db)
+
+    def finish(self, response):
+        self.total = time.perf_counter() - self.started
+        if not response.streaming:
+            self.response_size = len(response.content)
+
+    def server_timing(self):
+        metrics = [
+            f'total;dur={self.total * 1000:.2f}',
+            f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries"',
+        ]
+        if self.slowest_sql is not None:
+            metrics.append(f'db-slowest;dur={self.slowest_sql_time * 1000:.2f}')
+        metrics += [
+            f'{name};dur={seconds * 1000:.2f};desc="excluding SQL"'
+            for name, seconds in sorted(self.spans.items())
+        ]
+        if self.response_size is not None:
+            metrics.append(f'size;desc="{self.response_size} bytes"')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        sql = self.slowest_sql
+        if sql is not None:
+            sql = sql[:instrumentation_setting('MAX_SQL_LENGTH')]
+        return {
+            'total_ms': round(self.total * 1000, 3),
+            'queries': self.queries,
+            'db_ms': round(self.db * 1000, 3),
+            'slowest_sql': sql,
+            'slowest_sql_ms': round(self.slowest_sql_time * 1000, 3),
+            **{f'{name}_ms': round(seconds * 1000, 3) for name, seconds in sorted(self.spans.items())},
+            'response_bytes': self.response_size,
+        }
+
+
+def span(name):
+    """
+    Context manager charging its block, minus the SQL it runs, to ``name``
+    on the current request. Nested spans of the same name count once.
+    """
+    timings = current_timings.get()
+    if timings is None or name in timings.open_spans:
+        return _disabled_span
+    return timings.span(name)
+
+
+def time_queries(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class Histogram:
+    """
+    Log-bucketed histogram; percentiles are within ``GROWTH - 1`` of the
+    true value.
+    """
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value):
+        self.buckets[math.ceil(math.log(max(value, 1e-6), self.GROWTH))] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.GROWTH ** bucket, self.max)
+        return self.max
+
+
+class RequestMetrics:
+    """
+    In-process latency histograms per view, in milliseconds.
+    """
+    PERCENTILES = (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, timings):
+        values = {'total': timings.total, 'db': timings.db, **timings.spans}
+        with self._lock:
+            entry = self._views.setdefault(view, {'queries': 0, 'histograms': defaultdict(Histogram)})
+            entry['queries'] += timings.queries
+            for name, seconds in values.items():
+                entry['histograms'][name].add(seconds * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            stats = {}
+            for view, entry in sorted(self._views.items()):
+                histograms = entry['histograms']
+                count = histograms['total'].count
+                stats[view] = {
+                    'requests': count,
+                    'mean_queries': round(entry['queries'] / count, 2),
+                    **{
+                        f'{name}_ms': {
+                            **{label: round(histogram.percentile(q), 3) for label, q in self.PERCENTILES},
+                            'max': round(histogram.max, 3),
+                        }
+                        for name, histogram in sorted(histograms.items())
+                    },
+                }
+            return stats
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return f"{request.method} {match.view_name if match else '<unresolved>'}"
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not instrumentation_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        # On every connection, including ones opened later in other threads
+        # (sync_to_async); the wrapper does nothing outside a request.
+        connection_created.connect(install_query_timer, dispatch_uid='postflow.instrumentation')
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.process_response(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.process_response(request, response, timings)
+
+    def process_response(self, request, response, timings):
+        timings.finish(response)
+        view = view_label(request)
+        request_metrics.record(view, timings)
+        if instrumentation_setting('SERVER_TIMING'):
+            response['Server-Timing'] = timings.server_timing()
+        if random.random() < instrumentation_setting('LOG_SAMPLE_RATE'):
+            logger.info(json.dumps({
+                'view': view,
+                'path': request.path,
+                'status': response.status_code,
+                **timings.as_dict(),
+            }))
+        return response
+
+
+@lru_cache(maxsize=None)
+def timed_serializer(serializer_class):
+    """
+    Subclass of ``serializer_class`` whose representations count as
+    ``serialize`` time; ``many=True`` times each item.
+    """
+    class Timed(serializer_class):
+        def to_representation(self, instance):
+            with span('serialize'):
+                return super().to_representation(instance)
+
+    Timed.__name__, Timed.__qualname__ = serializer_class.__name__, serializer_class.__qualname__
+    Timed.__module__ = serializer_class.__module__
+    return Timed
+
+
+class InstrumentedViewMixin:
+    """
+    Charges DRF authentication and serialization to the current request's
+    ``auth`` and ``serialize`` spans.
+    """
+
+    def perform_authentication(self, request):
+        with span('auth'):
+            super().perform_authentication(request)
+
+    def get_serializer(self, *args, **kwargs):
+        if current_timings.get() is None:
+            return super().get_serializer(*args, **kwargs)
+        kwargs.setdefault('context', self.get_serializer_context())
+        return timed_serializer(self.get_serializer_class())(*args, **kwargs)
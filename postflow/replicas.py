@@ -0,0 +1,174 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+``ReplicaMiddleware`` marks each safe-method request (GET, HEAD, OPTIONS) as
+eligible for a replica and picks one for the whole request;
+``ReplicaRouter`` then sends that request's reads to it. Everything else
+reads from ``default``: unsafe requests, management commands, background
+flushes and the tables in ``PRIMARY_APPS``, so a freshly registered user can
+log in before replication catches up. Writes always go to ``default``.
+
+After a successful write the client is pinned to the primary for
+``PIN_SECONDS``, so e.g. a new draft shows up in ``my_posts`` at once. The
+pin is a cookie for browsers and an entry in the ``CACHE_ALIAS`` cache keyed
+by user id for token clients. A pin set by one worker process must be seen by
+all of them, so with a local-memory ``CACHE_ALIAS`` token clients always read
+from the primary, unless ``ALLOW_PROCESS_LOCAL`` says a single process
+serves every request.
+
+Replicas are configured with ``DATABASE_REPLICA_URLS`` (see
+``postflow/settings.py``). For local testing, point it at a second SQLite file
+and run ``manage.py sync_replicas`` as the replication stand-in.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from postflow.caches import is_process_local
+
+DEFAULTS = {
+    # None means every alias in DATABASES other than 'default'.
+    'ALIASES': None,
+    'PIN_SECONDS': 5,
+    # Holds token clients' pins; must be shared by every worker process.
+    'CACHE_ALIAS': 'default',
+    'ALLOW_PROCESS_LOCAL': False,
+    'COOKIE_NAME': 'primary_pin',
+    'PRIMARY_APPS': ('auth', 'sessions'),
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Alias the current request reads from; None reads from the primary.
+read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_setting(name):
+    return getattr(settings, 'DATABASE_REPLICAS', {}).get(name, DEFAULTS[name])
+
+
+def replica_aliases():
+    aliases = replica_setting('ALIASES')
+    if aliases is None:
+        aliases = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+    return list(aliases)
+
+
+def pins_shared():
+    return replica_setting('ALLOW_PROCESS_LOCAL') or not is_process_local(replica_setting('CACHE_ALIAS'))
+
+
+def pin_key(user_id):
+    return f'replicas:pin:{user_id}'
+
+
+def token_user_id(request):
+    """
+    The user id claim of a valid bearer token, without touching the database.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        return None
+    return token.get(jwt_settings.USER_ID_CLAIM)
+
+
+def is_pinned(request):
+    try:
+        if float(request.COOKIES.get(replica_setting('COOKIE_NAME'), 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user_id = token_user_id(request)
+    if user_id is None:
+        return False
+    # Another process may have pinned this client where we cannot see it.
+    return not pins_shared() or caches[replica_setting('CACHE_ALIAS')].get(pin_key(user_id)) is not None
+
+
+def pin(request, response):
+    seconds = replica_setting('PIN_SECONDS')
+    response.set_cookie(
+        replica_setting('COOKIE_NAME'), f'{time.time() + seconds:.3f}',
+        max_age=seconds, httponly=True, samesite='Lax',
+    )
+    # DRF hands the user it authenticated back to the underlying request.
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        caches[replica_setting('CACHE_ALIAS')].set(pin_key(user.pk), True, seconds)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias is None or model._meta.app_label in replica_setting('PRIMARY_APPS'):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas receive their schema through replication.
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = read_alias.set(self.choose_alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        token = read_alias.set(self.choose_alias(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.process_response(request, response)
+
+    def choose_alias(self, request):
+        aliases = replica_aliases()
+        if aliases and request.method in SAFE_METHODS and not is_pinned(request):
+            return random.choice(aliases)
+        return None
+
+    def process_response(self, request, response):
+        if replica_aliases() and request.method not in SAFE_METHODS and response.status_code < 400:
+            pin(request, response)
+        return response
@@ -12,6 +12,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 from datetime import timedelta
+
+import dj_database_url
+
+from postflow.caches import cache_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,7 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'postflow.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'postflow.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -76,11 +83,39 @@ WSGI_APPLICATION = 'postflow.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DATABASE_URL configures the primary; DATABASE_REPLICA_URLS is an optional
+# comma-separated list of read replicas (see postflow/replicas.py).
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': dj_database_url.config(
+        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+        conn_max_age=int(os.environ.get('DATABASE_CONN_MAX_AGE', 0)),
+    )
+}
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{index}'] = dj_database_url.parse(
+        url.strip(),
+        conn_max_age=int(os.environ.get('DATABASE_CONN_MAX_AGE', 0)),
+        test_options={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['postflow.replicas.ReplicaRouter']
+
+# Safe-method requests read from a replica unless the client wrote within PIN_SECONDS
+DATABASE_REPLICAS = {
+    'PIN_SECONDS': 5,
+    'CACHE_ALIAS': 'default',
+    'ALLOW_PROCESS_LOCAL': os.environ.get('BLOG_SINGLE_PROCESS', '0') == '1',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# CACHE_URL (redis://host:6379/0 or memcached://host:11211) shares the cache
+# between worker processes; without it each process keeps a local-memory
+# cache, and the response cache stays off (see postflow/caches.py).
+
+CACHES = {
+    'default': cache_config(os.environ.get('CACHE_URL', '')),
 }
 
 
@@ -126,13 +161,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Session and Basic auth run after JWT on every request, and Basic hashes the
+# password each time; set API_FALLBACK_AUTH=0 to serve JWT only.
+API_FALLBACK_AUTH = os.environ.get('API_FALLBACK_AUTH', '1') == '1'
+
 # Update REST_FRAMEWORK settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
+    ) + ((
         'rest_framework.authentication.SessionAuthentication',  # Add this for browsable API
         'rest_framework.authentication.BasicAuthentication',    # Add this for testing
-    ),
+    ) if API_FALLBACK_AUTH else ()),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
@@ -174,4 +214,92 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+# Write-behind buffering for BlogPostViewSet.increment_views (see blog/counters.py)
+BLOG_VIEW_COUNTER = {
+    'FLUSH_INTERVAL': 5,
+    'MAX_PENDING': 1000,
+}
+
+# Response cache for read-heavy blog endpoints (see blog/cache.py); needs a
+# shared CACHE_URL unless BLOG_SINGLE_PROCESS=1 says one process serves them all
+BLOG_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+    'ALLOW_PROCESS_LOCAL': os.environ.get('BLOG_SINGLE_PROCESS', '0') == '1',
+}
+
+# Time-decayed view scores behind /posts/trending/ (see blog/trending.py)
+BLOG_TRENDING = {
+    'HALF_LIFE': 6 * 60 * 60,
+    'DEFAULT_LIMIT': 10,
+    'MAX_LIMIT': 100,
+}
+
+# Precomputed related-post lists (see blog/related.py); rebuild_related_posts saves the index to INDEX_PATH,
+# which every process running tasks must share
+BLOG_RELATED = {
+    'NEIGHBORS': 10,
+    'TEXT_WEIGHT': 0.5,
+    'TAG_WEIGHT': 0.5,
+    'INDEX_PATH': os.path.join(BASE_DIR, 'related_index.npz'),
+    'UPDATE_DELAY': 2,
+}
+
+# Rendered post HTML (see blog/rendering.py); run rerender_posts after bumping RENDERER_VERSION
+BLOG_RENDERING = {
+    'CACHE_TIMEOUT': 24 * 60 * 60,
+}
+
+# Change feed at /api/blog/changes/?since= (see blog/changes.py)
+BLOG_CHANGES = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+    'MAX_WAIT': 25,
+    'POLL_INTERVAL': 0.5,
+    'COMPACT_EVERY': 1000,
+}
+
+# Database-backed background tasks (see blog/tasks.py); set BLOG_TASKS_IN_PROCESS=0
+# where manage.py run_worker processes take the queue
+BLOG_TASKS = {
+    'RUN_IN_PROCESS': os.environ.get('BLOG_TASKS_IN_PROCESS', '1') == '1',
+    'IN_PROCESS_DELAY': 1,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+    'MAX_RETRY_DELAY': 60 * 60,
+    'LEASE': 5 * 60,
+    'KEEP_FINISHED': 24 * 60 * 60,
+}
+
+# Per-endpoint SQL query budgets (see blog/query_budget.py); blog.tests checks
+# every budgeted endpoint with STRICT
+BLOG_QUERY_BUDGET = {
+    'ENABLED': DEBUG,
+    'STRICT': False,
+}
+
+# Render post listings from values() rows instead of BlogPostListSerializer (see blog/rows.py)
+BLOG_FAST_LIST_SERIALIZATION = True
+
+# Serve hot read endpoints with async views (see blog/async_views.py); postflow/asgi.py turns this on
+BLOG_ASYNC_READS = os.environ.get('BLOG_ASYNC_READS', '0') == '1'
+
+# Per-request SQL/auth/serializer timings in Server-Timing headers and per-view
+# percentiles at /api/blog/request-metrics/ (see postflow/instrumentation.py)
+REQUEST_INSTRUMENTATION = {
+    'ENABLED': os.environ.get('REQUEST_INSTRUMENTATION', '0') == '1',
+    'SERVER_TIMING': True,
+    'LOG_SAMPLE_RATE': 0.01,
+}
+
+# In-process cache of users resolved from JWTs, invalidated through
+# generations in the shared cache (see accounts/authentication.py)
+ACCOUNTS_USER_CACHE = {
+    'ENABLED': True,
+    'TTL': 60,
+    'MAX_ENTRIES': 10000,
+    'CACHE_ALIAS': 'default',
+    'ALLOW_PROCESS_LOCAL': os.environ.get('BLOG_SINGLE_PROCESS', '0') == '1',
+}
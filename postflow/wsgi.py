@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'postflow.settings')
 
 application = get_wsgi_application()
+
+# Tasks queued before this process started; see blog/tasks.py.
+from blog.tasks import in_process_tasks  # noqa: E402
+
+in_process_tasks.started()